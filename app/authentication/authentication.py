@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from app.authentication.models import Member
+from app.authentication.scope import store_of
+
+TOKEN_AUTH_LOCAL_TTL = 15
+TOKEN_AUTH_SHARED_TTL = 120
+TOKEN_AUTH_MAX_ENTRIES = 10000
+# Member fields kept per token, the rest load on first access
+TOKEN_USER_FIELDS = (
+    'id', 'email', 'full_name', 'status', 'is_active', 'is_staff',
+    'is_superuser', 'is_super_admin', 'is_seller', 'is_store_admin',
+    'is_admin', 'is_business', 'is_location', 'is_tag', 'is_ecomm_user',
+    'has_full_access',
+)
+
+
+class TTLCache:
+    """A thread safe LRU whose entries expire after their own ttl."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_tokens = TTLCache(getattr(settings, "TOKEN_AUTH_MAX_ENTRIES", TOKEN_AUTH_MAX_ENTRIES))
+
+
+def shared_cache():
+    """The cache shared by all processes, set with TOKEN_AUTH_CACHE."""
+    alias = getattr(settings, "TOKEN_AUTH_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def token_cache_key(key):
+    return "auth:token:%s" % key
+
+
+def load_token_entry(key):
+    row = Token.objects.filter(key=key).values_list(
+        *["user__" + field for field in TOKEN_USER_FIELDS]).first()
+    if row is None:
+        return None
+    user = dict(zip(TOKEN_USER_FIELDS, row))
+    return {"user": user, "store": store_of(user["id"])}
+
+
+def get_token_entry(key):
+    """
+    The slim user projection of a token, from the process LRU, then the
+    shared cache, then one database query.
+    """
+    entry = local_tokens.get(key)
+    if entry is not None:
+        return entry
+    cache = shared_cache()
+    if cache is not None:
+        entry = cache.get(token_cache_key(key))
+    if entry is None:
+        entry = load_token_entry(key)
+        if entry is None:
+            return None
+        if cache is not None:
+            cache.set(token_cache_key(key), entry, getattr(
+                settings, "TOKEN_AUTH_SHARED_TTL", TOKEN_AUTH_SHARED_TTL))
+    local_tokens.set(key, entry, getattr(
+        settings, "TOKEN_AUTH_LOCAL_TTL", TOKEN_AUTH_LOCAL_TTL))
+    return entry
+
+
+def user_from_entry(entry):
+    """A Member with only the projected fields loaded and its store."""
+    fields = entry["user"]
+    # from_db wants the values in model field order
+    names = [field.attname for field in Member._meta.concrete_fields
+             if field.attname in fields]
+    user = Member.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+    user.scope_store = entry["store"]
+    return user
+
+
+def invalidate_tokens(keys):
+    """
+    Drops cached tokens once the current transaction commits. Other
+    processes drop their own copy within TOKEN_AUTH_LOCAL_TTL.
+    """
+    keys = [key for key in keys if key]
+    if not keys:
+        return
+
+    def drop():
+        cache = shared_cache()
+        for key in keys:
+            local_tokens.delete(key)
+        if cache is not None:
+            cache.delete_many([token_cache_key(key) for key in keys])
+    transaction.on_commit(drop)
+
+
+def invalidate_user_tokens(user_ids):
+    invalidate_tokens(list(Token.objects.filter(
+        user__in=user_ids).values_list('key', flat=True)))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication without the token and member join on every
+    request. Tokens are cached for a short time and dropped when the
+    token is deleted or its member or store changes.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = get_token_entry(key)
+        if entry is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user = user_from_entry(entry)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
@@ -0,0 +1,201 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Exists, Count, Sum, Q, IntegerField, FloatField
+from django.db.models.functions import Coalesce
+from fcm_django.models import FCMDevice
+
+from app.authentication.models import Member, CustomerStats, CustomerStatsChange
+from app.order.models import Order, OrderProduct, Cart, CartProduct
+from app.store.models import Payment
+from app.utilities.transactions import on_commit_once
+
+
+def wishlist_count():
+    wishlist = Member.wishlishted_products.through.objects.filter(
+        member=OuterRef('pk')
+    ).order_by().values('member').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(wishlist, output_field=IntegerField()), 0)
+
+
+def cart_count():
+    """Products in the latest cart, like Member.get_cart_count."""
+    latest_cart = Cart.objects.filter(
+        customer=OuterRef('pk')
+    ).order_by('-id').annotate(count=Count('cartProducts')).values('count')[:1]
+    return Coalesce(Subquery(latest_cart, output_field=IntegerField()), 0)
+
+
+def counted_orders():
+    """Orders Member.get_order_count counts: paid for, with all products."""
+    return Order.objects.annotate(
+        has_payment=Exists(Payment.objects.filter(order=OuterRef('pk'))),
+        has_lines=Exists(OrderProduct.objects.filter(order=OuterRef('pk'))),
+        has_missing_product=Exists(OrderProduct.objects.filter(
+            order=OuterRef('pk'), product__isnull=True)),
+    ).filter(has_payment=True, has_lines=True, has_missing_product=False)
+
+
+def order_count():
+    orders = counted_orders().filter(
+        customer=OuterRef('pk')
+    ).order_by().values('customer').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(orders, output_field=IntegerField()), 0)
+
+
+def total_purchase():
+    """Sum of the stored totals of the orders with a successful payment."""
+    orders = Order.objects.annotate(
+        is_paid=Exists(Payment.objects.filter(order=OuterRef('pk'), status='SU'))
+    ).filter(
+        is_paid=True, customer=OuterRef('pk')
+    ).order_by().values('customer').annotate(total=Sum('totalPrice')).values('total')
+    return Coalesce(Subquery(orders, output_field=FloatField()), 0.0)
+
+
+# sort_by prefix: (annotation name, expression factory)
+CUSTOMER_SORTS = {
+    "wishlist": ("sort_wishlist_count", wishlist_count),
+    "cart": ("sort_cart_count", cart_count),
+    "orders": ("sort_order_count", order_count),
+    "purchase": ("sort_total_purchase", total_purchase),
+}
+
+
+def sort_customers(qs, sort_by):
+    """
+    Orders customers by wishlist, cart, orders or purchase with a
+    correlated subquery, so sorting and paging stay in the database.
+    sort_by is e.g. "orders_high_to_low".
+    """
+    name, expression = CUSTOMER_SORTS[sort_by.split("_")[0]]
+    ordering = "-" + name if sort_by.endswith("high_to_low") else name
+    return qs.annotate(**{name: expression()}).order_by(ordering, '-created_at', 'id')
+
+
+def paid_orders(member_ids):
+    """Orders counted by the customer list: paid, with all products."""
+    return Order.objects.filter(customer__in=member_ids).annotate(
+        is_paid=Exists(Payment.objects.filter(order=OuterRef('pk'), status='SU')),
+        has_lines=Exists(OrderProduct.objects.filter(order=OuterRef('pk'))),
+        has_missing_product=Exists(OrderProduct.objects.filter(
+            order=OuterRef('pk'), product__isnull=True)),
+    )
+
+
+def compute_customer_stats(member_ids):
+    """
+    Stats of many customers with one grouped query per figure, as
+    {member id: CustomerStats} ready to be saved.
+    """
+    stats = {member_id: CustomerStats(member_id=member_id) for member_id in member_ids}
+
+    for member_id, count in Member.wishlishted_products.through.objects.filter(
+            member__in=member_ids).values_list('member').annotate(
+            count=Count('id')).order_by():
+        stats[member_id].wishlist_count = count
+
+    latest_carts = dict(Cart.objects.filter(
+        customer__in=member_ids
+    ).order_by('customer', '-id').distinct('customer').values_list('id', 'customer'))
+    for cart_id, count in CartProduct.objects.filter(
+            cart__in=latest_carts.keys()).values_list('cart').annotate(
+            count=Count('id')).order_by():
+        stats[latest_carts[cart_id]].cart_items = count
+
+    for member_id, count, total in paid_orders(member_ids).filter(
+            is_paid=True
+    ).values_list('customer').annotate(
+        count=Count('id', filter=Q(has_lines=True, has_missing_product=False)),
+        total=Sum('totalPrice')).order_by():
+        stats[member_id].paid_order_count = count
+        stats[member_id].total_purchase = round(total or 0.0, 3)
+
+    for member_id, created_at, area_id in Order.objects.filter(
+            customer__in=member_ids
+    ).order_by('customer', '-id').distinct('customer').values_list(
+            'customer', 'created_at', 'address__area'):
+        stats[member_id].last_order_at = created_at
+        stats[member_id].last_area_id = area_id
+
+    for member_id, area_id, area_name in Order.objects.filter(
+            customer__in=member_ids, address__area__name__isnull=False
+    ).values_list('customer', 'address__area__id', 'address__area__name').distinct():
+        stats[member_id].shipping_areas.append(
+            {"address__area__id": area_id, "address__area__name": area_name})
+
+    for member_id, device_type in FCMDevice.objects.filter(
+            user__in=member_ids, active=True
+    ).values_list('user', 'type').distinct().order_by('user', 'type'):
+        stats[member_id].device_types.append(device_type)
+    return stats
+
+
+@transaction.atomic
+def refresh_customer_stats(member_ids):
+    # Locking the members serializes refreshes of the same customers
+    member_ids = list(Member.objects.select_for_update().filter(
+        pk__in=member_ids).order_by('id').values_list('id', flat=True))
+    if not member_ids:
+        return
+    stats = compute_customer_stats(member_ids)
+    CustomerStats.objects.filter(member__in=member_ids).delete()
+    CustomerStats.objects.bulk_create(stats.values())
+
+
+def queue_customer_stats(member_ids):
+    """Records customers whose stats the next refresh_changed_customer_stats rebuilds."""
+    CustomerStatsChange.objects.create(member_ids=sorted(member_ids))
+
+
+def mark_customers_changed(member_ids):
+    """
+    Queues the customers for the scheduled refresh_customer_stats command
+    once the transaction commits, so their stats are not rebuilt on the
+    request.
+    """
+    on_commit_once("customer_stats", member_ids, queue_customer_stats)
+
+
+@transaction.atomic
+def refresh_queued_customer_stats(batch_size=100):
+    """
+    Rebuilds the stats of the customers in the oldest queued changes and
+    drops those changes. Rows being refreshed by another run are skipped.
+    Returns the number of changes handled.
+    """
+    changes = list(CustomerStatsChange.objects.select_for_update(
+        skip_locked=True).order_by('id').values_list('id', 'member_ids')[:batch_size])
+    if not changes:
+        return 0
+    member_ids = set()
+    for change_id, change_member_ids in changes:
+        member_ids.update(change_member_ids)
+    refresh_customer_stats(member_ids)
+    CustomerStatsChange.objects.filter(
+        pk__in=[change_id for change_id, change_member_ids in changes]).delete()
+    return len(changes)
+
+
+def refresh_changed_customer_stats(batch_size=100):
+    refreshed = 0
+    while True:
+        handled = refresh_queued_customer_stats(batch_size=batch_size)
+        if not handled:
+            return refreshed
+        refreshed += handled
+
+
+def rebuild_customer_stats(batch_size=1000):
+    customers = Member.objects.filter(
+        is_business=False, is_location=False,
+        is_admin=False, is_tag=False,
+        is_super_admin=False, is_seller=False)
+    last_id = 0
+    rebuilt = 0
+    while True:
+        member_ids = list(customers.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True)[:batch_size])
+        if not member_ids:
+            return rebuilt
+        refresh_customer_stats(member_ids)
+        last_id = member_ids[-1]
+        rebuilt += len(member_ids)
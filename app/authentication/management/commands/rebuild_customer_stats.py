@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.authentication.customers import rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the stats shown on the customer list for every customer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_customer_stats(batch_size=options["batch_size"])
+        self.stdout.write("Rebuilt stats of %s customers" % rebuilt)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.authentication.customers import refresh_changed_customer_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the stats of the customers changed since the last run. Run it on a schedule"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        refreshed = refresh_changed_customer_stats(batch_size=options["batch_size"])
+        self.stdout.write("Refreshed %s queued customer changes" % refreshed)
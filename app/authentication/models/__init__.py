@@ -1 +1,2 @@
 from .member import Member
+from .stats import CustomerStats, CustomerStatsChange
@@ -0,0 +1,41 @@
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.db import models
+from django.db.models import CASCADE
+
+
+class CustomerStats(models.Model):
+    member = models.OneToOneField(
+        'authentication.Member', related_name='stats',
+        on_delete=CASCADE)
+    wishlist_count = models.PositiveIntegerField(default=0)
+    cart_items = models.PositiveIntegerField(default=0)
+    paid_order_count = models.PositiveIntegerField(default=0)
+    total_purchase = models.FloatField(default=0.0)
+    last_order_at = models.DateTimeField(blank=True, null=True)
+    last_area = models.ForeignKey(
+        'store.City', related_name='+',
+        blank=True, null=True, on_delete=models.SET_NULL)
+    shipping_areas = JSONField(default=list, blank=True)
+    device_types = ArrayField(
+        models.CharField(max_length=10), default=list, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('member',)
+        verbose_name_plural = 'customer stats'
+
+    def __str__(self):
+        return str(self.member_id)
+
+
+class CustomerStatsChange(models.Model):
+    """Customers changed together, whose stats the scheduled refresh rebuilds."""
+    member_ids = ArrayField(models.IntegerField(), default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('id',)
+
+    def __str__(self):
+        return ' - '.join([str(self.id), str(self.created_at)])
@@ -5,7 +5,6 @@ from django.contrib.auth import authenticate
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.validators import validate_email
 from django.db.models import Q, Case, When
-f
 from django.utils.timezone import now
 from fcm_django.models import FCMDevice
 from rest_framework import  status
@@ -14,6 +13,8 @@ from rest_framework.generics import ListAPIView, RetrieveAPIView, get_object_or_
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from app.authentication.authentication import invalidate_user_tokens
+from app.authentication.customers import CUSTOMER_SORTS, sort_customers
 from app.authentication.models import Member
 from app.authentication.permissions import IsSuperAdminOrSeller, IsSuperAdmin
 from app.authentication.serializers import GetSellerSerializer, CustomerListSerializer, \
@@ -22,6 +23,7 @@ from app.authentication.serializers import GetSellerSerializer, CustomerListSeri
     EditSuperAdminSerializer
 
 from app.product.utils import json_list
+from app.store.cities import shipping_areas_payload
 from app.store.models import Address, City, SellerSubAdmins, Store
 from app.utilities.api import validation_error
 from app.utilities.utils import is_email_valid
@@ -235,7 +237,7 @@ class CustomerList(ListAPIView):
             is_business=False, is_location=False,
             is_admin=False, is_tag=False,
             is_super_admin=False, is_seller=False
-        ).order_by('-created_at')
+        ).select_related('stats__last_area').order_by('-created_at')
 
         if customer_status == "IN":
             qs = qs.filter(status='IN')
@@ -271,41 +273,8 @@ class CustomerList(ListAPIView):
             if sort_by == "old_first":
                 qs = qs.order_by('created_at')
 
-            if sort_by == "wishlist_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_wishlist_count(),
-                            reverse=False)
-            if sort_by == "wishlist_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_wishlist_count(),
-                            reverse=True)
-
-            if sort_by == "cart_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_cart_count(),
-                            reverse=False)
-            if sort_by == "cart_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_cart_count(),
-                            reverse=True)
-
-            if sort_by == "orders_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_order_count(),
-                            reverse=False)
-            if sort_by == "orders_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_order_count(),
-                            reverse=True)
-
-            if sort_by == "purchase_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_total_purchase_float(),
-                            reverse=False)
-            if sort_by == "purchase_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_total_purchase_float(),
-                            reverse=True)
+            if sort_by.split("_")[0] in CUSTOMER_SORTS:
+                qs = sort_customers(qs, sort_by)
         return qs
 
     def post(self, request, *args, **kwargs):
@@ -324,6 +293,7 @@ class ChangeCustomerStatus(APIView):
                 Member.objects.filter(
                     pk__in=json_list(customer_ids)[1]
                 ).update(status=customer_status)
+                invalidate_user_tokens(json_list(customer_ids)[1])
                 return Response({"detail": f"Successfully added customers to {customer_status}"})
             return Response({"error": "Please select customer status"},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -470,6 +440,17 @@ class ShippingAreaList(ListAPIView):
         qs = City.objects.all()
         return qs
 
+    def list(self, request, *args, **kwargs):
+        version, areas = shipping_areas_payload()
+        quoted_etag = '"%s"' % version
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if quoted_etag in [tag.strip().lstrip("W/") for tag in if_none_match.split(",")]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(areas)
+        response["ETag"] = quoted_etag
+        return response
+
     def post(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -0,0 +1,98 @@
+from django.utils.functional import cached_property
+
+SUPER_ADMIN = "super_admin"
+SELLER = "seller"
+SUB_ADMIN = "sub_admin"
+CUSTOMER = "customer"
+
+
+def store_of(user_id):
+    """
+    (store id, role) of the store a member works on: the latest store it
+    is a sub admin of, else its own store.
+    """
+    from app.store.models import SellerSubAdmins, Store
+
+    store_id = SellerSubAdmins.objects.filter(
+        member=user_id).order_by('-id').values_list('store', flat=True).first()
+    if store_id is not None:
+        return store_id, SUB_ADMIN
+    store_id = Store.objects.filter(
+        member=user_id).values_list('id', flat=True).first()
+    return store_id, SELLER
+
+
+class SellerScope:
+    """What the request user acts for: role, store id and permissions."""
+
+    def __init__(self, user, role, store_id):
+        self.user = user
+        self.role = role
+        self.store_id = store_id
+
+    @property
+    def is_super_admin(self):
+        return self.role == SUPER_ADMIN
+
+    @property
+    def is_sub_admin(self):
+        return self.role == SUB_ADMIN
+
+    @cached_property
+    def permissions(self):
+        """{module: EcommMemberPermission} of the user."""
+        return {perm.module: perm
+                for perm in self.user.ecomm_member_permissions_for.all()}
+
+    def filter(self, qs, lookup="store"):
+        """
+        Limits `qs` to the store, `lookup` being the path to the store
+        field. Nothing matches when the user has no store.
+        """
+        if self.store_id is None:
+            return qs.none()
+        return qs.filter(**{lookup: self.store_id})
+
+
+def get_seller_scope(user):
+    """
+    The scope of a user, resolved on first use and kept on the user
+    object, which lives as long as the request.
+    """
+    scope = getattr(user, "_seller_scope", None)
+    if scope is not None:
+        return scope
+
+    if not user.is_authenticated:
+        scope = SellerScope(user, None, None)
+    elif user.is_super_admin:
+        scope = SellerScope(user, SUPER_ADMIN, None)
+    else:
+        # Set by CachedTokenAuthentication, saves the lookup
+        store_id, role = getattr(user, "scope_store", None) or store_of(user.id)
+        if store_id is None and not user.is_seller:
+            role = CUSTOMER
+        scope = SellerScope(user, role, store_id)
+    user._seller_scope = scope
+    return scope
+
+
+def context_scope(context):
+    """The scope passed in a serializer context, or of its user."""
+    scope = context.get("seller_scope")
+    if scope is None:
+        scope = get_seller_scope(context.get("user"))
+    return scope
+
+
+class SellerScopeMixin:
+    """Resolves the seller scope once per request for a view."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        request.seller_scope = get_seller_scope(request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["seller_scope"] = get_seller_scope(self.request.user)
+        return context
@@ -3,7 +3,6 @@ from django.contrib.auth import authenticate
 from django.contrib.auth.models import Permission
 from django.contrib.humanize.templatetags import humanize
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.images import get_image_dimensions
 from django.core.validators import FileExtensionValidator
 from django.db.models import Sum, F, Q, FloatField
 from django.shortcuts import get_object_or_404
@@ -18,11 +17,13 @@ from rest_framework.response import Response
 from app.authentication.mixins import SetCustomErrorMessagesMixin
 from app.authentication.models import Member
 from app.authentication.models.member import EcommMemberPermission
+from app.authentication.scope import get_seller_scope
 from app.order.models import Order, CartProduct
 from app.product.models import Category, EcommProduct, VariantValues
 from app.product.serializers import SellerInfoSerializer, BrandSerializer, CategorySerializer, \
     CategoryCommissionSerializer
 from app.store.models import Store, Address, City, Country, SocialMediaURL, Commission, Inventory, InventoryProduct
+from app.utilities.images import get_image_dimensions
 from app.utilities.helpers import get_perms_for_super_admin, convert_date_time_to_kuwait_string
 from app.utilities.utils import is_email_valid
 
@@ -100,16 +101,8 @@ class GetSellerSerializer(serializers.ModelSerializer):
 
     def get_unseen_orders_count(self, obj):
         if obj.is_seller:
-            sub_admins = obj.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                qs = Order.objects.filter(
-                    payments__isnull=False,
-                    orderProducts__product__store=sub_admin.store).distinct()
-            else:
-                qs = Order.objects.filter(
-                    payments__isnull=False,
-                    orderProducts__product__store__member=obj).distinct()
+            qs = get_seller_scope(obj).filter(Order.objects.filter(
+                payments__isnull=False), "orderProducts__product__store").distinct()
         else:
             qs = Order.objects.filter(payments__isnull=False).distinct()
 
@@ -881,13 +874,17 @@ class SellerDetailSerializer(serializers.ModelSerializer):
                 obj.banners, many=True).data
         return None
 
-    def get_sales(self, obj):
-        orders_sales_price = Order.objects.filter(
-            payments__status='SU',
-            orderProducts__product__store=obj
-        ).aggregate(price=Sum(F('totalPrice'))).get(
-            'price')
+    def get_seller_earnings(self, obj):
+        # Sales, net sales and commission share one computation per seller
+        if not hasattr(self, "_seller_earnings"):
+            self._seller_earnings = {}
+        if obj.id not in self._seller_earnings:
+            from app.store.earnings import seller_earnings
+            self._seller_earnings.update(seller_earnings([obj.id]))
+        return self._seller_earnings[obj.id]
 
+    def get_sales(self, obj):
+        orders_sales_price = self.get_seller_earnings(obj)["sales"]
         if orders_sales_price:
             return "{0:.3f}".format(orders_sales_price)
         return 0
@@ -899,51 +896,13 @@ class SellerDetailSerializer(serializers.ModelSerializer):
         return orders.count()
 
     def get_net_sales(self, obj):
-        sales = obj.get_sales_float()
-        total_commission = 0
-
-        if obj.commission.exists():
-            commission = obj.commission.all().values(
-                'percentage', 'category__id').order_by(
-                'category__id').distinct('category__id')
-            for c in commission:
-                category_id = c.get('category__id')
-                percentage = c.get('percentage')
-                orders = Order.objects.filter(
-                    orderProducts__product__store=obj,
-                    orderProducts__product__category_id=category_id
-                )
-                cat_sales_price = 0
-                for order in orders:
-                    cat_sales_price += order.get_totalPrice_float()
-                if cat_sales_price > 0:
-                    commission_per_cat = cat_sales_price - (
-                            cat_sales_price * percentage) / 100
-                    total_commission += commission_per_cat
-
-        return round(sales - total_commission, ndigits=3)
+        sales = self.get_seller_earnings(obj)["sales"]
+        return round(sales - self.get_commission(obj), ndigits=3)
 
     def get_commission(self, obj):
         total_commission = 0
-        if obj.commission.exists():
-            commission = obj.commission.all().values(
-                'percentage', 'category__id').order_by(
-                'category__id').distinct('category__id')
-            total_commission = 0
-            for c in commission:
-                category_id = c.get('category__id')
-                percentage = c.get('percentage')
-                orders = Order.objects.filter(
-                    orderProducts__product__store=obj,
-                    orderProducts__product__category_id=category_id
-                )
-                cat_sales_price = 0
-                for order in orders:
-                    cat_sales_price += order.get_totalPrice_float()
-                if cat_sales_price > 0:
-                    commission_per_cat = cat_sales_price - (
-                            cat_sales_price * percentage) / 100
-                    total_commission += commission_per_cat
+        for category in self.get_seller_earnings(obj)["categories"].values():
+            total_commission += category["sales"] - category["earnings"]
         return round(total_commission, ndigits=3)
 
     def get_pickup_charges(self, obj):
@@ -1008,105 +967,18 @@ class SellerListSerializer(serializers.ModelSerializer):
                 many=True).data
         return None
 
+    def get_seller_earnings(self, obj):
+        earnings = self.context.get("seller_earnings")
+        if earnings is None or obj.id not in earnings:
+            from app.store.earnings import seller_earnings
+            earnings = seller_earnings([obj.id])
+        return earnings[obj.id]
+
     def get_sales(self, obj):
-        orders = Order.objects.filter(
-            payments__status='SU',
-            orderProducts__product__store=obj
-        )
-        sales_total = 0.000
-        for order in orders:
-            sub_total = order.orderProducts.filter(
-                product__store=obj
-            ).aggregate(
-                sub_total=Sum(F('price') * F('quantity'),
-                              output_field=FloatField())).get('sub_total')
-            if sub_total:
-                sales_total += sub_total
-        return sales_total
-
-        # orders_sales_price = Order.objects.filter(
-        #     payments__status='SU',
-        #     orderProducts__product__store=obj
-        # ).aggregate(price=Sum(F('totalPrice'))).get(
-        #     'price')
-        #
-        # if orders_sales_price:
-        #     return orders_sales_price
-        # return 0
+        return self.get_seller_earnings(obj)["sales"]
 
     def get_earnings(self, obj):
-        sales = self.get_sales(obj)
-        commission_total = 0.000
-        if obj.commission.exists():
-            commission = obj.commission.all().values(
-                'percentage', 'category__id').order_by(
-                'category__id').distinct('category__id')
-            total_commission = 0
-            # print("commission")
-            # print(commission)
-            for c in commission:
-                category_id = c.get('category__id')
-                percentage = c.get('percentage')
-                cat_sales_price = Order.objects.filter(
-                    payments__status='SU',
-                    orderProducts__product__store=obj,
-                    orderProducts__product__category_id=category_id
-                ).aggregate(price=Sum(F('totalPrice'))).get('price')
-
-                # print("cat_sales_price")
-                # print(cat_sales_price)
-                if cat_sales_price:
-                    commission_per_cat = cat_sales_price - (
-                            cat_sales_price * percentage) / 100
-                    total_commission += commission_per_cat
-                #
-                # orders = Order.objects.filter(
-                #     payments__status='SU',
-                #     orderProducts__product__store=obj,
-                #     orderProducts__product__category_id=category_id
-                # )
-                # for order in orders:
-                #     sub_total = order.orderProducts.filter(
-                #         product__category_id=category_id
-                #     ).aggregate(
-                #         sub_total=Sum(F('price') * F('quantity'),
-                #                       output_field=FloatField())).get('sub_total')
-                #     if sub_total:
-            return sales - total_commission
-        return 0
-        # if obj.commission.exists():
-        #     commission = obj.commission.all().values(
-        #         'percentage', 'category__id').order_by(
-        #         'category__id').distinct('category__id')
-        #     print("commission")
-        #     print(commission)
-        #     for c in commission:
-        #         category_id = c.get('category__id')
-        #         percentage = c.get('percentage')
-        #         descendant_ids = Category.objects.descendants(
-        #             get_object_or_404(Category, pk=category_id)).values_list(
-        #             'id', flat=True).distinct()
-        #         print("descendant_ids")
-        #         print(descendant_ids)
-        #         orders = Order.objects.filter(
-        #             payments__status='SU',
-        #             orderProducts__product__store=obj,
-        #             orderProducts__product__category__pk__in=descendant_ids
-        #         )
-        #         print("orders")
-        #         print(orders)
-        #         sales_total = 0.000
-        #         for order in orders:
-        #             sub_total = order.orderProducts.filter(
-        #                 product__category__pk__in=descendant_ids
-        #             ).aggregate(
-        #                 sub_total=Sum(F('price') * F('quantity'),
-        #                               output_field=FloatField())).get('sub_total')
-        #             if sub_total:
-        #                 sales_total += sub_total
-        #                 commission_total += (sales_total * percentage) / 100
-        #
-        # return commission_total
+        return self.get_seller_earnings(obj)["earnings"]
 
 
 class SellerListCollectionSerializer(serializers.ModelSerializer):
@@ -1181,18 +1053,20 @@ class InventoryListSerializer(serializers.ModelSerializer):
 
     def get_prod_image(self, obj):
         if obj.product:
-            product = obj.product
-            if product.medias.exists():
-                return product.medias.first().file_data.url
+            medias = obj.product.medias.all()
+            if medias:
+                return medias[0].file_data.url
             return None
         return None
 
     def get_variant_values(self, obj):
         lang_code = self.context.get("lang_code")
 
-        var_vals = VariantValues.objects.filter(
-            pk__in=obj.product.variant_value_ids()
-        )
+        var_vals = sorted(
+            set([prod_var_val.variant_value
+                 for prod_var_val in obj.product.productVariantValue.all()
+                 if prod_var_val.variant_value]),
+            key=lambda var_val: -var_val.id)
         return VariantValuesMinSerializer(
             var_vals, many=True,
             context={'product': obj.product,
@@ -1209,25 +1083,22 @@ class InventoryListSerializer(serializers.ModelSerializer):
             return SellerInfoSerializer(obj.product.store).data
         return None
 
-    def get_stock_status(self, obj):
-        inv_prods = InventoryProduct.objects.filter(
+    def inventory_quantity(self, obj):
+        # Quantity of the latest row of this product in the inventory,
+        # annotated by InventoryList so no query runs per row.
+        if hasattr(obj, "latest_quantity"):
+            return obj.latest_quantity
+        return InventoryProduct.objects.filter(
             product=obj.product, inventory=obj.inventory
-        )
-        inv_prod = inv_prods.latest('id')
-        if inv_prod:
-            if inv_prod.quantity > 0:
-                return "In Stock"
-            return "Out of Stock"
+        ).latest('id').quantity
+
+    def get_stock_status(self, obj):
+        if self.inventory_quantity(obj) > 0:
+            return "In Stock"
         return "Out of Stock"
 
     def get_available_qty(self, obj):
-        inv_prods = InventoryProduct.objects.filter(
-            product=obj.product, inventory=obj.inventory
-        )
-        inv_prod = inv_prods.latest('id')
-        if inv_prod:
-            return inv_prod.quantity
-        return 0
+        return self.inventory_quantity(obj)
 
 
 class CustomerListSerializer(serializers.ModelSerializer):
@@ -1256,7 +1127,17 @@ class CustomerListSerializer(serializers.ModelSerializer):
     def get_status(self, obj):
         return obj.get_status_display()
 
+    def get_stats(self, obj):
+        """The maintained CustomerStats row, None until it is built."""
+        try:
+            return obj.stats
+        except ObjectDoesNotExist:
+            return None
+
     def get_shipping_areas(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.shipping_areas if stats.last_order_at else ""
         if not obj.orders.exists():
             return ""
         shipping_areas = obj.orders.filter(
@@ -1281,6 +1162,9 @@ class CustomerListSerializer(serializers.ModelSerializer):
         return ""
 
     def get_shipping_area(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.last_area.name if stats.last_area else ""
         if obj.orders.exists():
             latest_order = obj.orders.latest('id')
             if latest_order.address:
@@ -1290,9 +1174,15 @@ class CustomerListSerializer(serializers.ModelSerializer):
         return ""
 
     def get_wishlist_count(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.wishlist_count
         return obj.wishlishted_products.all().count()
 
     def get_cart_count(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.cart_items
         if obj.cart.exists():
             cart_prods = CartProduct.objects.filter(
                 cart=obj.cart.latest('id')
@@ -1301,6 +1191,9 @@ class CustomerListSerializer(serializers.ModelSerializer):
         return 0
 
     def get_order_count(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.paid_order_count
         orders = obj.orders.filter(payments__status='SU')
         if orders.exists():
             order_prod_filter = filter(
@@ -1310,6 +1203,9 @@ class CustomerListSerializer(serializers.ModelSerializer):
         return 0
 
     def get_total_purchase(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return "{0:.3f}".format(stats.total_purchase)
         orders = obj.orders.filter(payments__status='SU')
         total_sum = sum(order.get_totalPrice_float()
                         for order in orders if order.get_totalPrice_float())
@@ -1317,6 +1213,9 @@ class CustomerListSerializer(serializers.ModelSerializer):
         return "{0:.3f}".format(rounded_sum)
 
     def get_recent_order(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.last_order_at or ""
         if obj.orders.exists():
             latest_order = obj.orders.latest('id')
             if latest_order.created_at:
@@ -1328,6 +1227,9 @@ class CustomerListSerializer(serializers.ModelSerializer):
         return ""
 
     def get_device_types(self, obj):
+        stats = self.get_stats(obj)
+        if stats is not None:
+            return stats.device_types
         return FCMDevice.objects.filter(
             user=obj, active=True
         ).order_by('type').distinct('type').values_list(
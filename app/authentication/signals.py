@@ -1,10 +1,124 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from fcm_django.models import FCMDevice
 from rest_framework.authtoken.models import Token
 
+from app.authentication.authentication import invalidate_tokens, invalidate_user_tokens
+from app.authentication.customers import mark_customers_changed
+from app.authentication.models import Member
+from app.order.models import Order, OrderProduct, Cart, CartProduct
+from app.store.models import Payment, SellerSubAdmins, Store
+
+# Fields the customer stats are computed from; saves changing none of
+# them, like the status updates of the order getters, queue nothing.
+STATS_FIELDS = {
+    Order: ('customer', 'address', 'totalPrice'),
+    OrderProduct: ('order', 'product'),
+    Payment: ('order', 'status'),
+}
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+    else:
+        # Password, status and flags are cached with the token
+        invalidate_user_tokens([instance.id])
+
+
+@receiver(post_delete, sender=Token)
+def auth_token_deleted(sender, instance=None, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=SellerSubAdmins)
+@receiver(post_delete, sender=SellerSubAdmins)
+@receiver(post_save, sender=Store)
+def auth_store_changed(sender, instance=None, **kwargs):
+    invalidate_user_tokens([instance.member_id])
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=OrderProduct)
+@receiver(pre_save, sender=Payment)
+def check_customer_stats_changed(sender, instance=None, update_fields=None, **kwargs):
+    fields = STATS_FIELDS[sender]
+    instance._stats_changed = True
+    instance._stats_previous = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        instance._stats_changed = False
+        return
+    attnames = [sender._meta.get_field(name).attname for name in fields]
+    stored = sender.objects.filter(pk=instance.pk).values_list(*attnames).first()
+    instance._stats_changed = stored != tuple(
+        [getattr(instance, attname) for attname in attnames])
+    # The stats of the customer or order the row is moved away from change too
+    instance._stats_previous = stored[0] if stored else None
+
+
+@receiver(post_save, sender=Order)
+def customer_order_saved(sender, instance=None, **kwargs):
+    if getattr(instance, "_stats_changed", True):
+        mark_customers_changed([
+            instance.customer_id, getattr(instance, "_stats_previous", None)])
+
+
+@receiver(post_delete, sender=Order)
+def customer_order_deleted(sender, instance=None, **kwargs):
+    mark_customers_changed([instance.customer_id])
+
+
+@receiver(post_save, sender=OrderProduct)
+@receiver(post_save, sender=Payment)
+def customer_order_line_saved(sender, instance=None, **kwargs):
+    if getattr(instance, "_stats_changed", True):
+        order_ids = [instance.order_id, getattr(instance, "_stats_previous", None)]
+        mark_customers_changed(Order.objects.filter(
+            pk__in=[order_id for order_id in order_ids if order_id]
+        ).values_list('customer', flat=True))
+
+
+@receiver(post_delete, sender=OrderProduct)
+@receiver(post_delete, sender=Payment)
+def customer_order_line_deleted(sender, instance=None, **kwargs):
+    mark_customers_changed(Order.objects.filter(
+        pk=instance.order_id).values_list('customer', flat=True))
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def customer_cart_changed(sender, instance=None, **kwargs):
+    mark_customers_changed([instance.customer_id])
+
+
+@receiver(post_save, sender=CartProduct)
+@receiver(post_delete, sender=CartProduct)
+def customer_cart_product_changed(sender, instance=None, **kwargs):
+    mark_customers_changed(Cart.objects.filter(
+        pk=instance.cart_id).values_list('customer', flat=True))
+
+
+@receiver(m2m_changed, sender=Member.wishlishted_products.through)
+def customer_wishlist_changed(sender, instance=None, action=None, reverse=False,
+                              pk_set=None, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            mark_customers_changed([instance.id])
+    elif action == "pre_clear":
+        # Clearing a product's wishlisters sends no pk_set
+        instance._cleared_wishlisters = list(
+            instance.wishlishted_products.values_list('id', flat=True))
+    elif action == "post_clear":
+        mark_customers_changed(getattr(instance, "_cleared_wishlisters", []))
+    elif action.startswith("post_") and pk_set:
+        mark_customers_changed(pk_set)
+
+
+@receiver(post_save, sender=FCMDevice)
+@receiver(post_delete, sender=FCMDevice)
+def customer_device_changed(sender, instance=None, **kwargs):
+    mark_customers_changed([instance.user_id])
@@ -0,0 +1,119 @@
+from datetime import timedelta
+
+from django.db.models import Q, Count, F, Exists, OuterRef, Subquery, IntegerField, CharField, \
+    Case, When, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from app.authentication.scope import get_seller_scope
+from app.order.models import Order, OrderProduct
+from app.product.utils import json_list
+from app.store.models import Payment
+
+
+def line_count(**filters):
+    return Coalesce(Subquery(OrderProduct.objects.filter(
+        order=OuterRef('pk'), **filters).order_by().values('order').annotate(
+        count=Count('id')).values('count'), output_field=IntegerField()), Value(0))
+
+
+def with_payment_status(qs):
+    """Annotates Order.get_payment_status as payment_status_value."""
+    return qs.annotate(
+        is_paid=Exists(Payment.objects.filter(order=OuterRef('pk'), status='SU')),
+        line_count=line_count(),
+        cancelled_line_count=line_count(status='CA'),
+    ).annotate(payment_status_value=Case(
+        When(is_paid=False, then=Value("Failed")),
+        When(cancelled_line_count=F('line_count'), then=Value("Refunded")),
+        When(cancelled_line_count__gt=0, then=Value("Partially Refunded")),
+        default=Value("Paid"), output_field=CharField()))
+
+
+def search_orders(qs, search_string):
+    for qstring in search_string.split(" "):
+        qs = qs.filter(
+            Q(pk__icontains=qstring) |
+            Q(customer__full_name__icontains=qstring) |
+            Q(customer__first_name__icontains=qstring) |
+            Q(customer__last_name__icontains=qstring)
+        ).order_by('id').distinct()
+    return qs
+
+
+def filter_order_list(user, search_string="", sort_by="", seller_ids="",
+                      order_status="", payment_status="", days=None,
+                      from_date=None, to_date=None, customer_id=""):
+    if user is not None and user.is_seller:
+        qs = get_seller_scope(user).filter(Order.objects.filter(
+            payments__isnull=False), "orderProducts__product__store").distinct()
+    else:
+        qs = Order.objects.filter(payments__isnull=False).distinct()
+
+    if customer_id != "":
+        qs = qs.filter(customer__pk=customer_id).distinct()
+
+    # Order.order_prods_has_prod: has lines and every line has a product
+    qs = qs.annotate(
+        has_lines=Exists(OrderProduct.objects.filter(order=OuterRef('pk'))),
+        has_line_without_product=Exists(OrderProduct.objects.filter(
+            order=OuterRef('pk'), product__isnull=True)),
+    ).filter(has_lines=True, has_line_without_product=False)
+
+    if seller_ids != "" and json_list(seller_ids)[0]:
+        qs = qs.filter(
+            orderProducts__product__store__pk__in=json_list(seller_ids)[1]
+        ).distinct()
+
+    if order_status != "" or payment_status != "":
+        qs = with_payment_status(qs)
+
+    if order_status != "":
+        qs = qs.filter(orderProducts__status=order_status).exclude(
+            payment_status_value="Failed")
+
+    if payment_status != "":
+        qs = qs.filter(payment_status_value=payment_status)
+
+    if days == 0 or days:
+        date_selected = now() - timedelta(days=int(days))
+        qs = qs.filter(created_at__date__gte=date_selected.date())
+
+    if from_date and to_date:
+        qs = qs.filter(
+            created_at__date__gte=from_date,
+            created_at__date__lte=to_date)
+
+    if search_string != "":
+        qs = search_orders(qs, search_string)
+
+    if sort_by != "":
+        if sort_by == "new_first":
+            qs = qs.order_by('-created_at')
+        if sort_by == "old_first":
+            qs = qs.order_by('created_at')
+
+        if sort_by == "order_no_asc":
+            qs = qs.order_by('pk')
+        if sort_by == "order_no_desc":
+            qs = qs.order_by('-pk')
+
+        if sort_by == "cust_name_a_to_z":
+            qs = qs.order_by('customer__full_name')
+        if sort_by == "cust_name_z_to_a":
+            qs = qs.order_by('-customer__full_name')
+
+        # The stored total, kept by the order totals getters
+        if sort_by == "total_price_low_to_high":
+            qs = qs.order_by('totalPrice')
+        if sort_by == "total_price_high_to_low":
+            qs = qs.order_by('-totalPrice')
+
+        if sort_by == "items_low_to_high":
+            qs = qs.annotate(item_count=Count(F('orderProducts'))).order_by(
+                'item_count').distinct()
+        if sort_by == "items_high_to_low":
+            qs = qs.annotate(item_count=Count(F('orderProducts'))).order_by(
+                '-item_count').distinct()
+
+    return qs
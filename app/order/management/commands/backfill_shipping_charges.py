@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from app.order.models import Order
+
+
+class Command(BaseCommand):
+    help = ("Stores settings.SHIPPING_CHARGE on the orders created before the "
+            "given time without a charge, the charge their totals were worked out with")
+
+    def add_arguments(self, parser):
+        parser.add_argument("created_before", help="ISO date time, e.g. 2019-06-01T00:00:00Z")
+
+    def handle(self, *args, **options):
+        created_before = parse_datetime(options["created_before"])
+        if created_before is None:
+            self.stderr.write("Invalid date time %s" % options["created_before"])
+            return
+        count = Order.objects.filter(
+            created_at__lt=created_before, shipping_charge__isnull=True
+        ).update(shipping_charge=settings.SHIPPING_CHARGE)
+        self.stdout.write("Stored the shipping charge of %s orders" % count)
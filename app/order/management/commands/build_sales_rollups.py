@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from app.order.rollups import build_daily_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Builds the daily sales rollups for orders changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true", dest="full",
+            help="Drop and rebuild every rollup row")
+
+    def handle(self, *args, **options):
+        count = build_daily_sales_rollups(full_rebuild=options["full"])
+        self.stdout.write("%s rollup rows written" % count)
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.order.outbox import dispatch_outbox, outbox_metrics, OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Sends pending outbox messages (dashboard notifications, emails, pushes, delicon)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int,
+                            default=OUTBOX_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", dest="loop",
+                            help="Keep polling instead of draining once")
+        parser.add_argument("--sleep", dest="sleep", type=float, default=1.0,
+                            help="Seconds to wait when the outbox is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            claimed = dispatch_outbox(batch_size=options["batch_size"])
+            if claimed:
+                continue
+            metrics = outbox_metrics()
+            self.stdout.write(
+                "pending %(pending)s, failed %(failed)s, lag %(lag_seconds).1fs" % metrics)
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from app.order.exports import order_export_rows, stream_csv, stream_xlsx
+from app.order.filters import filter_order_list
+
+
+class Command(BaseCommand):
+    help = "Exports orders with their items, payments and addresses as csv or xlsx"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-date", dest="from_date", default=None)
+        parser.add_argument("--to-date", dest="to_date", default=None)
+        parser.add_argument("--seller-ids", dest="seller_ids", default="",
+                            help="Json list of seller ids")
+        parser.add_argument("--order-status", dest="order_status", default="")
+        parser.add_argument("--payment-status", dest="payment_status", default="")
+        parser.add_argument("--format", dest="export_format", default="csv",
+                            choices=["csv", "xlsx"])
+        parser.add_argument("--output", dest="output", default=None,
+                            help="File to write to, defaults to stdout for csv")
+
+    def handle(self, *args, **options):
+        orders = filter_order_list(
+            None,
+            seller_ids=options["seller_ids"],
+            order_status=options["order_status"],
+            payment_status=options["payment_status"],
+            from_date=options["from_date"],
+            to_date=options["to_date"])
+        rows = order_export_rows(orders)
+
+        if options["export_format"] == "xlsx":
+            if not options["output"]:
+                self.stderr.write("--output is required for xlsx exports")
+                return
+            with open(options["output"], "wb") as output:
+                for chunk in stream_xlsx(rows):
+                    output.write(chunk)
+            return
+
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                for line in stream_csv(rows):
+                    output.write(line)
+        else:
+            for line in stream_csv(rows):
+                self.stdout.write(line, ending="")
@@ -1,13 +1,17 @@
 from creditcards.models import CardNumberField, CardExpiryField, SecurityCodeField
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.core.validators import MaxLengthValidator
 from django.db import models
 
 # Create your models here.
 from django.db.models import CASCADE, Sum, FloatField, F, SET_NULL, Case, When
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from phonenumbers import national_significant_number
 
+from app.authentication.scope import get_seller_scope
+
 
 class Order(models.Model):
     status_choices = (
@@ -58,7 +62,8 @@ class Order(models.Model):
     total_after_refund = models.FloatField(default=0.0)
 
     discounted_price = models.FloatField(default=0.0)
-    shipping_charge = models.FloatField(default=0.0)
+    # Set once when the order is created, from the city of its address
+    shipping_charge = models.FloatField(blank=True, null=True, default=None)
     isDeleted = models.BooleanField(default=False)
     cancellationReason = models.CharField(
         max_length=255, blank=True, null=True)
@@ -87,6 +92,12 @@ class Order(models.Model):
             [str(self.pk), str(self.created_at)]
         )
 
+    def save(self, *args, **kwargs):
+        if self.pk is None and self.shipping_charge is None:
+            from app.store.cities import address_shipping_cost
+            self.shipping_charge = address_shipping_cost(self.address)
+        super().save(*args, **kwargs)
+
     def get_sub_total(self):
         if self.orderProducts.exists():
             price_gt_zero = self.orderProducts.all().filter(
@@ -118,14 +129,8 @@ class Order(models.Model):
             if self.orderProducts.exists:
                 order_prods = self.orderProducts.all()
                 if user.is_seller:
-                    sub_admins = user.seller_sub_admins.all()
-                    if sub_admins.exists():
-                        sub_admin = sub_admins.latest('id')
-                        order_prods = order_prods.filter(
-                            product__store=sub_admin.store).distinct()
-                    else:
-                        order_prods = order_prods.filter(
-                            product__store__member=user).distinct()
+                    order_prods = get_seller_scope(user).filter(
+                        order_prods, "product__store").distinct()
                 else:
                     order_prods = order_prods
 
@@ -154,6 +159,13 @@ class Order(models.Model):
             return sub_total
         return 0.0
 
+    def get_shipping_charge(self):
+        # Rows from before the column was nullable hold the old default
+        # 0.0 until they are set to NULL, so 0.0 counts as unset as well
+        if not self.shipping_charge:
+            return settings.SHIPPING_CHARGE
+        return self.shipping_charge
+
     def get_totalPrice_without_shipping_charge(self):
         if self.orderProducts.exists():
             price_gt_zero = self.orderProducts.all().filter(
@@ -196,7 +208,7 @@ class Order(models.Model):
             self.totalPrice = 0
         if self.sub_total < 0:
             self.sub_total = 0
-        self.totalPrice += settings.SHIPPING_CHARGE
+        self.totalPrice += self.get_shipping_charge()
         self.save()
 
     def order_amount_to_reduce(self):
@@ -269,7 +281,7 @@ class Order(models.Model):
             if sub_total is None:
                 sub_total = 0.0
 
-            shipping_charge = settings.SHIPPING_CHARGE
+            shipping_charge = self.get_shipping_charge()
 
             if self.coupon:
                 if self.coupon.type == "FS":
@@ -310,7 +322,7 @@ class Order(models.Model):
             if sub_total is None:
                 sub_total = 0.0
 
-            shipping_charge = settings.SHIPPING_CHARGE
+            shipping_charge = self.get_shipping_charge()
 
             if self.coupon:
                 if self.coupon.type == "FS":
@@ -334,14 +346,8 @@ class Order(models.Model):
             if self.orderProducts.exists:
                 order_prods = self.orderProducts.all()
                 if user.is_seller:
-                    sub_admins = user.seller_sub_admins.all()
-                    if sub_admins.exists():
-                        sub_admin = sub_admins.latest('id')
-                        order_prods = order_prods.filter(
-                            product__store=sub_admin.store).distinct()
-                    else:
-                        order_prods = order_prods.filter(
-                            product__store__member=user).distinct()
+                    order_prods = get_seller_scope(user).filter(
+                        order_prods, "product__store").distinct()
                 else:
                     order_prods = order_prods
 
@@ -365,7 +371,7 @@ class Order(models.Model):
             if sub_total is None:
                 sub_total = 0.0
 
-            shipping_charge = settings.SHIPPING_CHARGE
+            shipping_charge = self.get_shipping_charge()
 
             if not user.is_seller:
                 if self.coupon:
@@ -781,4 +787,106 @@ class OrderViews(models.Model):
     def __str__(self):
         if self.order:
             return self.order.__str__()
-        return str(self.pk)
\ No newline at end of file
+        return str(self.pk)
+
+
+class DailySalesRollup(models.Model):
+    date = models.DateField(db_index=True)
+    seller = models.ForeignKey(
+        'store.Store', related_name='daily_sales_rollups',
+        blank=True, null=True,
+        on_delete=CASCADE
+    )
+    category = models.ForeignKey(
+        'product.Category', related_name='daily_sales_rollups',
+        blank=True, null=True,
+        on_delete=SET_NULL
+    )
+    city = models.ForeignKey(
+        'store.City', related_name='daily_sales_rollups',
+        blank=True, null=True,
+        on_delete=SET_NULL
+    )
+    payment_type = models.ForeignKey(
+        'store.PaymentType', related_name='daily_sales_rollups',
+        blank=True, null=True,
+        on_delete=SET_NULL
+    )
+    gross = models.FloatField(default=0.0)
+    discount = models.FloatField(default=0.0)
+    refunds = models.FloatField(default=0.0)
+    units = models.IntegerField(default=0)
+    # Distinct orders of the cell. An order spans several cells, so order
+    # counts are taken over the union of the ids, never summed.
+    order_ids = ArrayField(models.IntegerField(), default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-date', 'id')
+        unique_together = (
+            'date', 'seller', 'category', 'city', 'payment_type'
+        )
+        index_together = (
+            ('seller', 'date'),
+        )
+
+    def __str__(self):
+        return ' - '.join(
+            [str(self.date), str(self.seller_id), str(self.category_id)]
+        )
+
+
+class SalesRollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_synced_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return ' - '.join(
+            [self.name, str(self.last_synced_at)]
+        )
+
+
+class OutboxMessage(models.Model):
+    CHANNEL_CHOICES = (
+        ('DASH', 'Dashboard Notification'),
+        ('EMAIL', 'Email'),
+        ('PUSH', 'Push Notification'),
+        ('DELICON', 'Delicon'),
+    )
+    STATUS_CHOICES = (
+        ('PE', 'Pending'),
+        ('SE', 'Sent'),
+        ('FA', 'Failed'),
+    )
+    channel = models.CharField(
+        max_length=7, choices=CHANNEL_CHOICES)
+    event = models.CharField(max_length=100)
+    recipient = models.CharField(
+        max_length=100, blank=True, default='')
+    payload = JSONField(default=list, blank=True)
+    status = models.CharField(
+        max_length=2, default='PE',
+        choices=STATUS_CHOICES)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    available_at = models.DateTimeField(default=now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('id',)
+        index_together = (
+            ('status', 'available_at'),
+        )
+
+    def __str__(self):
+        return ' - '.join(
+            [self.channel, self.event, self.recipient]
+        )
@@ -0,0 +1,227 @@
+import importlib
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction, models
+from django.db.models import Min, Count
+from django.utils.timezone import now
+
+from app.order.models import OutboxMessage
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BASE_BACKOFF = 30
+OUTBOX_MAX_BACKOFF = 60 * 60
+# Claimed messages are hidden from other dispatchers this long, and sent
+# again after it if the dispatcher died before marking them.
+OUTBOX_CLAIM_SECONDS = 5 * 60
+
+# Dotted paths of the functions a task event is run with, imported on
+# first use so the outbox can be written without loading the senders.
+OUTBOX_TASKS = {
+    "send_cancel_email_orders_seller": "app.order.zappa_tasks.send_cancel_email_orders_seller",
+    "send_cancel_email_orders_customer": "app.order.zappa_tasks.send_cancel_email_orders_customer",
+    "send_cancel_email_items_seller": "app.order.zappa_tasks.send_cancel_email_items_seller",
+    "send_cancel_email_items_customer": "app.order.zappa_tasks.send_cancel_email_items_customer",
+    "send_order_out_for_delivery_push": "app.ecommnotification.zappa_tasks.send_order_out_for_delivery_push",
+    "send_order_delivered_push": "app.ecommnotification.zappa_tasks.send_order_delivered_push",
+    "send_order_rescheduled_push": "app.ecommnotification.zappa_tasks.send_order_rescheduled_push",
+    "create_delicon_order": "app.order.delicon.create_delicon_order",
+    "create_reschedule_delicon_order": "app.order.delicon.create_reschedule_delicon_order",
+}
+
+
+def encode_arg(value):
+    if isinstance(value, models.Model):
+        return {"model": value._meta.label, "pk": value.pk}
+    if isinstance(value, models.QuerySet):
+        return {"model": value.model._meta.label,
+                "pks": list(value.values_list('pk', flat=True))}
+    return value
+
+
+def decode_arg(value):
+    if isinstance(value, dict) and "model" in value:
+        model = apps.get_model(value["model"])
+        if "pks" in value:
+            return model.objects.filter(pk__in=value["pks"])
+        return model.objects.filter(pk=value["pk"]).first()
+    return value
+
+
+def default_recipient(args):
+    for value in args:
+        if isinstance(value, models.Model):
+            return "%s:%s" % (value._meta.model_name, value.pk)
+    return ""
+
+
+def enqueue(channel, event, *args, recipient=None):
+    """
+    Adds a message to the outbox. Call it inside the transaction of the
+    state change so the message is only sent if that change commits.
+    """
+    if recipient is None:
+        recipient = default_recipient(args)
+    return OutboxMessage.objects.create(
+        channel=channel,
+        event=event,
+        recipient=recipient,
+        payload=[encode_arg(value) for value in args])
+
+
+def notify_dashboard(event, *args):
+    return enqueue('DASH', event, *args)
+
+
+def run_task(event, *args):
+    module_name, function_name = OUTBOX_TASKS[event].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), function_name)(*args)
+
+
+class DashboardTransport:
+    def send(self, messages):
+        from app.ecommnotification.models import DashboardEcommNotification
+        # Only writes rows, so a failed group leaves none behind to duplicate
+        with transaction.atomic():
+            for message in messages:
+                getattr(DashboardEcommNotification.objects, message.event)(
+                    *[decode_arg(value) for value in message.payload])
+
+
+class TaskTransport:
+    def send(self, messages):
+        # Emails taking a list of ids are merged into one call per event
+        # instead of one mail job per message.
+        merged = OrderedDict()
+        for message in messages:
+            payload = message.payload
+            if len(payload) == 1 and isinstance(payload[0], list):
+                merged.setdefault(message.event, [])
+                for value in payload[0]:
+                    if value not in merged[message.event]:
+                        merged[message.event].append(value)
+            else:
+                run_task(message.event,
+                         *[decode_arg(value) for value in payload])
+        for event, ids in merged.items():
+            run_task(event, ids)
+
+
+class StubTransport:
+    """Keeps sent messages in memory, for local runs and tests."""
+
+    def __init__(self, fail_events=None):
+        self.sent = []
+        self.fail_events = set(fail_events or [])
+
+    def send(self, messages):
+        for message in messages:
+            if message.event in self.fail_events:
+                raise Exception("Stub transport failed for %s" % message.event)
+        for message in messages:
+            self.sent.append(
+                (message.channel, message.event, message.recipient, message.payload))
+
+
+stub_transport = StubTransport()
+
+
+def get_transports():
+    if getattr(settings, "OUTBOX_STUB_TRANSPORTS", False):
+        # One stub per process, so what was sent can be looked at afterwards
+        return {"DASH": stub_transport, "EMAIL": stub_transport,
+                "PUSH": stub_transport, "DELICON": stub_transport}
+    task_transport = TaskTransport()
+    return {
+        "DASH": DashboardTransport(),
+        "EMAIL": task_transport,
+        "PUSH": task_transport,
+        "DELICON": task_transport,
+    }
+
+
+def backoff_seconds(attempts):
+    return min(OUTBOX_BASE_BACKOFF * (2 ** (attempts - 1)), OUTBOX_MAX_BACKOFF)
+
+
+def mark_failed(messages, error):
+    for message in messages:
+        message.attempts += 1
+        message.last_error = error
+        if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            message.status = 'FA'
+        else:
+            message.available_at = now() + timedelta(
+                seconds=backoff_seconds(message.attempts))
+        message.save(update_fields=[
+            'attempts', 'last_error', 'status', 'available_at', 'updated_at'])
+
+
+def mark_sent(messages):
+    for message in messages:
+        message.attempts += 1
+        message.status = 'SE'
+        message.sent_at = now()
+        message.save(update_fields=[
+            'attempts', 'status', 'sent_at', 'updated_at'])
+
+
+@transaction.atomic
+def claim_messages(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Locks a batch of due messages with SKIP LOCKED, so several
+    dispatchers can run side by side, and pushes their available_at past
+    the claim window before the locks are released on commit.
+    """
+    messages = list(OutboxMessage.objects.select_for_update(
+        skip_locked=True).filter(
+        status='PE', available_at__lte=now()
+    ).order_by('id')[:batch_size])
+    if messages:
+        OutboxMessage.objects.filter(
+            pk__in=[message.id for message in messages]
+        ).update(available_at=now() + timedelta(seconds=OUTBOX_CLAIM_SECONDS))
+    return messages
+
+
+def dispatch_outbox(batch_size=OUTBOX_BATCH_SIZE, transports=None):
+    """
+    Claims a batch of due messages and sends them grouped by channel and
+    recipient, outside of any transaction so no row lock is held while
+    waiting on a transport. Each group is marked sent or failed as soon
+    as its send returns. Returns the number of messages claimed.
+    """
+    if transports is None:
+        transports = get_transports()
+
+    messages = claim_messages(batch_size)
+    groups = OrderedDict()
+    for message in messages:
+        groups.setdefault(
+            (message.channel, message.recipient), []).append(message)
+
+    for (channel, recipient), group in groups.items():
+        try:
+            transports[channel].send(group)
+        except Exception as e:
+            mark_failed(group, str(e))
+        else:
+            mark_sent(group)
+    return len(messages)
+
+
+def outbox_metrics():
+    pending = OutboxMessage.objects.filter(status='PE')
+    oldest = pending.aggregate(oldest=Min('created_at')).get('oldest')
+    return {
+        "pending": pending.count(),
+        "due": pending.filter(available_at__lte=now()).count(),
+        "retrying": pending.filter(attempts__gt=0).count(),
+        "failed": OutboxMessage.objects.filter(status='FA').count(),
+        "lag_seconds": (now() - oldest).total_seconds() if oldest else 0,
+        "pending_by_channel": dict(pending.values_list('channel').annotate(
+            count=Count('id')).order_by()),
+    }
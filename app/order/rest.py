@@ -4,7 +4,9 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.contrib.auth import authenticate
+from django.db import transaction
 from django.db.models import Q, Count, F
+from django.http import StreamingHttpResponse
 from django.utils.timezone import now
 from rest_framework import viewsets, status, generics
 from rest_framework.authentication import TokenAuthentication
@@ -15,30 +17,30 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from app.authentication.permissions import IsSuperAdminOrSeller, IsSuperAdminOrObjectSeller, IsSuperAdmin
+from app.authentication.scope import SellerScopeMixin, get_seller_scope
 from app.authentication.serializers import AddressDetailSerializer
-from app.ecommnotification.models import DashboardEcommNotification
-from app.ecommnotification.zappa_tasks import send_order_out_for_delivery_push, send_order_delivered_push, \
-    send_order_rescheduled_push
-from app.order.delicon import create_reschedule_delicon_order, create_delicon_order
+from app.order.exports import order_export_rows, stream_csv, stream_xlsx
+from app.order.filters import filter_order_list
 from app.order.models import Order, OrderProduct, CancelledOrderProduct, OrderStatusTrack, OrderProductStatusTrack, \
-    OrderViews
+    OrderViews, DailySalesRollup
+from app.order.outbox import enqueue, notify_dashboard, outbox_metrics
+from app.order.rollups import ROLLUP_GROUP_BY_FIELDS, sales_kpis
 from app.order.serializers import OrderListSerializer, OrderDetailSerializer, AddEditAddressSerializer, \
     OrderStatusTrackSerializer, OrderProdStatusTrackSerializer
 from app.order.utils import DeliveryLogPagination
-from app.order.zappa_tasks import send_cancel_email_orders_seller, send_cancel_email_orders_customer, \
-    send_cancel_email_items_seller, send_cancel_email_items_customer
 from app.product.models import Brand, Category, CategoryMedia, EcommProduct, EcommProductMedia
 from app.product.serializers import BrandListSerializer, BrandSerializer, AddEditBrandSerializer, \
     CategoryListSerializer, AddEditCategorySerializer, CategorySerializer, AddSubCategorySerializer, \
     ProductListSerializer, AddEditProductSerializer, ProductDetailSerializer, EditProductSerializer
 from app.product.utils import json_list
-from app.store.models import Address, InventoryProduct
+from app.store.allocation import release_order_product
+from app.store.models import Address
 from app.utilities.cache_invalidation import create_invalidation
 from app.utilities.helpers import str2bool, report_to_developer
 from django.utils.translation import ugettext_lazy as _
 
 
-class OrderList(ListAPIView):
+class OrderList(SellerScopeMixin, ListAPIView):
     permission_classes = [IsSuperAdminOrSeller]
     serializer_class = OrderListSerializer
     http_method_names = [u'get', u'post']
@@ -46,115 +48,23 @@ class OrderList(ListAPIView):
     def _allowed_methods(self):
         return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
-    def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(pk__icontains=qstring) |
-                Q(customer__full_name__icontains=qstring) |
-                Q(customer__first_name__icontains=qstring) |
-                Q(customer__last_name__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
-
     def get_serializer_context(self):
         return {"user": self.request.user,
+                "seller_scope": self.request.seller_scope,
                 "lang_code": self.request.query_params.get("lang_code", "")}
 
     def get_queryset(self):
-        search_string = self.request.query_params.get("search_string", "")
-        sort_by = self.request.query_params.get("sort_by", "")
-        seller_ids = self.request.data.get("seller_ids", "")
-        order_status = self.request.query_params.get("order_status", "")
-        payment_status = self.request.data.get("payment_status", "")
-        days = self.request.data.get("days", None)
-        from_date = self.request.data.get("from_date", None)
-        to_date = self.request.data.get("to_date", None)
-        customer_id = self.request.query_params.get("customer_id", "")
-
-        if self.request.user.is_seller:
-            sub_admins = self.request.user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                qs = Order.objects.filter(
-                    payments__isnull=False,
-                    orderProducts__product__store=sub_admin.store).distinct()
-            else:
-                qs = Order.objects.filter(
-                    payments__isnull=False,
-                    orderProducts__product__store__member=self.request.user).distinct()
-        else:
-            qs = Order.objects.filter(payments__isnull=False).distinct()
-
-        if customer_id != "":
-            qs = qs.filter(customer__pk=customer_id).distinct()
-
-        order_prod_filter = filter(
-            lambda x: x.order_prods_has_prod() is True, qs)
-        qs = qs.filter(id__in=list([x.id for x in order_prod_filter]))
-
-        if seller_ids != "" and json_list(seller_ids)[0]:
-            qs = qs.filter(
-                orderProducts__product__store__pk__in=json_list(seller_ids)[1]
-            ).distinct()
-
-        if order_status != "":
-            failed_payment_status_filter = filter(
-                lambda x: x.get_payment_status() == "Failed", qs)
-
-            qs = qs.filter(orderProducts__status=order_status).exclude(
-                id__in=list([x.id for x in failed_payment_status_filter])
-            )
-
-        if payment_status != "":
-            payment_status_filter = filter(
-                lambda x: x.get_payment_status() == payment_status, qs)
-            qs = qs.filter(id__in=list([x.id for x in payment_status_filter]))
-
-        if days == 0 or days:
-            date_selected = now() - timedelta(days=int(days))
-            qs = qs.filter(created_at__date__gte=date_selected.date())
-
-        if from_date and to_date:
-            qs = qs.filter(
-                created_at__date__gte=from_date,
-                created_at__date__lte=to_date)
-
-        if search_string != "":
-            qs = self.search(qs, search_string)
-
-        if sort_by != "":
-            if sort_by == "new_first":
-                qs = qs.order_by('-created_at')
-            if sort_by == "old_first":
-                qs = qs.order_by('created_at')
-
-            if sort_by == "order_no_asc":
-                qs = qs.order_by('pk')
-            if sort_by == "order_no_desc":
-                qs = qs.order_by('-pk')
-
-            if sort_by == "cust_name_a_to_z":
-                qs = qs.order_by('customer__full_name')
-            if sort_by == "cust_name_z_to_a":
-                qs = qs.order_by('-customer__full_name')
-
-            if sort_by == "total_price_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_totalPrice_float(),
-                            reverse=False)
-            if sort_by == "total_price_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_totalPrice_float(),
-                            reverse=True)
-
-            if sort_by == "items_low_to_high":
-                qs = qs.annotate(item_count=Count(F('orderProducts'))).order_by(
-                    'item_count').distinct()
-            if sort_by == "items_high_to_low":
-                qs = qs.annotate(item_count=Count(F('orderProducts'))).order_by(
-                    '-item_count').distinct()
-
-        return qs
+        return filter_order_list(
+            self.request.user,
+            search_string=self.request.query_params.get("search_string", ""),
+            sort_by=self.request.query_params.get("sort_by", ""),
+            seller_ids=self.request.data.get("seller_ids", ""),
+            order_status=self.request.query_params.get("order_status", ""),
+            payment_status=self.request.data.get("payment_status", ""),
+            days=self.request.data.get("days", None),
+            from_date=self.request.data.get("from_date", None),
+            to_date=self.request.data.get("to_date", None),
+            customer_id=self.request.query_params.get("customer_id", ""))
 
     def post(self, request, *args, **kwargs):
         try:
@@ -169,9 +79,27 @@ class OrderList(ListAPIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ExportOrders(OrderList):
+
+    def post(self, request, *args, **kwargs):
+        export_format = request.query_params.get("export_format", "csv")
+        rows = order_export_rows(self.get_queryset(), self.request.user)
+        if export_format == "xlsx":
+            response = StreamingHttpResponse(
+                stream_xlsx(rows),
+                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            response['Content-Disposition'] = 'attachment; filename=orders.xlsx'
+            return response
+        response = StreamingHttpResponse(
+            stream_csv(rows), content_type="text/csv")
+        response['Content-Disposition'] = 'attachment; filename=orders.csv'
+        return response
+
+
 class CancelOrders(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
+    @transaction.atomic
     def post(self, request):
         order_ids = self.request.data.get("order_ids", "")
         cancellationReason = self.request.data.get("cancellationReason", "")
@@ -194,7 +122,8 @@ class CancelOrders(APIView):
                     updated_by=request.user,
                     reason=cancellationReason
                 )
-                DashboardEcommNotification.objects.order_status_cancelled(
+                notify_dashboard(
+                    "order_status_cancelled",
                     ord, request.user, "CA", cancellationReason)
 
             OrderProduct.objects.filter(
@@ -214,13 +143,12 @@ class CancelOrders(APIView):
                     reason=cancellationReason
                 )
                 if op.quantity > 0:
-                    InventoryProduct.objects.filter(
-                        product=op.product,
-                        inventory__store=op.product.store
-                    ).update(quantity=F('quantity') + op.quantity)
+                    release_order_product(op, op.quantity)
 
-            send_cancel_email_orders_seller(json_list(order_ids)[1])
-            send_cancel_email_orders_customer(json_list(order_ids)[1])
+            enqueue('EMAIL', "send_cancel_email_orders_seller", json_list(order_ids)[1],
+                    recipient="sellers")
+            enqueue('EMAIL', "send_cancel_email_orders_customer", json_list(order_ids)[1],
+                    recipient="customers")
             create_invalidation()
             return Response({"detail": "Successfully cancelled orders"})
         return Response({"detail": "Please select atleast one order"},
@@ -260,6 +188,7 @@ class OrderDetails(RetrieveAPIView):
 class UpdateProdStatus(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
+    @transaction.atomic
     def post(self, request, pk):
         order = get_object_or_404(Order, pk=pk)
         product_ids = request.data.get("product_ids", "")
@@ -325,11 +254,12 @@ class UpdateProdStatus(APIView):
                     ).update(
                         rescheduled_at=reschedule_at,
                         rescheduled_reason=reschedule_reason)
-                    DashboardEcommNotification.objects.order_status_rescheduled(
+                    notify_dashboard(
+                        "order_status_rescheduled",
                         order, request.user, reschedule_at, reschedule_reason, "RES")
 
                     if settings.SITE_CODE == 1:
-                        create_reschedule_delicon_order(order)
+                        enqueue('DELICON', "create_reschedule_delicon_order", order)
 
                 if order_prod_status == "RFP":
                     OrderProduct.objects.filter(
@@ -347,7 +277,8 @@ class UpdateProdStatus(APIView):
                     ps = EcommProduct.objects.filter(
                         pk__in=json_list(product_ids)[1]
                     )
-                    DashboardEcommNotification.objects.order_prod_status_declined(
+                    notify_dashboard(
+                        "order_prod_status_declined",
                         order, request.user, ps, dec_remarks, "DEC")
 
                 if order_prod_status == "RET":
@@ -359,21 +290,24 @@ class UpdateProdStatus(APIView):
                     ps = EcommProduct.objects.filter(
                         pk__in=json_list(product_ids)[1]
                     )
-                    DashboardEcommNotification.objects.order_prod_status_returned(
+                    notify_dashboard(
+                        "order_prod_status_returned",
                         order, request.user, ps, ret_remarks, "RET")
 
                 if order_prod_status == "RBFC":
                     ps = EcommProduct.objects.filter(
                         pk__in=json_list(product_ids)[1]
                     )
-                    DashboardEcommNotification.objects.order_prod_status_ready_for_bfc(
+                    notify_dashboard(
+                        "order_prod_status_ready_for_bfc",
                         order, request.user, ps, "RBFC")
 
                 if order_prod_status == "TBS":
                     ps = EcommProduct.objects.filter(
                         pk__in=json_list(product_ids)[1]
                     )
-                    DashboardEcommNotification.objects.order_prod_status_transit_by_seller(
+                    notify_dashboard(
+                        "order_prod_status_transit_by_seller",
                         order, request.user, ps, "TBS")
                 create_invalidation()
                 return Response({"detail": f"Successfully added products to {order_prod_status}"})
@@ -386,6 +320,7 @@ class UpdateProdStatus(APIView):
 class UpdateOrderStatus(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
+    @transaction.atomic
     def post(self, request, pk):
         order = get_object_or_404(Order, pk=pk)
         order_status = request.data.get("order_status", "")
@@ -426,12 +361,12 @@ class UpdateOrderStatus(APIView):
             if order_status == "OFD":
                 order.out_for_delivery_at = order_status_track.created_at
                 order.save()
-                send_order_out_for_delivery_push(order)
+                enqueue('PUSH', "send_order_out_for_delivery_push", order)
 
             if order_status == "DEL":
                 order.delivered_at = order_status_track.created_at
                 order.save()
-                send_order_delivered_push(order)
+                enqueue('PUSH', "send_order_delivered_push", order)
 
             if order_status == "RES":
                 OrderProduct.objects.filter(order=order).update(
@@ -441,10 +376,10 @@ class UpdateOrderStatus(APIView):
                 order.rescheduled_at = reschedule_at
                 order.rescheduled_reason = reschedule_reason
                 order.save()
-                send_order_rescheduled_push(order)
+                enqueue('PUSH', "send_order_rescheduled_push", order)
 
                 if settings.SITE_CODE == 1:
-                    create_reschedule_delicon_order(order)
+                    enqueue('DELICON', "create_reschedule_delicon_order", order)
 
             if order_status == "RFP":
                 OrderProduct.objects.filter(
@@ -455,22 +390,26 @@ class UpdateOrderStatus(APIView):
                 OrderProduct.objects.filter(
                     order=order).update(
                     returned_reason=ret_remarks)
-                DashboardEcommNotification.objects.order_status_returned(
+                notify_dashboard(
+                    "order_status_returned",
                     order, request.user, "RET", ret_remarks)
 
             if order_status == "DEC":
                 OrderProduct.objects.filter(
                     order=order).update(
                     declined_reason=dec_remarks)
-                DashboardEcommNotification.objects.order_status_declined(
+                notify_dashboard(
+                    "order_status_declined",
                     order, request.user, dec_remarks, "DEC")
 
             if order_status == "RBFC":
-                DashboardEcommNotification.objects.order_status_ready_for_bfc(
+                notify_dashboard(
+                    "order_status_ready_for_bfc",
                     order, request.user, "RBFC")
 
             if order_status == "TBS":
-                DashboardEcommNotification.objects.order_status_transit_by_seller(
+                notify_dashboard(
+                    "order_status_transit_by_seller",
                     order, request.user, "TBS")
             create_invalidation()
             return Response({"detail": f"Successfully updated order status to {order_status}"})
@@ -501,6 +440,7 @@ class EditShippingAddress(UpdateAPIView):
 class CancelAndRefundOrder(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
+    @transaction.atomic
     def post(self, request, pk):
         order = get_object_or_404(Order, pk=pk)
         previous_order_status = order.status
@@ -574,10 +514,7 @@ class CancelAndRefundOrder(APIView):
                         product__id=prod_id
                     ).distinct()
                     for op in order_prods:
-                        InventoryProduct.objects.filter(
-                            product=op.product,
-                            inventory__store=op.product.store
-                        ).update(quantity=F('quantity')+qty)
+                        release_order_product(op, qty)
 
         order_prod_ids = []
         for cancelled_qty_item in cancelled_qty_list:
@@ -592,8 +529,10 @@ class CancelAndRefundOrder(APIView):
         print("order_prod_ids")
         print(order_prod_ids)
         if len(order_prod_ids) > 0:
-            send_cancel_email_items_seller(list(order_prod_ids))
-            send_cancel_email_items_customer(list(order_prod_ids))
+            enqueue('EMAIL', "send_cancel_email_items_seller", list(order_prod_ids),
+                    recipient="sellers")
+            enqueue('EMAIL', "send_cancel_email_items_customer", list(order_prod_ids),
+                    recipient="customers")
 
         print("order_stat")
         print(order.status)
@@ -601,7 +540,8 @@ class CancelAndRefundOrder(APIView):
             status='CA'
         ).count()
         if cancelled_op_count == order.orderProducts.all().count():
-            DashboardEcommNotification.objects.order_status_cancelled(
+            notify_dashboard(
+                "order_status_cancelled",
                 order, request.user, "CA", cancellationReason)
         else:
             prod_ids = OrderProduct.objects.filter(
@@ -610,7 +550,8 @@ class CancelAndRefundOrder(APIView):
             prod_qs = EcommProduct.objects.filter(
                 pk__in=prod_ids
             )
-            DashboardEcommNotification.objects.order_prod_status_cancelled(
+            notify_dashboard(
+                "order_prod_status_cancelled",
                 order, request.user, prod_qs, cancellationReason, "CA")
         create_invalidation()
         return Response({"detail": "Successfully cancelled order",
@@ -650,3 +591,65 @@ class DeliveryLogForOrderProd(ListAPIView):
 
         serializer = self.get_serializer(result_qs, many=True)
         return Response(serializer.data)
+
+
+class SalesKPIs(APIView):
+    permission_classes = [IsSuperAdminOrSeller]
+
+    def post(self, request):
+        seller_ids = request.data.get("seller_ids", "")
+        category_ids = request.data.get("category_ids", "")
+        city_ids = request.data.get("city_ids", "")
+        payment_type_ids = request.data.get("payment_type_ids", "")
+        days = request.data.get("days", None)
+        from_date = request.data.get("from_date", None)
+        to_date = request.data.get("to_date", None)
+        group_by = request.data.get("group_by", "")
+
+        if group_by != "" and group_by not in ROLLUP_GROUP_BY_FIELDS:
+            return Response({"error": "Invalid group_by"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if request.user.is_seller:
+            qs = get_seller_scope(request.user).filter(
+                DailySalesRollup.objects.all(), "seller")
+        else:
+            qs = DailySalesRollup.objects.all()
+
+        if seller_ids != "" and json_list(seller_ids)[0]:
+            qs = qs.filter(seller__pk__in=json_list(seller_ids)[1])
+
+        if category_ids != "" and json_list(category_ids)[0]:
+            descendants_all = set()
+            for category in Category.objects.filter(
+                    pk__in=json_list(category_ids)[1]):
+                descendants_all.update(
+                    Category.objects.descendants(category).values_list(
+                        'id', flat=True))
+            qs = qs.filter(category__pk__in=descendants_all)
+
+        if city_ids != "" and json_list(city_ids)[0]:
+            qs = qs.filter(city__pk__in=json_list(city_ids)[1])
+
+        if payment_type_ids != "" and json_list(payment_type_ids)[0]:
+            qs = qs.filter(
+                payment_type__pk__in=json_list(payment_type_ids)[1])
+
+        if days == 0 or days:
+            date_selected = now() - timedelta(days=int(days))
+            qs = qs.filter(date__gte=date_selected.date())
+
+        if from_date and to_date:
+            qs = qs.filter(date__gte=from_date, date__lte=to_date)
+
+        kpis = sales_kpis(qs, group_by or None)
+        if group_by == "":
+            return Response(kpis[0])
+        return Response({"results": kpis})
+
+
+class OutboxMetrics(APIView):
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request):
+        return Response(outbox_metrics())
@@ -0,0 +1,205 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction, connection
+from django.db.models import Sum, F, Case, When, Value, FloatField, IntegerField, OuterRef, Subquery, Func
+from django.db.models.functions import TruncDate, Coalesce
+from django.utils.timezone import now
+
+from app.order.models import Order, OrderProduct, CancelledOrderProduct, DailySalesRollup, SalesRollupWatermark
+from app.store.models import Payment
+
+DAILY_SALES_WATERMARK = "daily_sales"
+
+ROLLUP_GROUP_BY_FIELDS = {
+    "date": "date",
+    "seller": "seller",
+    "category": "category",
+    "city": "city",
+    "payment_type": "payment_type",
+}
+
+def line_unit_price():
+    # Older order lines were stored with price 0, fall back to the
+    # discounted base price the same way Order.get_sub_total does.
+    return Case(
+        When(price__gt=0, then=F('price')),
+        When(product__discount__isnull=True,
+             then=F('product__base_price')),
+        default=(F('product__base_price')
+                 - (F('product__base_price')
+                    * F('product__discount__percentage')) / 100),
+        output_field=FloatField())
+
+
+def line_refunded_qty():
+    cancelled_qty = CancelledOrderProduct.objects.filter(
+        order_product=OuterRef('pk')
+    ).values('order_product').annotate(
+        qty=Sum('cancelled_qty')).values('qty')[:1]
+    return Case(
+        When(status='CA',
+             then=Coalesce(Subquery(cancelled_qty, output_field=IntegerField()),
+                           F('quantity'))),
+        default=Value(0),
+        output_field=IntegerField())
+
+
+def paid_orders():
+    return Order.objects.filter(
+        payments__status='SU').values('id')
+
+
+def order_lines():
+    """Lines of paid orders with the day and payment type they are rolled up by."""
+    payment_type = Payment.objects.filter(
+        order=OuterRef('order'), status='SU'
+    ).order_by('-id').values('paymentType')[:1]
+    return OrderProduct.objects.filter(
+        order__in=paid_orders()).annotate(
+        day=TruncDate('order__created_at'),
+        payment_type_id=Subquery(payment_type, output_field=IntegerField()))
+
+
+def rollup_rows(dates=None):
+    qs = order_lines()
+    if dates is not None:
+        qs = qs.filter(day__in=dates)
+
+    qs = qs.annotate(
+        unit_price=line_unit_price(),
+        refunded_qty=line_refunded_qty(),
+    ).values(
+        'day', 'product__store', 'product__category',
+        'order__address__area', 'payment_type_id'
+    ).annotate(
+        gross_total=Sum(F('unit_price') * F('quantity'),
+                        output_field=FloatField()),
+        markdown_total=Sum(
+            Case(When(price__gt=0, product__isnull=False,
+                      then=(F('product__base_price') - F('unit_price')) * F('quantity')),
+                 default=Value(0.0), output_field=FloatField())),
+        coupon_total=Sum(
+            Case(When(order__sub_total__gt=0,
+                      then=F('order__discounted_price') * F('unit_price')
+                      * F('quantity') / F('order__sub_total')),
+                 default=Value(0.0), output_field=FloatField())),
+        refund_total=Sum(F('unit_price') * F('refunded_qty'),
+                         output_field=FloatField()),
+        unit_count=Sum('quantity'),
+        order_id_list=ArrayAgg('order', distinct=True),
+    ).order_by()
+
+    for row in qs:
+        yield DailySalesRollup(
+            date=row['day'],
+            seller_id=row['product__store'],
+            category_id=row['product__category'],
+            city_id=row['order__address__area'],
+            payment_type_id=row['payment_type_id'],
+            gross=row['gross_total'] or 0.0,
+            discount=max(row['markdown_total'] or 0.0, 0.0) + (row['coupon_total'] or 0.0),
+            refunds=row['refund_total'] or 0.0,
+            units=row['unit_count'] or 0,
+            order_ids=sorted(row['order_id_list'] or []),
+        )
+
+
+def changed_order_dates(since):
+    """
+    Days of the orders whose order, lines, payments or cancellations
+    changed since the last run. Orders that stopped being paid are
+    included so their day drops them.
+    """
+    changed = [
+        Order.objects.filter(updated_at__gt=since),
+        Order.objects.filter(orderProducts__updated_at__gt=since),
+        Order.objects.filter(payments__updated_at__gt=since),
+        Order.objects.filter(
+            orderProducts__cancelled_orderProducts__updated_at__gt=since),
+    ]
+    dates = set()
+    for orders in changed:
+        dates.update(orders.annotate(day=TruncDate('created_at')).values_list(
+            'day', flat=True).order_by().distinct())
+    return dates
+
+
+def build_daily_sales_rollups(full_rebuild=False):
+    """
+    Rebuilds the rollup rows of every day that has an order touched since
+    the last run. Days are recomputed as a whole so a cancellation or
+    refund simply replaces that day's cells.
+    """
+    synced_at = now()
+    watermark, created = SalesRollupWatermark.objects.get_or_create(
+        name=DAILY_SALES_WATERMARK)
+
+    if full_rebuild or not watermark.last_synced_at:
+        dates = None
+    else:
+        dates = changed_order_dates(watermark.last_synced_at)
+        if not dates:
+            watermark.last_synced_at = synced_at
+            watermark.save()
+            return 0
+
+    with transaction.atomic():
+        rollups = DailySalesRollup.objects.all()
+        if dates is not None:
+            rollups = rollups.filter(date__in=dates)
+        rollups.delete()
+
+        rows = DailySalesRollup.objects.bulk_create(
+            rollup_rows(dates), batch_size=500)
+
+        watermark.last_synced_at = synced_at
+        watermark.save()
+    return len(rows)
+
+
+def order_counts(qs, group_field=None):
+    """
+    {group value: distinct orders} of the rollup rows `qs`, counted over
+    the union of their order ids. The key is None when not grouped.
+    """
+    rows = qs.annotate(
+        group_key=F(group_field) if group_field else Value(None, output_field=IntegerField()),
+        order_id=Func(F('order_ids'), function='unnest', output_field=IntegerField()),
+    ).values('group_key', 'order_id').order_by()
+    sql, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT group_key, COUNT(DISTINCT order_id) FROM (%s) AS cell_orders "
+            "GROUP BY group_key" % sql, params)
+        return dict(cursor.fetchall())
+
+
+def sales_kpis(qs, group_by=None):
+    totals = {
+        "total_gross": Coalesce(Sum('gross'), Value(0.0)),
+        "total_discount": Coalesce(Sum('discount'), Value(0.0)),
+        "total_refunds": Coalesce(Sum('refunds'), Value(0.0)),
+        "total_units": Coalesce(Sum('units'), Value(0)),
+    }
+    if group_by:
+        group_field = ROLLUP_GROUP_BY_FIELDS[group_by]
+        rows = qs.values(group_field).annotate(
+            **totals).order_by(group_field)
+    else:
+        group_field = None
+        rows = [qs.aggregate(**totals)]
+    orders = order_counts(qs, group_field)
+
+    result = []
+    for row in rows:
+        kpi = {
+            "gross": row["total_gross"],
+            "discount": row["total_discount"],
+            "refunds": row["total_refunds"],
+            "net": row["total_gross"] - row["total_discount"] - row["total_refunds"],
+            "units": row["total_units"],
+            "orders": orders.get(row[group_field] if group_field else None) or 0,
+        }
+        if group_field:
+            kpi[group_by] = row[group_field]
+        result.append(kpi)
+    return result
@@ -1,4 +1,3 @@
-from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Count, Q, When, Value, Case, CharField
 from phonenumbers import national_significant_number
@@ -8,6 +7,7 @@ from rest_framework import serializers
 from app.authentication.models import Member
 from app.authentication.models.member import GuestAccount
 from app.authentication.serializers import AddressDetailSerializer
+from app.authentication.scope import context_scope
 from app.order.models import Order, OrderProduct, OrderStatusTrack, OrderProductStatusTrack
 from app.product.models import Brand, VariantValues
 from app.product.serializers import EcommProductMediaSerializer
@@ -137,7 +137,7 @@ class OrderListSerializer(serializers.ModelSerializer):
             order.totalPrice = 0
         if order.sub_total < 0:
             order.sub_total = 0
-        order.totalPrice += settings.SHIPPING_CHARGE
+        order.totalPrice += order.get_shipping_charge()
         order.save()
 
     def order_amount_to_reduce(self, order):
@@ -227,14 +227,8 @@ class OrderListSerializer(serializers.ModelSerializer):
         cancelled_status = [_("Cancelled")]
         user = self.context.get("user")
         if user.is_seller:
-            sub_admins = user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                order_prods = obj.orderProducts.filter(
-                    product__store=sub_admin.store).distinct()
-            else:
-                order_prods = obj.orderProducts.filter(
-                    product__store__member=user).distinct()
+            order_prods = context_scope(self.context).filter(
+                obj.orderProducts, "product__store").distinct()
         else:
             order_prods = obj.orderProducts.all()
 
@@ -261,14 +255,8 @@ class OrderListSerializer(serializers.ModelSerializer):
     def get_total_prod_count(self, obj):
         user = self.context.get("user")
         if user.is_seller:
-            sub_admins = user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                order_prod_count = obj.orderProducts.filter(
-                    product__store=sub_admin.store).distinct().count()
-            else:
-                order_prod_count = obj.orderProducts.filter(
-                    product__store__member=user).distinct().count()
+            order_prod_count = context_scope(self.context).filter(
+                obj.orderProducts, "product__store").distinct().count()
         else:
             order_prod_count = obj.orderProducts.all().count()
         return order_prod_count
@@ -802,16 +790,8 @@ class OrderDetailSerializer(serializers.ModelSerializer):
     def get_delivered_count(self, obj):
         user = self.context.get("user")
         if user.is_seller:
-            sub_admins = user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                del_count = obj.orderProducts.filter(
-                    status='DEL',
-                    product__store=sub_admin.store).distinct().count()
-            else:
-                del_count = obj.orderProducts.filter(
-                    status='DEL',
-                    product__store__member=user).distinct().count()
+            del_count = context_scope(self.context).filter(obj.orderProducts.filter(
+                status='DEL'), "product__store").distinct().count()
         else:
             del_count = obj.orderProducts.all().filter(
                 status='DEL').count()
@@ -824,7 +804,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
     def get_shipping_charge(self, obj):
         if obj.coupon and obj.coupon.type == "FS":
             return 0.0
-        return settings.SHIPPING_CHARGE
+        return obj.get_shipping_charge()
 
     def get_address(self, obj):
         if obj.address:
@@ -867,7 +847,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             order.totalPrice = 0
         if order.sub_total < 0:
             order.sub_total = 0
-        order.totalPrice += settings.SHIPPING_CHARGE
+        order.totalPrice += order.get_shipping_charge()
         order.save()
 
     def order_amount_to_reduce(self, order):
@@ -952,14 +932,8 @@ class OrderDetailSerializer(serializers.ModelSerializer):
     def get_total_prod_count(self, obj):
         user = self.context.get("user")
         if user.is_seller:
-            sub_admins = user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                order_prod_count = obj.orderProducts.filter(
-                    product__store=sub_admin.store).distinct().count()
-            else:
-                order_prod_count = obj.orderProducts.filter(
-                    product__store__member=user).distinct().count()
+            order_prod_count = context_scope(self.context).filter(
+                obj.orderProducts, "product__store").distinct().count()
         else:
             order_prod_count = obj.orderProducts.all().count()
         return order_prod_count
@@ -969,14 +943,8 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             order_prods = obj.orderProducts.all()
             user = self.context.get("user")
             if user.is_seller:
-                sub_admins = user.seller_sub_admins.all()
-                if sub_admins.exists():
-                    sub_admin = sub_admins.latest('id')
-                    order_prods = order_prods.filter(
-                        product__store=sub_admin.store).distinct()
-                else:
-                    order_prods = order_prods.filter(
-                        product__store__member=user).distinct()
+                order_prods = context_scope(self.context).filter(
+                    order_prods, "product__store").distinct()
             else:
                 order_prods = order_prods
 
@@ -996,16 +964,8 @@ class OrderDetailSerializer(serializers.ModelSerializer):
     def get_unseen_orders_count(self, obj):
         user = self.context.get("user")
         if user.is_seller:
-            sub_admins = user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                qs = Order.objects.filter(
-                    payments__isnull=False,
-                    orderProducts__product__store=sub_admin.store).distinct()
-            else:
-                qs = Order.objects.filter(
-                    payments__isnull=False,
-                    orderProducts__product__store__member=user).distinct()
+            qs = context_scope(self.context).filter(Order.objects.filter(
+                payments__isnull=False), "orderProducts__product__store").distinct()
         else:
             qs = Order.objects.filter(payments__isnull=False).distinct()
 
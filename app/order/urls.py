@@ -8,7 +8,10 @@ router = DefaultRouter()
 
 urlpatterns = [
     path("order-list/", rest.OrderList.as_view()),
+    path("export-orders/", rest.ExportOrders.as_view()),
     path("order-details/<int:pk>/", rest.OrderDetails.as_view()),
+    path("sales-kpis/", rest.SalesKPIs.as_view()),
+    path("outbox-metrics/", rest.OutboxMetrics.as_view()),
 
     path("", include(router.urls)),
 ]
@@ -0,0 +1,140 @@
+import threading
+
+from app.product.models import Category, CategoryMedia
+from app.store.versions import current_version, bump_version
+
+CATEGORY_TREE_VERSION_KEY = "categories:version"
+CATEGORY_FIELDS = ('id', 'name', 'nameAR', 'parent_id', 'status',
+                   'visible_product_count', 'home_page_thumbnail',
+                   'home_page_thumbnail_ar')
+# Type of each level, from the top
+CATEGORY_TYPES = ("Main Category", "Sub Category", "Product Type", "Sub Product Type")
+
+
+def file_url(model, field_name, name):
+    if not name:
+        return None
+    return model._meta.get_field(field_name).storage.url(name)
+
+
+class CategoryTree:
+    """
+    All categories held in memory with their level, type, name chain and
+    the payload CategorySerializer gives, built from two queries.
+    Categories are ordered by name at every level.
+    """
+
+    def __init__(self, version, rows, medias):
+        self.version = version
+        self.nodes = {row["id"]: row for row in rows}
+        self.children = {}
+        for row in rows:
+            self.children.setdefault(row["parent_id"], []).append(row["id"])
+
+        images = {}
+        for category_id, media_type, media in medias:
+            images.setdefault((category_id, media_type), media)
+        statuses = dict(Category._meta.get_field('status').flatchoices)
+
+        self.payloads = {}
+        for row in rows:
+            self.payloads[row["id"]] = {
+                "id": row["id"],
+                "name": row["name"],
+                "nameAR": row["nameAR"],
+                "image_1": file_url(CategoryMedia, 'media', images.get((row["id"], 'im1'))),
+                "image_2": file_url(CategoryMedia, 'media', images.get((row["id"], 'im2'))),
+                "image_3": file_url(CategoryMedia, 'media', images.get((row["id"], 'im3'))),
+                "status": statuses.get(row["status"], row["status"]),
+                "type": self.category_type(row["id"]),
+                "prods_linked": row["visible_product_count"],
+                "home_page_thumbnail": file_url(
+                    Category, 'home_page_thumbnail', row["home_page_thumbnail"]),
+                "home_page_thumbnail_ar": file_url(
+                    Category, 'home_page_thumbnail_ar', row["home_page_thumbnail_ar"]),
+            }
+
+    def ancestors(self, category_id):
+        seen = set()
+        while category_id in self.nodes and category_id not in seen:
+            seen.add(category_id)
+            yield self.nodes[category_id]
+            category_id = self.nodes[category_id]["parent_id"]
+
+    def level(self, category_id):
+        """0 for a main category, 1 for a sub category and so on."""
+        return len(list(self.ancestors(category_id))) - 1
+
+    def category_type(self, category_id):
+        level = self.level(category_id)
+        if 0 <= level < len(CATEGORY_TYPES):
+            return CATEGORY_TYPES[level]
+        return None
+
+    def name_chain(self, category_id):
+        """Name>Parent>Grand parent, like Category.get_parent_name_chain."""
+        return ">".join([node["name"] for node in self.ancestors(category_id)])
+
+    def at_level(self, level):
+        """Payloads of the categories of one level, ordered by name."""
+        return [self.payloads[category_id] for category_id in self.nodes
+                if self.level(category_id) == level]
+
+    def descendant_ids(self, category_id):
+        """The category and every category below it."""
+        ids = set()
+        pending = [category_id]
+        while pending:
+            category_id = pending.pop()
+            if category_id not in ids:
+                ids.add(category_id)
+                pending.extend(self.children.get(category_id, []))
+        return ids
+
+    def subtree(self, category_id):
+        node = dict(self.payloads[category_id])
+        node["parent"] = self.nodes[category_id]["parent_id"]
+        node["level"] = self.level(category_id)
+        node["parent_name_chain"] = self.name_chain(category_id)
+        node["children"] = [self.subtree(child_id)
+                            for child_id in self.children.get(category_id, [])]
+        return node
+
+    def tree(self):
+        return [self.subtree(category_id) for category_id in self.children.get(None, [])]
+
+
+lock = threading.Lock()
+loaded = {"tree": None}
+
+
+def load_category_tree(version):
+    rows = list(Category.objects.order_by('name').values(*CATEGORY_FIELDS))
+    medias = list(CategoryMedia.objects.order_by('-id').values_list(
+        'category_id', 'type', 'media'))
+    return CategoryTree(version, rows, medias)
+
+
+def get_category_tree(category_id=None):
+    """
+    The tree of the current version. Passing a category reloads the tree
+    when it does not have it yet, a category created in another process
+    within the last version check.
+    """
+    version = current_version(CATEGORY_TREE_VERSION_KEY)
+    tree = loaded["tree"]
+    if tree is None or tree.version != version or (
+            category_id is not None and category_id not in tree.nodes):
+        with lock:
+            tree = loaded["tree"]
+            if tree is None or tree.version != version or (
+                    category_id is not None and category_id not in tree.nodes):
+                tree = load_category_tree(version)
+                loaded["tree"] = tree
+    return tree
+
+
+def invalidate_category_tree():
+    """New version for every process, the tree reloads on next use."""
+    bump_version(CATEGORY_TREE_VERSION_KEY)
+    loaded["tree"] = None
@@ -0,0 +1,173 @@
+from django.db import transaction
+from django.db.models import Count, Q, F, Case, When, Value, IntegerField
+
+from app.product.categories import invalidate_category_tree
+from app.product.models import EcommProduct, Category, Brand
+from app.utilities.helpers import bulk_update
+from app.utilities.transactions import on_commit_once
+
+
+def visible_products(qs=None):
+    """Products the category and brand lists count, as get_prods_linked did."""
+    if qs is None:
+        qs = EcommProduct.objects.all()
+    return qs.annotate(
+        variant_count=Count('productVariantValue', distinct=True)).exclude(
+        Q(variant_count=0, parent__isnull=False)
+        | Q(parent=None, children__isnull=False))
+
+
+def category_parents():
+    return dict(Category.objects.values_list('id', 'parent'))
+
+
+def with_ancestors(category_deltas, parents):
+    """Adds every category delta to its ancestors as well."""
+    deltas = {}
+    for category_id, delta in category_deltas.items():
+        seen = set()
+        while category_id is not None and category_id not in seen:
+            seen.add(category_id)
+            deltas[category_id] = deltas.get(category_id, 0) + delta
+            category_id = parents.get(category_id)
+    return deltas
+
+
+def apply_count_deltas(model, deltas):
+    """Adds {pk: delta} to visible_product_count with one UPDATE."""
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+    model.objects.filter(pk__in=deltas.keys()).update(
+        visible_product_count=F('visible_product_count') + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField()))
+
+
+def count_deltas(rows):
+    """
+    Category and brand deltas of moving products from where they were
+    counted, (is_counted, category, brand), to where they are now.
+    """
+    category_deltas = {}
+    brand_deltas = {}
+    for (was_counted, old_category, old_brand), (counted, category, brand) in rows:
+        if was_counted:
+            category_deltas[old_category] = category_deltas.get(old_category, 0) - 1
+            brand_deltas[old_brand] = brand_deltas.get(old_brand, 0) - 1
+        if counted:
+            category_deltas[category] = category_deltas.get(category, 0) + 1
+            brand_deltas[brand] = brand_deltas.get(brand, 0) + 1
+    return category_deltas, brand_deltas
+
+
+def apply_count_moves(rows):
+    """Applies the counter deltas of (was counted where, counts where) rows."""
+    category_deltas, brand_deltas = count_deltas(rows)
+    if any(category_deltas.values()):
+        apply_count_deltas(Category, with_ancestors(category_deltas, category_parents()))
+        transaction.on_commit(invalidate_category_tree)
+    apply_count_deltas(Brand, brand_deltas)
+
+
+@transaction.atomic
+def update_product_counts(product_ids):
+    """
+    Moves the given products in the category and brand counters from
+    where they were counted to where they count now.
+    """
+    locked = list(EcommProduct.objects.select_for_update().filter(
+        pk__in=product_ids).order_by('id').values_list('id', flat=True))
+    visible = set(visible_products(EcommProduct.objects.filter(
+        pk__in=locked)).values_list('id', flat=True))
+
+    rows = []
+    changed = []
+    for product in EcommProduct.objects.filter(pk__in=locked).only(
+            'id', 'category', 'brand', 'is_counted',
+            'counted_in_category', 'counted_in_brand'):
+        old = (product.is_counted, product.counted_in_category, product.counted_in_brand)
+        new = (product.id in visible, product.category_id, product.brand_id)
+        if not new[0]:
+            new = (False, None, None)
+        if old != new:
+            rows.append((old, new))
+            product.is_counted, product.counted_in_category, product.counted_in_brand = new
+            changed.append(product)
+
+    apply_count_moves(rows)
+    if changed:
+        bulk_update(EcommProduct, changed,
+                    ['is_counted', 'counted_in_category', 'counted_in_brand'])
+
+
+@transaction.atomic
+def remove_product_counts(product_ids):
+    """
+    Takes products about to be deleted out of the counters, reading where
+    they are counted from their locked rows. It runs in the deleting
+    transaction, so rolling the delete back rolls this back too.
+    """
+    apply_count_moves([
+        ((True, category_id, brand_id), (False, None, None))
+        for category_id, brand_id in EcommProduct.objects.select_for_update().filter(
+            pk__in=product_ids, is_counted=True).order_by('id').values_list(
+            'counted_in_category', 'counted_in_brand')])
+
+
+@transaction.atomic
+def move_category_count(category_id, old_parent_id, new_parent_id):
+    """
+    Moves the count of a category's subtree from the ancestors it was
+    under to the ancestors it is under now.
+    """
+    count = Category.objects.select_for_update().filter(
+        pk=category_id).values_list('visible_product_count', flat=True).first()
+    if not count:
+        return
+    parents = category_parents()
+    deltas = with_ancestors({old_parent_id: -count}, parents)
+    for ancestor_id, delta in with_ancestors({new_parent_id: count}, parents).items():
+        deltas[ancestor_id] = deltas.get(ancestor_id, 0) + delta
+    apply_count_deltas(Category, deltas)
+    transaction.on_commit(invalidate_category_tree)
+
+
+def mark_product_counts_changed(product_ids):
+    """Recounts the products once the transaction commits."""
+    on_commit_once("product_counts", product_ids, update_product_counts)
+
+
+@transaction.atomic
+def reconcile_product_counts():
+    """
+    Recounts every product, category and brand from scratch and returns
+    the number of categories and brands whose counter had drifted.
+    """
+    visible = visible_products().values('id')
+    EcommProduct.objects.filter(pk__in=visible).update(
+        is_counted=True, counted_in_category=F('category'),
+        counted_in_brand=F('brand'))
+    EcommProduct.objects.exclude(pk__in=visible).exclude(
+        is_counted=False, counted_in_category=None, counted_in_brand=None
+    ).update(is_counted=False, counted_in_category=None, counted_in_brand=None)
+
+    direct = dict(EcommProduct.objects.filter(
+        is_counted=True, counted_in_category__isnull=False
+    ).values_list('counted_in_category').annotate(count=Count('id')).order_by())
+    category_counts = {category_id: 0 for category_id in category_parents()}
+    category_counts.update(with_ancestors(direct, category_parents()))
+    brand_counts = {brand_id: 0 for brand_id in Brand.objects.values_list('id', flat=True)}
+    brand_counts.update(dict(EcommProduct.objects.filter(
+        is_counted=True, counted_in_brand__isnull=False
+    ).values_list('counted_in_brand').annotate(count=Count('id')).order_by()))
+
+    drifted = 0
+    for model, counts in [(Category, category_counts), (Brand, brand_counts)]:
+        stored = dict(model.objects.values_list('id', 'visible_product_count'))
+        deltas = {pk: count - stored[pk] for pk, count in counts.items()
+                  if pk in stored and stored[pk] != count}
+        apply_count_deltas(model, deltas)
+        drifted += len(deltas)
+    transaction.on_commit(invalidate_category_tree)
+    return drifted
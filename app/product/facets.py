@@ -0,0 +1,349 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+
+from django.utils.timezone import localtime, now
+
+from app.product.categories import get_category_tree
+from app.product.models import EcommProduct, ProductVariantValue, ProductFacetChange
+from app.utilities.transactions import on_commit_once
+
+# Change sets are kept this long, an index idle for half of it rebuilds
+FACETS_CHANGES_TTL = 24 * 60 * 60
+# Past this many pending change sets the index is rebuilt instead
+FACETS_MAX_PENDING = 500
+# Change ids are taken before commit, so a lower id can commit after a
+# higher one. Ids this far back are read again.
+FACETS_CHANGES_LOOKBACK = 100
+FACET_FIELDS = ('id', 'parent_id', 'brand_id', 'store_id', 'category_id', 'status',
+                'created_at', 'important', 'isHiddenFromOrder',
+                # Sort keys of ProductList
+                'name', 'base_price', 'updated_at')
+FACET_DIMENSIONS = ('brand', 'store', 'category', 'status', 'variant_value')
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class Bitmap:
+    """
+    A set of product ids split into chunks of 65536 ids, each chunk a
+    python int used as a bit set, so sparse ids stay small.
+    """
+    __slots__ = ("chunks",)
+
+    def __init__(self, ids=()):
+        self.chunks = {}
+        for product_id in ids:
+            self.add(product_id)
+
+    @classmethod
+    def union(cls, bitmaps):
+        result = cls()
+        for bitmap in bitmaps:
+            for high, bits in bitmap.chunks.items():
+                result.chunks[high] = result.chunks.get(high, 0) | bits
+        return result
+
+    def add(self, product_id):
+        high = product_id >> CHUNK_BITS
+        self.chunks[high] = self.chunks.get(high, 0) | (1 << (product_id & CHUNK_MASK))
+
+    def discard(self, product_id):
+        high = product_id >> CHUNK_BITS
+        bits = self.chunks.get(high, 0) & ~(1 << (product_id & CHUNK_MASK))
+        if bits:
+            self.chunks[high] = bits
+        else:
+            self.chunks.pop(high, None)
+
+    def __contains__(self, product_id):
+        bits = self.chunks.get(product_id >> CHUNK_BITS, 0)
+        return bool(bits >> (product_id & CHUNK_MASK) & 1)
+
+    def __and__(self, other):
+        result = Bitmap()
+        small, large = sorted([self.chunks, other.chunks], key=len)
+        for high, bits in small.items():
+            bits &= large.get(high, 0)
+            if bits:
+                result.chunks[high] = bits
+        return result
+
+    def __or__(self, other):
+        return Bitmap.union([self, other])
+
+    def __len__(self):
+        return sum(popcount(bits) for bits in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        """Ids in ascending order."""
+        for high in sorted(self.chunks):
+            bits = self.chunks[high]
+            base = high << CHUNK_BITS
+            while bits:
+                low = bits & -bits
+                yield base + low.bit_length() - 1
+                bits ^= low
+
+    def intersection_count(self, other):
+        return sum(popcount(bits & other.chunks.get(high, 0))
+                   for high, bits in self.chunks.items())
+
+
+class FacetIndex:
+    """
+    Bitmaps of product ids per brand, store, category, status, variant
+    value and created date, plus the product listings ProductList
+    starts from. Kept current by refreshing the products that changed.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.variant_values = {}
+        self.children = {}
+        self.bitmaps = {dimension: {} for dimension in FACET_DIMENSIONS}
+        self.created = {}
+        self.created_dates = []
+        self.top_level = Bitmap()
+        # Sellers also list their products hidden from orders
+        self.top_level_with_hidden = Bitmap()
+        self.child_listed = Bitmap()
+
+    def build(self):
+        rows = EcommProduct.objects.order_by().values(*FACET_FIELDS).iterator()
+        self.put_rows(rows, ProductVariantValue.objects.filter(
+            variant_value__isnull=False).order_by().values_list(
+            'product', 'variant_value').iterator())
+        self.update_listing(list(self.products))
+
+    def put_rows(self, rows, variant_rows):
+        variant_values = {}
+        for product_id, variant_value_id in variant_rows:
+            variant_values.setdefault(product_id, set()).add(variant_value_id)
+        for row in rows:
+            row["created_at"] = localtime(row["created_at"]).date().toordinal()
+            self.put(row, variant_values.get(row["id"], set()))
+
+    def bitmap(self, dimension, value):
+        bitmaps = self.bitmaps[dimension]
+        if value not in bitmaps:
+            bitmaps[value] = Bitmap()
+        return bitmaps[value]
+
+    def put(self, row, variant_value_ids):
+        product_id = row["id"]
+        self.remove(product_id)
+        self.products[product_id] = row
+        self.variant_values[product_id] = variant_value_ids
+        self.children.setdefault(row["parent_id"], set()).add(product_id)
+        self.bitmap('brand', row["brand_id"]).add(product_id)
+        self.bitmap('store', row["store_id"]).add(product_id)
+        self.bitmap('category', row["category_id"]).add(product_id)
+        self.bitmap('status', row["status"]).add(product_id)
+        for variant_value_id in variant_value_ids:
+            self.bitmap('variant_value', variant_value_id).add(product_id)
+        if row["created_at"] not in self.created:
+            self.created[row["created_at"]] = Bitmap()
+            insort(self.created_dates, row["created_at"])
+        self.created[row["created_at"]].add(product_id)
+
+    def remove(self, product_id):
+        row = self.products.pop(product_id, None)
+        if row is None:
+            return
+        self.children.get(row["parent_id"], set()).discard(product_id)
+        values = [('brand', row["brand_id"]), ('store', row["store_id"]),
+                  ('category', row["category_id"]), ('status', row["status"])]
+        values += [('variant_value', variant_value_id)
+                   for variant_value_id in self.variant_values.pop(product_id, ())]
+        for dimension, value in values:
+            self.bitmaps[dimension][value].discard(product_id)
+            if not self.bitmaps[dimension][value]:
+                del self.bitmaps[dimension][value]
+        self.created[row["created_at"]].discard(product_id)
+        self.top_level.discard(product_id)
+        self.top_level_with_hidden.discard(product_id)
+        self.child_listed.discard(product_id)
+
+    def is_child_listed(self, row):
+        """The is_for_child listing of ProductList, product by product."""
+        if row["isHiddenFromOrder"]:
+            return False
+        parent = self.products.get(row["parent_id"])
+        if row["parent_id"] is not None and not self.variant_values.get(row["id"]):
+            return False
+        if row["parent_id"] is None and self.children.get(row["id"]) and not row["important"]:
+            return False
+        if parent is not None and parent["important"] and not row["important"]:
+            return False
+        return True
+
+    def update_listing(self, product_ids):
+        for product_id in product_ids:
+            row = self.products.get(product_id)
+            if row is None:
+                continue
+            if row["parent_id"] is None and not row["isHiddenFromOrder"]:
+                self.top_level.add(product_id)
+            else:
+                self.top_level.discard(product_id)
+            if row["parent_id"] is None:
+                self.top_level_with_hidden.add(product_id)
+            else:
+                self.top_level_with_hidden.discard(product_id)
+            if self.is_child_listed(row):
+                self.child_listed.add(product_id)
+            else:
+                self.child_listed.discard(product_id)
+
+    def refresh(self, product_ids):
+        """
+        Reloads the given products and their children from the database.
+        Their parents and children are listed again as having children
+        and the important flag decide their place in the listings.
+        """
+        product_ids = set(product_ids)
+        product_ids.update(*[self.children.get(product_id, ()) for product_id in product_ids])
+        affected = set(product_ids)
+        for product_id in product_ids:
+            if product_id in self.products:
+                affected.add(self.products[product_id]["parent_id"])
+            self.remove(product_id)
+
+        rows = list(EcommProduct.objects.filter(
+            pk__in=product_ids).order_by().values(*FACET_FIELDS))
+        self.put_rows(rows, ProductVariantValue.objects.filter(
+            product__in=product_ids, variant_value__isnull=False
+        ).order_by().values_list('product', 'variant_value'))
+        for row in rows:
+            affected.add(row["parent_id"])
+            affected.update(self.children.get(row["id"], ()))
+        self.update_listing(affected)
+
+    def created_between(self, from_date=None, to_date=None):
+        start = bisect_left(self.created_dates, from_date.toordinal()) if from_date else 0
+        end = (bisect_right(self.created_dates, to_date.toordinal())
+               if to_date else len(self.created_dates))
+        return Bitmap.union([self.created[date] for date in self.created_dates[start:end]])
+
+    def search(self, for_child=False, with_hidden=False, from_date=None, to_date=None,
+               **filters):
+        """
+        Product ids matching every filter, and per dimension the count of
+        products each value would match with the other filters applied.
+        Filters are lists of values per dimension, categories match their
+        whole subtree. `with_hidden` keeps the top level products hidden
+        from orders.
+        """
+        if for_child:
+            base = self.child_listed
+        elif with_hidden:
+            base = self.top_level_with_hidden
+        else:
+            base = self.top_level
+        if from_date or to_date:
+            base = base & self.created_between(from_date, to_date)
+
+        tree = get_category_tree()
+        selected = {}
+        for dimension, values in filters.items():
+            if values is None:
+                continue
+            if dimension == 'category':
+                values = set().union(*[tree.descendant_ids(value) for value in values])
+            bitmaps = self.bitmaps[dimension]
+            selected[dimension] = Bitmap.union(
+                [bitmaps[value] for value in values if value in bitmaps])
+
+        matched = base
+        for bitmap in selected.values():
+            matched = matched & bitmap
+
+        facets = {}
+        for dimension in FACET_DIMENSIONS:
+            others = base
+            for other, bitmap in selected.items():
+                if other != dimension:
+                    others = others & bitmap
+            counts = {}
+            for value, bitmap in self.bitmaps[dimension].items():
+                count = others.intersection_count(bitmap)
+                if count and value is not None:
+                    counts[value] = count
+            facets[dimension] = counts
+        facets['category'] = self.category_totals(facets['category'], tree)
+        return matched, facets
+
+    def category_totals(self, counts, tree):
+        """Adds the products of each category to all its ancestors."""
+        totals = {}
+        for category_id, count in counts.items():
+            for node in tree.ancestors(category_id):
+                totals[node["id"]] = totals.get(node["id"], 0) + count
+        return totals
+
+
+lock = threading.Lock()
+loaded = {"index": None, "change_id": 0, "applied": set(), "checked_at": 0}
+
+
+def pending_changes():
+    """Change sets this process has not applied, oldest first."""
+    return [(change_id, product_ids) for change_id, product_ids in
+            ProductFacetChange.objects.filter(
+                id__gt=loaded["change_id"] - FACETS_CHANGES_LOOKBACK
+            ).order_by('id').values_list('id', 'product_ids')[
+                :FACETS_MAX_PENDING + FACETS_CHANGES_LOOKBACK]
+            if change_id not in loaded["applied"]]
+
+
+def get_facet_index():
+    """
+    The index of this process, built on first use and brought up to date
+    with the product changes every process published since.
+    """
+    with lock:
+        index = loaded["index"]
+        if time.monotonic() - loaded["checked_at"] > FACETS_CHANGES_TTL / 2:
+            index = None
+        changes = pending_changes() if index is not None else []
+        if len(changes) > FACETS_MAX_PENDING:
+            index = None
+        if index is None:
+            # Committed before the build, so already in it
+            changes = [(change_id, []) for change_id in ProductFacetChange.objects.order_by(
+                '-id').values_list('id', flat=True)[:FACETS_CHANGES_LOOKBACK]]
+            index = FacetIndex()
+            index.build()
+            loaded["applied"] = set()
+        elif changes:
+            index.refresh(set().union(*[product_ids for change_id, product_ids in changes]))
+
+        for change_id, product_ids in changes:
+            loaded["applied"].add(change_id)
+            loaded["change_id"] = max(loaded["change_id"], change_id)
+        loaded["applied"] = set([change_id for change_id in loaded["applied"]
+                                 if change_id > loaded["change_id"] - FACETS_CHANGES_LOOKBACK])
+        loaded["index"] = index
+        loaded["checked_at"] = time.monotonic()
+    return index
+
+
+def publish_facet_changes(product_ids):
+    """Adds a change set the indexes of all processes apply on next use."""
+    ProductFacetChange.objects.create(product_ids=sorted(product_ids))
+    ProductFacetChange.objects.filter(
+        created_at__lt=now() - timedelta(seconds=FACETS_CHANGES_TTL)).delete()
+
+
+def mark_facets_changed(product_ids):
+    """Publishes the products to the facet indexes once the transaction commits."""
+    on_commit_once("facets", product_ids, publish_facet_changes)
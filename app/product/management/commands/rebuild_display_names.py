@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.product.names import rebuild_display_names
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the stored display names and variant labels of every product"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_display_names(batch_size=options["batch_size"])
+        self.stdout.write("Rebuilt names of %s products" % rebuilt)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.product.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the search tokens of every product, brand and store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_search_index(batch_size=options["batch_size"])
+        self.stdout.write("Rebuilt search tokens of %s products, brands and stores" % rebuilt)
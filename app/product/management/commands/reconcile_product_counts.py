@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.product.counts import reconcile_product_counts
+
+
+class Command(BaseCommand):
+    help = "Recounts the visible products of every category and brand and repairs drifted counters"
+
+    def handle(self, *args, **options):
+        drifted = reconcile_product_counts()
+        self.stdout.write("Repaired %s counters" % drifted)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils.timezone import now
+
+from app.product.models import Coupon
+from app.utilities.fcm import fan_out_push, FCM_BATCH_SIZE, FCM_WORKERS
+
+
+class Command(BaseCommand):
+    help = "Sends the push notification of coupons that are due, to every matching device"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int,
+                            default=FCM_BATCH_SIZE)
+        parser.add_argument("--workers", dest="workers", type=int,
+                            default=FCM_WORKERS)
+        parser.add_argument(
+            "--backfill", action="store_true", dest="backfill",
+            help="Mark the coupons created so far as pushed, without sending. "
+                 "Run once before the first scheduled run.")
+
+    def handle(self, *args, **options):
+        if options["backfill"]:
+            count = Coupon.objects.filter(
+                push_sent_at__isnull=True).update(push_sent_at=now())
+            self.stdout.write("Marked %s coupons as pushed" % count)
+            return
+
+        current_time = now()
+        coupons = Coupon.objects.filter(
+            Q(send_push_immediately=True)
+            | Q(push_notification_schedule_date__lte=current_time),
+            Q(active_start_date__isnull=True) | Q(active_start_date__lte=current_time),
+            Q(active_end_date__isnull=True) | Q(active_end_date__gte=current_time),
+            push_sent_at__isnull=True
+        ).exclude(status='IN')
+
+        for coupon in coupons:
+            # Mark first so an overlapping run does not push the coupon twice
+            claimed = Coupon.objects.filter(
+                pk=coupon.pk, push_sent_at__isnull=True
+            ).update(push_sent_at=now())
+            if not claimed:
+                continue
+
+            title, body = coupon.get_push_message()
+            title_ar, body_ar = coupon.get_push_message("ar")
+            stats = fan_out_push(
+                coupon.get_push_devices(), title, body,
+                data={"type": "coupon", "coupon_id": coupon.id,
+                      "code": coupon.code, "title_ar": title_ar,
+                      "body_ar": body_ar},
+                batch_size=options["batch_size"],
+                workers=options["workers"])
+            self.stdout.write(
+                "%s: %s sent, %s failed, %s tokens deactivated in %s batches" % (
+                    coupon.code, stats["sent"], stats["failed"],
+                    stats["deactivated"], stats["batches"]))
@@ -1,9 +1,11 @@
+from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 
 # Create your models here.
 from django.db.models import CASCADE, Sum, F, Avg, Count, Q
 from django.utils.timezone import now
+from fcm_django.models import FCMDevice
 from parler.models import TranslatableModel, TranslatedFields
 
 from django.utils.translation import gettext as _
@@ -11,11 +13,34 @@ from django.utils.translation import gettext as _
 from app.authentication.models import Member
 from app.order.models import Order
 from app.product.managers import CategoryQuerySet
+from app.product.utils import floating_decimals
 from app.store.models import InventoryProduct
 from app.utilities.helpers import convert_date_time_to_kuwait_string, datetime_from_utc_to_local_new
 
 
-class EcommProduct(models.Model):
+class MaintainedFieldsMixin:
+    """
+    Leaves `maintained_fields` out of full saves of existing rows. They
+    are only written by the bulk updates that maintain them, and saving a
+    copy loaded earlier would write back stale values.
+    """
+    maintained_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args \
+                and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.maintained_fields]
+        super().save(*args, **kwargs)
+
+
+class EcommProduct(MaintainedFieldsMixin, models.Model):
+    # Kept by app.product.names and app.product.counts
+    maintained_fields = ('display_name', 'display_name_ar', 'variant_label',
+                         'variant_label_ar', 'is_counted', 'counted_in_category',
+                         'counted_in_brand')
+
     STATUS_CHOICES = (
         ('AC', 'Active'),
         ('INR', 'InReview'),
@@ -30,6 +55,12 @@ class EcommProduct(models.Model):
         max_length=255, blank=True, null=True)
     nameAR = models.CharField(
         max_length=255, blank=True, null=True)
+    # Name with the variant values and "Variant:Value" labels, kept by
+    # app.product.names, None until built
+    display_name = models.TextField(blank=True, null=True)
+    display_name_ar = models.TextField(blank=True, null=True)
+    variant_label = models.TextField(blank=True, null=True)
+    variant_label_ar = models.TextField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     descriptionAR = models.TextField(blank=True, null=True)
     size_guide = models.TextField(blank=True, null=True)
@@ -106,6 +137,12 @@ class EcommProduct(models.Model):
         upload_to='ecomm_products/medias', blank=True, null=True
     )
 
+    # Where the product was last counted in visible_product_count, kept
+    # by app.product.counts
+    is_counted = models.BooleanField(default=False)
+    counted_in_category = models.IntegerField(blank=True, null=True)
+    counted_in_brand = models.IntegerField(blank=True, null=True)
+
     def __str__(self):
         if self.name:
             return "-".join([self.name, str(self.id)])
@@ -129,6 +166,8 @@ class EcommProduct(models.Model):
         return True
 
     def get_name(self):
+        if self.display_name is not None:
+            return self.display_name
         var_vals_list = VariantValues.objects.filter(
             pk__in=self.variant_value_ids()
         ).values_list('value', flat=True)
@@ -138,6 +177,8 @@ class EcommProduct(models.Model):
         return var_string
 
     def get_name_AR(self):
+        if self.display_name_ar is not None:
+            return self.display_name_ar
         var_vals_list = VariantValues.objects.filter(
             pk__in=self.variant_value_ids()
         ).values_list('valueAR', flat=True)
@@ -146,6 +187,20 @@ class EcommProduct(models.Model):
             return "".join([self.nameAR, "-", var_string])
         return var_string
 
+    def get_variant_values_string(self, lang_code=""):
+        """The variant values joined with commas, without the name."""
+        if lang_code == "ar":
+            name, display_name, field = self.nameAR, self.display_name_ar, 'valueAR'
+        else:
+            name, display_name, field = self.name, self.display_name, 'value'
+        if display_name is None:
+            return ",".join(list(VariantValues.objects.filter(
+                pk__in=self.variant_value_ids()
+            ).values_list(field, flat=True)))
+        if name and name != "":
+            return display_name[len(name) + 1:]
+        return display_name
+
     def get_variants(self):
         variant_list = VariantValues.objects.filter(
             pk__in=self.variant_value_ids()
@@ -171,6 +226,8 @@ class EcommProduct(models.Model):
         # return [var_val.variant.id for var_val in self.variant_values.all()]
 
     def get_variant_string(self):
+        if self.variant_label is not None:
+            return self.variant_label
         variant_value_list = VariantValues.objects.filter(
             pk__in=self.variant_value_ids()
         )
@@ -185,6 +242,8 @@ class EcommProduct(models.Model):
         return var_string
 
     def get_variant_string_ar(self):
+        if self.variant_label_ar is not None:
+            return self.variant_label_ar
         variant_value_list = VariantValues.objects.filter(
             pk__in=self.variant_value_ids()
         )
@@ -202,11 +261,8 @@ class EcommProduct(models.Model):
         return self.parent if self.parent else self
 
     def get_avail_qty(self):
-        inv_store_prod = self.inventoryProducts.filter(
-            inventory__store=self.store)
-        if inv_store_prod.exists():
-            return inv_store_prod.first().quantity
-        return 0
+        from app.store.allocation import available_quantities
+        return available_quantities([self.pk]).get(self.pk, 0)
 
     def get_inventory_avail_count(self):
         child_qty = InventoryProduct.objects.filter(
@@ -358,7 +414,42 @@ class SearchKeyWordAR(models.Model):
         ordering = ("id", )
 
 
-class Category(models.Model):
+class ProductFacetChange(models.Model):
+    """Products changed together, replayed by every process's facet index."""
+    product_ids = ArrayField(models.IntegerField(), default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ('id',)
+
+    def __str__(self):
+        return ' - '.join([str(self.id), str(self.created_at)])
+
+
+class SearchToken(models.Model):
+    """
+    One normalized word of a product, brand or store and how much it
+    counts in the ranking. Kept by app.product.search.
+    """
+    KIND_CHOICES = (
+        ('product', 'Product'),
+        ('brand', 'Brand'),
+        ('store', 'Store'),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    # db_index also gives the pattern index startswith uses on postgres
+    token = models.CharField(max_length=64, db_index=True)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    def __str__(self):
+        return "-".join([self.kind, str(self.object_id), self.token])
+
+    class Meta:
+        indexes = [models.Index(fields=['kind', 'object_id'])]
+
+
+class Category(MaintainedFieldsMixin, models.Model):
     name = models.CharField(max_length=255)
     nameAR = models.CharField(max_length=255)
     ordering_id = models.PositiveIntegerField(
@@ -402,6 +493,11 @@ class Category(models.Model):
         "store.SellerPageItems", related_name="categories",
         blank=True, default=None)
 
+    # Listable products of the category and its subcategories
+    visible_product_count = models.IntegerField(default=0)
+    # Kept by app.product.counts
+    maintained_fields = ('visible_product_count',)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -433,7 +529,7 @@ class Category(models.Model):
         verbose_name_plural = 'categories'
 
 
-class Brand(models.Model):
+class Brand(MaintainedFieldsMixin, models.Model):
     name = models.CharField(max_length=255)
     nameAR = models.CharField(max_length=255)
     image = models.ImageField(
@@ -455,6 +551,10 @@ class Brand(models.Model):
         blank=True, null=True,
         on_delete=CASCADE)
 
+    visible_product_count = models.IntegerField(default=0)
+    # Kept by app.product.counts
+    maintained_fields = ('visible_product_count',)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -687,6 +787,7 @@ class ProductCollection(models.Model):
     STATUS_CHOICES = (
         ('AC', 'Active'),
         ('IN', 'In-Active'),
+        ('SC', 'Scheduled'),
     )
     status = models.CharField(
         max_length=2, default='AC',
@@ -794,6 +895,8 @@ class Coupon(models.Model):
     send_push_immediately = models.BooleanField(default=False)
     push_notification_schedule_date = models.DateTimeField(
         blank=True, null=True)
+    push_sent_at = models.DateTimeField(
+        blank=True, null=True)
     reason = models.TextField(
         max_length=255, blank=True, null=True)
 
@@ -816,6 +919,41 @@ class Coupon(models.Model):
     class Meta:
         ordering = ("-id", )
 
+    def get_push_devices(self):
+        devices = FCMDevice.objects.filter(active=True)
+        if self.is_for_specific_customers:
+            return devices.filter(user__in=self.customers.all())
+        if self.is_for_customers_with_no_orders:
+            return devices.filter(user__isnull=False).exclude(
+                user__orders__payments__status='SU')
+        return devices
+
+    def get_push_message(self, lang_code=""):
+        if lang_code == "ar":
+            if self.type == "FS":
+                body = "استخدم الرمز %s للحصول على شحن مجاني" % self.code
+            elif self.type == "PER":
+                body = "استخدم الرمز %s للحصول على خصم %s%%" % (
+                    self.code, floating_decimals(self.deductable_percentage, 0))
+            elif self.type == "FA":
+                body = "استخدم الرمز %s للحصول على خصم %s د.ك" % (
+                    self.code, floating_decimals(self.deductable_amount, 3))
+            else:
+                body = "استخدم الرمز %s في طلبك القادم" % self.code
+            return "كوبون جديد", body
+
+        if self.type == "FS":
+            body = "Use code %s for free shipping" % self.code
+        elif self.type == "PER":
+            body = "Use code %s to get %s%% off" % (
+                self.code, floating_decimals(self.deductable_percentage, 0))
+        elif self.type == "FA":
+            body = "Use code %s to get %s KD off" % (
+                self.code, floating_decimals(self.deductable_amount, 3))
+        else:
+            body = "Use code %s on your next order" % self.code
+        return "New Coupon", body
+
     def date_condition(self):
         if self.active_end_date and self.active_start_date:
             if self.active_start_date <= now() <= self.active_end_date:
@@ -952,7 +1090,9 @@ class Coupon(models.Model):
         return True
 
     def is_applicable_to_cart(self, cart):
-        conditions = [self.status == "AC" or self.status == "SC",
+        # The status scheduler keeps the status in step with the active
+        # window; the dates are still checked in case it runs late.
+        conditions = [self.status == "AC",
                       self.date_condition(),
                       self.prod_condition(cart),
                       self.purchase_amt_condition(cart),
@@ -0,0 +1,75 @@
+from app.product.models import EcommProduct, ProductVariantValue
+from app.utilities.helpers import bulk_update
+from app.utilities.transactions import on_commit_once
+
+DISPLAY_NAME_FIELDS = ('display_name', 'display_name_ar', 'variant_label', 'variant_label_ar')
+
+
+def join_name(name, values):
+    """Same as EcommProduct.get_name: "name-value,value" or the values."""
+    var_string = ",".join(values)
+    if name and name != "":
+        return "".join([name, "-", var_string])
+    return var_string
+
+
+def variant_values_by_product(product_ids):
+    """
+    {product id: [(value, valueAR, variant name, variant nameAR)]} in the
+    order VariantValues lists them, each value once, in one query.
+    """
+    rows = ProductVariantValue.objects.filter(
+        product__in=product_ids, variant_value__isnull=False
+    ).order_by('product', '-variant_value_id').values_list(
+        'product', 'variant_value_id',
+        'variant_value__value', 'variant_value__valueAR',
+        'variant_value__variant__name', 'variant_value__variant__nameAR')
+    values = {}
+    seen = set()
+    for product_id, variant_value_id, value, value_ar, variant, variant_ar in rows:
+        if (product_id, variant_value_id) in seen:
+            continue
+        seen.add((product_id, variant_value_id))
+        values.setdefault(product_id, []).append(
+            (value, value_ar, variant or "", variant_ar or ""))
+    return values
+
+
+def display_names(product, values):
+    return {
+        "display_name": join_name(product.name, [row[0] for row in values]),
+        "display_name_ar": join_name(product.nameAR, [row[1] for row in values]),
+        "variant_label": ",".join([row[2] + ":" + row[0] for row in values]),
+        "variant_label_ar": ",".join([row[3] + ":" + row[1] for row in values]),
+    }
+
+
+def refresh_display_names(product_ids):
+    """Rebuilds the stored names of the products with two queries per batch."""
+    products = list(EcommProduct.objects.filter(
+        pk__in=product_ids).only('id', 'name', 'nameAR'))
+    if not products:
+        return 0
+    values = variant_values_by_product([product.id for product in products])
+    for product in products:
+        for field, value in display_names(product, values.get(product.id, [])).items():
+            setattr(product, field, value)
+    return bulk_update(EcommProduct, products, DISPLAY_NAME_FIELDS)
+
+
+def mark_display_names_changed(product_ids):
+    """Rebuilds the display names of the products once the transaction commits."""
+    on_commit_once("display_names", product_ids, refresh_display_names)
+
+
+def rebuild_display_names(batch_size=1000):
+    last_id = 0
+    rebuilt = 0
+    while True:
+        product_ids = list(EcommProduct.objects.filter(
+            id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not product_ids:
+            return rebuilt
+        refresh_display_names(product_ids)
+        last_id = product_ids[-1]
+        rebuilt += len(product_ids)
@@ -14,20 +14,26 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.files import File
 from django.core.files.temp import NamedTemporaryFile
 from django.db.models import Q, Count, F, Sum
+from django.http import Http404
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 from rest_framework import viewsets, status, generics
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.generics import CreateAPIView, ListAPIView, get_object_or_404, UpdateAPIView, DestroyAPIView, \
     RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from app.authentication.authentication import CachedTokenAuthentication
 from app.authentication.models import Member
 from app.authentication.permissions import IsSuperAdminOrSeller, IsSuperAdminOrObjectSeller, IsSuperAdmin
+from app.authentication.scope import SellerScopeMixin, get_seller_scope
+from app.product.categories import get_category_tree, invalidate_category_tree
+from app.product.facets import get_facet_index
 from app.product.models import Brand, Category, CategoryMedia, EcommProduct, EcommProductMedia, \
     EcommProductRatingandReview, ProductCollection, SearchKeyWord, SearchKeyWordAR, ProductVariantValue, VariantValues, \
     Variant, ProductSpecification, ProductCollectionCond, Coupon, Discount
+from app.product.search import ranked_search, search_ranks
 from app.product.serializers import BrandListSerializer, BrandSerializer, AddEditBrandSerializer, \
     CategoryListSerializer, AddEditCategorySerializer, CategorySerializer, AddSubCategorySerializer, \
     ProductListSerializer, AddEditProductSerializer, ProductDetailSerializer, EditProductSerializer, \
@@ -54,12 +60,7 @@ class BrandList(ListAPIView):
         return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "brand", search_string)
 
     def get_serializer_context(self):
         return {"user": self.request.user,
@@ -99,11 +100,9 @@ class BrandList(ListAPIView):
             if sort_by == "ZTOA":
                 qs = qs.order_by('-name')
             if sort_by == "prod_high_to_low":
-                qs = qs.annotate(prod_count=Count(
-                    'products')).order_by('-prod_count')
+                qs = qs.order_by('-visible_product_count')
             if sort_by == "prod_low_to_high":
-                qs = qs.annotate(prod_count=Count(
-                    'products')).order_by('prod_count')
+                qs = qs.order_by('visible_product_count')
         return qs
 
     def post(self, request, *args, **kwargs):
@@ -119,12 +118,7 @@ class BrandListFilter(ListAPIView):
         return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "brand", search_string)
 
     def get_serializer_context(self):
         return {"user": self.request.user,
@@ -164,11 +158,9 @@ class BrandListFilter(ListAPIView):
             if sort_by == "ZTOA":
                 qs = qs.order_by('-name')
             if sort_by == "prod_high_to_low":
-                qs = qs.annotate(prod_count=Count(
-                    'products')).order_by('-prod_count')
+                qs = qs.order_by('-visible_product_count')
             if sort_by == "prod_low_to_high":
-                qs = qs.annotate(prod_count=Count(
-                    'products')).order_by('prod_count')
+                qs = qs.order_by('visible_product_count')
         return qs
 
     def post(self, request, *args, **kwargs):
@@ -195,12 +187,12 @@ class AddBrand(CreateAPIView):
     def set_logo(self, request, obj):
         for attach in request.FILES.getlist('logo'):
             obj.image = attach
-            obj.save()
+            obj.save(update_fields=['image', 'updated_at'])
 
     def set_cover(self, request, obj):
         for attach in request.FILES.getlist('cover'):
             obj.cover = attach
-            obj.save()
+            obj.save(update_fields=['cover', 'updated_at'])
 
     def add_seller(self, request, brand):
         try:
@@ -208,14 +200,13 @@ class AddBrand(CreateAPIView):
         except ObjectDoesNotExist:
             seller = None
         brand.seller = seller
-        brand.save()
+        brand.save(update_fields=['seller', 'updated_at'])
 
     def create(self, request, *args, **kwargs):
         serializer = AddEditBrandSerializer(data=request.data)
         if serializer.is_valid():
             brand = serializer.save()
             self.add_seller(request, brand)
-            brand.save()
             self.set_logo(request, brand)
             self.set_cover(request, brand)
             create_invalidation()
@@ -227,7 +218,7 @@ class AddBrand(CreateAPIView):
 
 
 class EditBrand(UpdateAPIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsSuperAdmin,)
     serializer_class = BrandSerializer
     queryset = Brand.objects.all()
@@ -298,12 +289,13 @@ class ChangeBrandStatus(APIView):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class CategoryList(ListAPIView):
+class CategoryList(SellerScopeMixin, ListAPIView):
     permission_classes = [IsSuperAdminOrSeller]
     serializer_class = CategorySerializer
 
     def get_serializer_context(self):
         return {"user": self.request.user,
+                "seller_scope": self.request.seller_scope,
                 "lang_code": self.request.query_params.get("lang_code", "")}
 
     def get_queryset(self):
@@ -311,21 +303,8 @@ class CategoryList(ListAPIView):
             qs = Category.objects.filter(
                 parent__isnull=True)
         else:
-            try:
-                store = self.request.user.stores
-                qs = Category.objects.filter(
-                    parent__isnull=True,
-                    pk__in=store.selling_categories.all())
-            except ObjectDoesNotExist:
-                sub_admins = self.request.user.seller_sub_admins.all()
-                if sub_admins.exists():
-                    sub_admin = sub_admins.latest('id')
-                    store = sub_admin.store
-                    qs = Category.objects.filter(
-                        parent__isnull=True,
-                        pk__in=store.selling_categories.all())
-                else:
-                    qs = Category.objects.none()
+            qs = self.request.seller_scope.filter(Category.objects.filter(
+                parent__isnull=True), "store_selling_categories")
         return qs
 
 
@@ -339,21 +318,8 @@ class CategoryListUnPaginated(APIView):
             qs = Category.objects.filter(
                 parent__isnull=True)
         else:
-            try:
-                store = self.request.user.stores
-                qs = Category.objects.filter(
-                    parent__isnull=True,
-                    pk__in=store.selling_categories.all())
-            except ObjectDoesNotExist:
-                sub_admins = self.request.user.seller_sub_admins.all()
-                if sub_admins.exists():
-                    sub_admin = sub_admins.latest('id')
-                    store = sub_admin.store
-                    qs = Category.objects.filter(
-                        parent__isnull=True,
-                        pk__in=store.selling_categories.all())
-                else:
-                    qs = Category.objects.none()
+            qs = get_seller_scope(self.request.user).filter(Category.objects.filter(
+                parent__isnull=True), "store_selling_categories")
         return Response(CategorySerializer(
             qs, many=True, context={'user': self.request.user,
                                     'lang_code': lang_code}).data)
@@ -373,6 +339,9 @@ class SubCategoryList(ListAPIView):
         )
         return qs
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_category_tree().at_level(1))
+
 
 class ProductTypeList(ListAPIView):
     permission_classes = [IsSuperAdminOrSeller]
@@ -388,6 +357,9 @@ class ProductTypeList(ListAPIView):
         )
         return qs
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_category_tree().at_level(2))
+
 
 class SubProductTypeList(ListAPIView):
     permission_classes = [IsSuperAdminOrSeller]
@@ -404,6 +376,24 @@ class SubProductTypeList(ListAPIView):
         )
         return qs
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_category_tree().at_level(3))
+
+
+class CategoryTreeList(APIView):
+    permission_classes = [IsSuperAdminOrSeller]
+
+    def get(self, request, *args, **kwargs):
+        tree = get_category_tree()
+        quoted_etag = '"%s"' % tree.version
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if quoted_etag in [tag.strip().lstrip("W/") for tag in if_none_match.split(",")]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(tree.tree())
+        response["ETag"] = quoted_etag
+        return response
+
 
 class CategoryDetail(RetrieveAPIView):
     permission_classes = [IsSuperAdmin]
@@ -573,7 +563,7 @@ class AddSubCategory(CreateAPIView):
         if serializer.is_valid():
             category = serializer.save()
             category.parent = parent
-            category.save()
+            category.save(update_fields=['parent', 'updated_at'])
             create_invalidation()
             return Response(
                 CategorySerializer(category).data,
@@ -610,13 +600,14 @@ class ChangeCatStatus(APIView):
 
         if status != "":
             category.status = cat_status
-            category.save()
+            category.save(update_fields=['status', 'updated_at'])
             descendants = Category.objects.descendants(
                 category
             )
             descendants.update(
                 status=cat_status
             )
+            invalidate_category_tree()
             create_invalidation()
             return Response(
                 CategorySerializer(category).data,
@@ -627,213 +618,187 @@ class ChangeCatStatus(APIView):
             status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProductList(ListAPIView):
-    permission_classes = [IsSuperAdminOrSeller]
-    serializer_class = ProductListSerializer
-    http_method_names = [u'get', u'post']
-
-    def _allowed_methods(self):
-        return [m.upper() for m in self.http_method_names if hasattr(self, m)]
-
-    def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-                | Q(store__name__icontains=qstring)
-                | Q(store__nameAR__icontains=qstring)
-                | Q(brand__name__icontains=qstring)
-                | Q(brand__nameAR__icontains=qstring)
-                | Q(category__name__icontains=qstring)
-                | Q(category__nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+class ProductFacetMixin:
+    """
+    Resolves the ProductList filters with the catalogue facet index,
+    giving the matching product ids and the facet counts.
+    """
+    product_statuses = {"InReview": 'INR', "Active": 'AC', "Draft": 'DR', "Declined": 'DE'}
 
-    def get_serializer_context(self):
-        return {"user": self.request.user,
-                "lang_code": self.request.query_params.get("lang_code", "")}
+    def id_list(self, value):
+        has_values, values = json_list(value)
+        if not has_values:
+            return None
+        return set([int(item) for item in values])
 
-    def get_queryset(self):
-        search_string = self.request.query_params.get("search_string", "")
+    def facet_search(self):
         product_status = self.request.query_params.get("product_status", "")
         brand_id = self.request.query_params.get("brand_id", "")
-        sort_by = self.request.query_params.get("sort_by", "")
-        seller_ids = self.request.data.get("seller_ids", "")
-        category_ids = self.request.data.get("category_ids", "")
+        seller_ids = self.id_list(self.request.data.get("seller_ids", ""))
+        category_ids = self.id_list(self.request.data.get("category_ids", ""))
+        variant_value_ids = self.id_list(self.request.data.get("variant_value_ids", ""))
+        brand_ids = self.id_list(self.request.data.get("brand_ids", None))
         days = self.request.data.get("days", None)
         from_date = self.request.data.get("from_date", None)
         to_date = self.request.data.get("to_date", None)
-        brand_ids = self.request.data.get("brand_ids", None)
         is_for_child = self.request.data.get("is_for_child", False)
 
-        print("product_list_test")
+        if brand_id != "" and brand_id != "0":
+            brand_ids = set([int(brand_id)]) & (brand_ids or set([int(brand_id)]))
+
+        if seller_ids is not None and len(seller_ids) == 1:
+            seller = Store.objects.filter(pk__in=seller_ids).first()
+            if seller is not None and seller.name == "Becon (All products)":
+                seller_ids = None
+        scope = get_seller_scope(self.request.user)
         if self.request.user.is_seller:
-            if str2bool(is_for_child):
-                sub_admins = self.request.user.seller_sub_admins.all()
-                if sub_admins.exists():
-                    sub_admin = sub_admins.latest('id')
-                    qs = EcommProduct.objects.filter(
-                        store=sub_admin.store,
-                        isHiddenFromOrder=False).annotate(
-                        variant_count=Count('productVariantValue', distinct=True)).exclude(
-                        Q(variant_count=0, parent__isnull=False) |
-                        Q(parent=None, children__isnull=False, important=False) |
-                        Q(parent__important=True, important=False))
-                else:
-                    qs = EcommProduct.objects.filter(
-                        store__member=self.request.user,
-                        isHiddenFromOrder=False).annotate(
-                        variant_count=Count('productVariantValue', distinct=True)).exclude(
-                        Q(variant_count=0, parent__isnull=False) |
-                        Q(parent=None, children__isnull=False, important=False) |
-                        Q(parent__important=True, important=False))
+            own_store = set([scope.store_id]) if scope.store_id is not None else set()
+            seller_ids = own_store if seller_ids is None else seller_ids & own_store
 
-            else:
-                sub_admins = self.request.user.seller_sub_admins.all()
-                if sub_admins.exists():
-                    sub_admin = sub_admins.latest('id')
-                    qs = EcommProduct.objects.filter(
-                        parent__isnull=True,
-                        store=sub_admin.store)
-                else:
-                    qs = EcommProduct.objects.filter(
-                        parent__isnull=True,
-                        store__member=self.request.user)
-        else:
-            if str2bool(is_for_child):
-                qs = EcommProduct.objects.filter(
-                    isHiddenFromOrder=False).annotate(
-                    variant_count=Count('productVariantValue', distinct=True)).exclude(
-                        Q(variant_count=0, parent__isnull=False) |
-                        Q(parent=None, children__isnull=False, important=False) |
-                        Q(parent__important=True, important=False))
-                # qs = qs.filter(parent__isnull=False)
-            else:
-                qs = EcommProduct.objects.filter(
-                    isHiddenFromOrder=False, parent__isnull=True)
+        if category_ids is not None:
+            for cat_id in category_ids:
+                if cat_id not in get_category_tree(cat_id).nodes:
+                    raise Http404
 
-        if brand_id != "" and brand_id != 0:
-            if self.request.user.is_seller:
-                qs = qs.filter(
-                    store__member=self.request.user,
-                    brand__pk=brand_id).distinct()
-            else:
-                qs = qs(
-                    brand__pk=brand_id).distinct()
+        dates_from = []
+        dates_to = []
+        if days == 0 or days:
+            date_selected = now() - timedelta(days=int(days))
+            dates_from.append(date_selected.date())
+        if from_date and to_date and parse_date(from_date) and parse_date(to_date):
+            dates_from.append(parse_date(from_date))
+            dates_to.append(parse_date(to_date))
 
-        if brand_ids != "" and json_list(brand_ids)[0]:
-            qs = qs.filter(
-                brand__pk__in=json_list(brand_ids)[1]).distinct()
+        statuses = None
+        if product_status in self.product_statuses:
+            statuses = [self.product_statuses[product_status]]
 
-        if seller_ids != "" and json_list(seller_ids)[0]:
-            if len(json_list(seller_ids)[1]) == 1:
-                seller_id = json_list(seller_ids)[1][0]
-                try:
-                    seller = Store.objects.get(
-                        pk=seller_id
-                    )
-                except Store.DoesNotExist:
-                    seller = None
-                if seller.name != "Becon (All products)":
-                    qs = qs.filter(
-                        store__in=json_list(seller_ids)[1]
-                    ).distinct()
-            else:
-                qs = qs.filter(
-                    store__in=json_list(seller_ids)[1]
-                ).distinct()
+        return get_facet_index().search(
+            for_child=str2bool(is_for_child),
+            with_hidden=self.request.user.is_seller,
+            from_date=max(dates_from) if dates_from else None,
+            to_date=min(dates_to) if dates_to else None,
+            brand=brand_ids, store=seller_ids, category=category_ids,
+            status=statuses, variant_value=variant_value_ids)
 
-        if category_ids != "" and json_list(category_ids)[0]:
-            descendants_all = []
-            for cat_id in json_list(category_ids)[1]:
-                descendants = Category.objects.descendants(
-                    get_object_or_404(Category, pk=cat_id)).values_list(
-                    'id', flat=True).distinct()
-                for descendant in descendants:
-                    if descendant not in descendants_all:
-                        descendants_all.append(descendant)
 
-            qs = qs.filter(
-                category__pk__in=descendants_all
-            ).distinct()
+class ProductList(SellerScopeMixin, ProductFacetMixin, ListAPIView):
+    permission_classes = [IsSuperAdminOrSeller]
+    serializer_class = ProductListSerializer
+    queryset = EcommProduct.objects.all()
+    http_method_names = [u'get', u'post']
 
-        if days == 0 or days:
-            date_selected = now() - timedelta(days=int(days))
-            qs = qs.filter(created_at__date__gte=date_selected.date())
+    def _allowed_methods(self):
+        return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
-        if from_date and to_date:
-            qs = qs.filter(
-                created_at__date__gte=from_date,
-                created_at__date__lte=to_date)
+    # sort_by: (facet index field, descending)
+    sort_fields = {
+        "PRODUCTATOZ": ("name", False),
+        "PRODUCTZTOA": ("name", True),
+        "SELLERATOZ": ("store_id", False),
+        "SELLERZTOA": ("store_id", True),
+        "PRICELOWTOHIGH": ("base_price", False),
+        "PRICEHIGHTOLOW": ("base_price", True),
+        "MODOLDFIRST": ("updated_at", False),
+        "MODNEWFIRST": ("updated_at", True),
+        "ADDOLDFIRST": ("created_at", False),
+        "ADDNEWFIRST": ("created_at", True),
+        "INVLOWTOHIGH": ("inventory", False),
+        "INVHIGHTOLOW": ("inventory", True),
+    }
 
-        if product_status == "InReview":
-            qs = qs.filter(status='INR')
-        if product_status == "Active":
-            qs = qs.filter(status='AC')
-        if product_status == "Draft":
-            qs = qs.filter(status='DR')
-        if product_status == "Declined":
-            qs = qs.filter(status='DE')
-        if search_string != "":
-            qs = self.search(qs, search_string)
+    def get_serializer_context(self):
+        return {"user": self.request.user,
+                "seller_scope": self.request.seller_scope,
+                "lang_code": self.request.query_params.get("lang_code", "")}
 
-        if sort_by != "":
-            if sort_by == "PRODUCTATOZ":
-                qs = qs.order_by('name')
-            if sort_by == "PRODUCTZTOA":
-                qs = qs.order_by('-name')
+    def sort_values(self, field):
+        """Values `field` sorts on that the index rows do not hold."""
+        if field == "store_id":
+            return dict(Store.objects.values_list('id', 'name'))
+        if field == "inventory":
+            # EcommProduct.get_inventory_avail_count of every parent at once
+            return dict(InventoryProduct.objects.filter(
+                product__parent__isnull=False).order_by().values_list(
+                'product__parent').annotate(quantity=Sum('quantity')))
+        return None
+
+    def sort(self, product_ids, sort_by):
+        field, descending = self.sort_fields[sort_by]
+        rows = get_facet_index().products
+        values = self.sort_values(field)
+
+        def key(pk):
+            if field == "inventory":
+                value = values.get(pk, 0)
+            elif field == "store_id":
+                value = values.get(rows[pk]["store_id"]) if pk in rows else None
+            elif field == "created_at":
+                # The index keeps the day, the id orders the day's products
+                value = (rows[pk]["created_at"], pk) if pk in rows else None
+            else:
+                value = rows[pk][field] if pk in rows else None
+            # Empty values go last from low to high and first from high to low
+            return (True, 0) if value is None else (False, value)
 
-            if sort_by == "SELLERZTOA":
-                qs = qs.order_by('-store__name')
-            if sort_by == "SELLERATOZ":
-                qs = qs.order_by('store__name')
+        return sorted(product_ids, key=key, reverse=descending)
 
-            if sort_by == "PRICEHIGHTOLOW":
-                qs = qs.order_by('-base_price')
-            if sort_by == "PRICELOWTOHIGH":
-                qs = qs.order_by('base_price')
+    def product_ids(self):
+        """
+        Ids of the listed products in list order, searched and sorted in
+        memory over the facet index so only the page is loaded.
+        """
+        search_string = self.request.query_params.get("search_string", "")
+        sort_by = self.request.query_params.get("sort_by", "")
 
-            if sort_by == "INVHIGHTOLOW":
-                qs = sorted(
-                    qs, key=lambda p: p.get_inventory_avail_count(),
-                    reverse=True)
-            if sort_by == "INVLOWTOHIGH":
-                qs = sorted(
-                    qs, key=lambda p: p.get_inventory_avail_count(),
-                    reverse=False)
+        product_ids = self.facet_search()[0]
+        ranks = search_ranks("product", search_string) if search_string != "" else None
+        if ranks is not None:
+            # Best match first, as ranked_search orders them
+            product_ids = sorted([pk for pk in ranks if pk in product_ids],
+                                 key=lambda pk: (-ranks[pk], pk))
+        elif sort_by in self.sort_fields:
+            product_ids = list(product_ids)
+        else:
+            # Newest first
+            product_ids = list(product_ids)[::-1]
+
+        if sort_by in self.sort_fields:
+            product_ids = self.sort(product_ids, sort_by)
+        return product_ids
+
+    def list(self, request, *args, **kwargs):
+        product_ids = self.product_ids()
+        page = self.paginate_queryset(product_ids)
+        if page is not None:
+            product_ids = page
+        products = EcommProduct.objects.in_bulk(product_ids)
+        serializer = self.get_serializer(
+            [products[pk] for pk in product_ids if pk in products], many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
-            if sort_by == "MODNEWFIRST":
-                qs = qs.order_by('-updated_at')
-            if sort_by == "MODOLDFIRST":
-                qs = qs.order_by('updated_at')
+    def post(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
-            if sort_by == "ADDNEWFIRST":
-                qs = qs.order_by('-created_at')
-            if sort_by == "ADDOLDFIRST":
-                qs = qs.order_by('created_at')
 
-        return qs
+class ProductFacets(SellerScopeMixin, ProductFacetMixin, APIView):
+    permission_classes = [IsSuperAdminOrSeller]
+
+    def get(self, request, *args, **kwargs):
+        product_ids, facets = self.facet_search()
+        return Response({"count": len(product_ids), "facets": facets})
 
     def post(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        return self.get(request, *args, **kwargs)
 
 
 class ProdListCollection(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-                | Q(store__name__icontains=qstring)
-                | Q(store__nameAR__icontains=qstring)
-                | Q(brand__name__icontains=qstring)
-                | Q(brand__nameAR__icontains=qstring)
-                | Q(category__name__icontains=qstring)
-                | Q(category__nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "product", search_string)
 
     def post(self, request, pk):
         collection = get_object_or_404(ProductCollection, pk=pk)
@@ -853,43 +818,19 @@ class ProdListSeller(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-                | Q(store__name__icontains=qstring)
-                | Q(store__nameAR__icontains=qstring)
-                | Q(brand__name__icontains=qstring)
-                | Q(brand__nameAR__icontains=qstring)
-                | Q(category__name__icontains=qstring)
-                | Q(category__nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "product", search_string)
 
     def post(self, request, pk):
         seller = get_object_or_404(Store, pk=pk)
         search_string = self.request.data.get("search_string", "")
         if self.request.user.is_seller:
-            sub_admins = self.request.user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                qs = EcommProduct.objects.filter(
-                    status='AC',
-                    store=sub_admin.store,
-                    isHiddenFromOrder=False).annotate(
-                    variant_count=Count('productVariantValue', distinct=True)).exclude(
-                    Q(variant_count=0, parent__isnull=False) |
-                    Q(parent=None, children__isnull=False, important=False) |
-                    Q(parent__important=True, important=False))
-            else:
-                qs = EcommProduct.objects.filter(
-                    status='AC',
-                    store__member=self.request.user,
-                    isHiddenFromOrder=False).annotate(
-                    variant_count=Count('productVariantValue', distinct=True)).exclude(
-                    Q(variant_count=0, parent__isnull=False) |
-                    Q(parent=None, children__isnull=False, important=False) |
-                    Q(parent__important=True, important=False))
+            qs = get_seller_scope(self.request.user).filter(EcommProduct.objects.filter(
+                status='AC',
+                isHiddenFromOrder=False), "store").annotate(
+                variant_count=Count('productVariantValue', distinct=True)).exclude(
+                Q(variant_count=0, parent__isnull=False) |
+                Q(parent=None, children__isnull=False, important=False) |
+                Q(parent__important=True, important=False))
         else:
             if seller.name == "Becon (All products)":
                 qs = EcommProduct.objects.filter(
@@ -929,18 +870,7 @@ class ChildProductList(ListAPIView):
         return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-                | Q(store__name__icontains=qstring)
-                | Q(store__nameAR__icontains=qstring)
-                | Q(brand__name__icontains=qstring)
-                | Q(brand__nameAR__icontains=qstring)
-                | Q(category__name__icontains=qstring)
-                | Q(category__nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "product", search_string)
 
     def get_serializer_context(self):
         return {"user": self.request.user,
@@ -959,16 +889,15 @@ class ChildProductList(ListAPIView):
         brand_ids = self.request.data.get("brand_ids", None)
 
         if self.request.user.is_seller:
-            qs = EcommProduct.objects.filter(
-                parent__isnull=False, store__member=self.request.user)
+            qs = get_seller_scope(self.request.user).filter(EcommProduct.objects.filter(
+                parent__isnull=False), "store")
         else:
             qs = EcommProduct.objects.filter(parent__isnull=False)
 
         if brand_id != "" and brand_id != 0:
             if self.request.user.is_seller:
-                qs = EcommProduct.objects.filter(
-                    store__member=self.request.user,
-                    brand__pk=brand_id).distinct()
+                qs = get_seller_scope(self.request.user).filter(EcommProduct.objects.filter(
+                    brand__pk=brand_id), "store").distinct()
             else:
                 qs = EcommProduct.objects.filter(
                     brand__pk=brand_id).distinct()
@@ -0,0 +1,177 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Q, Max, Sum, Case, When, Value, IntegerField
+
+from app.product.models import EcommProduct, Brand, SearchKeyWord, SearchKeyWordAR, SearchToken
+from app.store.models import Store
+from app.utilities.transactions import on_commit_once
+
+TOKEN_MAX_LENGTH = 64
+# Name words count most, then keywords, then brand and category, then store
+PRODUCT_WEIGHTS = {"name": 8, "keyword": 4, "brand": 2, "category": 2, "store": 1}
+NAME_WEIGHT = 8
+SEARCH_MODELS = {"product": EcommProduct, "brand": Brand, "store": Store}
+
+ARABIC_LETTERS = str.maketrans({
+    "ٱ": "ا",  # alef wasla
+    "ى": "ي",  # alef maksura
+    "ة": "ه",  # taa marbuta
+    "ـ": None,  # tatweel
+})
+DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩"
+                       "۰۱۲۳۴۵۶۷۸۹",
+                       "01234567890123456789")
+ARABIC_ARTICLE = "ال"
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    """
+    Lower case text without accents or tashkeel, with the alef and hamza
+    forms folded to their bare letter, taa marbuta to haa, alef maksura
+    to yaa and arabic digits to latin ones.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join([char for char in text if unicodedata.category(char) != "Mn"])
+    return text.translate(ARABIC_LETTERS).translate(DIGITS).casefold()
+
+
+def tokenize(text):
+    """Normalized words, arabic words also without the article."""
+    tokens = []
+    for word in WORD_RE.findall(normalize(text)):
+        word = word[:TOKEN_MAX_LENGTH]
+        tokens.append(word)
+        if word.startswith(ARABIC_ARTICLE) and len(word) > len(ARABIC_ARTICLE) + 1:
+            tokens.append(word[len(ARABIC_ARTICLE):])
+    return tokens
+
+
+def query_terms(search_string):
+    terms = []
+    for word in WORD_RE.findall(normalize(search_string)):
+        word = word[:TOKEN_MAX_LENGTH]
+        if word not in terms:
+            terms.append(word)
+    return terms
+
+
+def weighted_tokens(texts):
+    """{token: weight} of (text, weight) pairs, each token at its best weight."""
+    tokens = {}
+    for text, weight in texts:
+        for token in tokenize(text):
+            tokens[token] = max(tokens.get(token, 0), weight)
+    return tokens
+
+
+def product_documents(product_ids):
+    """{product id: [(text, weight)]} with the brand, store, category and keywords."""
+    documents = {}
+    rows = EcommProduct.objects.filter(pk__in=product_ids).values_list(
+        'id', 'name', 'nameAR', 'brand__name', 'brand__nameAR',
+        'store__name', 'store__nameAR', 'category__name', 'category__nameAR')
+    for (product_id, name, name_ar, brand, brand_ar,
+         store, store_ar, category, category_ar) in rows:
+        documents[product_id] = [
+            (name, PRODUCT_WEIGHTS["name"]), (name_ar, PRODUCT_WEIGHTS["name"]),
+            (brand, PRODUCT_WEIGHTS["brand"]), (brand_ar, PRODUCT_WEIGHTS["brand"]),
+            (store, PRODUCT_WEIGHTS["store"]), (store_ar, PRODUCT_WEIGHTS["store"]),
+            (category, PRODUCT_WEIGHTS["category"]), (category_ar, PRODUCT_WEIGHTS["category"]),
+        ]
+    keywords = list(SearchKeyWord.objects.filter(
+        products_additional_search__in=product_ids).values_list(
+        'products_additional_search', 'keyword'))
+    keywords += list(SearchKeyWordAR.objects.filter(
+        products_additional_search_ar__in=product_ids).values_list(
+        'products_additional_search_ar', 'keyword_ar'))
+    for product_id, keyword in keywords:
+        if product_id in documents:
+            documents[product_id].append((keyword, PRODUCT_WEIGHTS["keyword"]))
+    return documents
+
+
+def name_documents(model, object_ids):
+    return {object_id: [(name, NAME_WEIGHT), (name_ar, NAME_WEIGHT)]
+            for object_id, name, name_ar in model.objects.filter(
+                pk__in=object_ids).values_list('id', 'name', 'nameAR')}
+
+
+@transaction.atomic
+def refresh_search_tokens(kind, object_ids):
+    """Replaces the tokens of the given products, brands or stores."""
+    object_ids = list(object_ids)
+    if kind == "product":
+        documents = product_documents(object_ids)
+    else:
+        documents = name_documents(SEARCH_MODELS[kind], object_ids)
+    SearchToken.objects.filter(kind=kind, object_id__in=object_ids).delete()
+    SearchToken.objects.bulk_create([
+        SearchToken(kind=kind, object_id=object_id, token=token, weight=weight)
+        for object_id, texts in documents.items()
+        for token, weight in weighted_tokens(texts).items()
+    ], batch_size=1000)
+    return len(documents)
+
+
+def mark_search_changed(kind, object_ids):
+    """Refreshes the search tokens of the objects once the transaction commits."""
+    on_commit_once("search_%s" % kind, object_ids,
+                   lambda changed_ids: refresh_search_tokens(kind, changed_ids))
+
+
+def rebuild_search_index(batch_size=1000):
+    rebuilt = 0
+    for kind, model in SEARCH_MODELS.items():
+        last_id = 0
+        while True:
+            object_ids = list(model.objects.filter(
+                id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not object_ids:
+                break
+            refresh_search_tokens(kind, object_ids)
+            last_id = object_ids[-1]
+            rebuilt += len(object_ids)
+    SearchToken.objects.exclude(
+        Q(kind="product", object_id__in=EcommProduct.objects.values('id'))
+        | Q(kind="brand", object_id__in=Brand.objects.values('id'))
+        | Q(kind="store", object_id__in=Store.objects.values('id'))).delete()
+    return rebuilt
+
+
+def search_ranks(kind, search_string):
+    """
+    {id: rank} of the objects having a token starting with every word of
+    the search string, the rank being the weight of the matched tokens.
+    None when the search string has no words.
+    """
+    terms = query_terms(search_string)
+    if not terms:
+        return None
+    matches = Q()
+    for term in terms:
+        matches |= Q(token__startswith=term)
+    term_matches = {
+        "term_%s" % number: Max(Case(When(token__startswith=term, then=Value(1)),
+                                     default=Value(0), output_field=IntegerField()))
+        for number, term in enumerate(terms)
+    }
+    rows = SearchToken.objects.filter(matches, kind=kind).values('object_id').annotate(
+        rank=Sum('weight'), **term_matches).filter(
+        **{name: 1 for name in term_matches}).order_by().values_list('object_id', 'rank')
+    return dict(rows)
+
+
+def ranked_search(qs, kind, search_string):
+    """Limits `qs` to the matches of the search string, best match first."""
+    ranks = search_ranks(kind, search_string)
+    if ranks is None:
+        return qs
+    by_rank = {}
+    for object_id, rank in ranks.items():
+        by_rank.setdefault(rank, []).append(object_id)
+    return qs.filter(pk__in=list(ranks)).annotate(search_rank=Case(
+        *[When(pk__in=object_ids, then=Value(rank)) for rank, object_ids in by_rank.items()],
+        default=Value(0), output_field=IntegerField())).order_by('-search_rank', 'id')
@@ -8,7 +8,6 @@ from PIL import Image
 from django.conf import settings
 from django.contrib.humanize.templatetags import humanize
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.images import get_image_dimensions
 from django.core.validators import FileExtensionValidator
 from django.db.models import F, Sum, Count, Q, Avg
 from django.shortcuts import get_object_or_404
@@ -18,11 +17,14 @@ from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import ValidationError
 
 from app.authentication.models import Member
+from app.product.categories import get_category_tree
 from app.product.models import Brand, Category, EcommProduct, ProductSpecification, Variant, VariantValues, \
     EcommProductMedia, ProductVariantValue, SearchKeyWord, SearchKeyWordAR, EcommProductRatingandReview, \
     ProductCollection, ProductCollectionCond, Coupon, Discount
 from app.product.utils import rating_string
+from app.store.allocation import set_available_quantity
 from app.store.models import Store, InventoryProduct, Inventory
+from app.utilities.images import get_image_dimensions
 from app.utilities.helpers import get_ecomm_prod_media_key_and_path, get_presigned_url, report_to_developer, str2bool, \
     convert_date_time_to_kuwait_string, datetime_from_utc_to_local_new
 
@@ -76,11 +78,7 @@ class BrandListSerializer(serializers.ModelSerializer):
         return "Other"
 
     def get_prods_linked(self, obj):
-        prod_count = obj.products.all().annotate(
-            variant_count=Count('productVariantValue', distinct=True)).exclude(
-            Q(variant_count=0, parent__isnull=False)
-            | Q(parent=None, children__isnull=False)).count()
-        return prod_count
+        return obj.visible_product_count
         # if obj.products.all().filter(
         #         parent__isnull=False).exists():
         #     return obj.products.all().filter(
@@ -256,11 +254,7 @@ class BrandSerializer(serializers.ModelSerializer):
         return None
 
     def get_prods_linked(self, obj):
-        prod_count = obj.products.all().annotate(
-            variant_count=Count('productVariantValue', distinct=True)).exclude(
-            Q(variant_count=0, parent__isnull=False)
-            | Q(parent=None, children__isnull=False)).count()
-        return prod_count
+        return obj.visible_product_count
 
         # if obj.products.all().filter(
         #         parent__isnull=False).exists():
@@ -286,14 +280,7 @@ class CategoryListSerializer(serializers.ModelSerializer):
         return obj.get_status_display()
 
     def get_parent_name_chain(self, obj):
-        if obj.parent:
-            return '>'.join(
-                [obj.name, obj.parent.get_parent_name_chain()]
-            )
-        else:
-            return '>'.join(
-                [obj.name]
-            )
+        return get_category_tree(obj.id).name_chain(obj.id)
 
     def get_name(self, obj):
         lang_code = self.context.get("lang_code")
@@ -302,15 +289,7 @@ class CategoryListSerializer(serializers.ModelSerializer):
         return obj.name
 
     def get_prods_linked(self, obj):
-        descendants = Category.objects.descendants(obj)
-        sum = 0
-        for category in descendants:
-            prod_count = category.products.all().annotate(
-                variant_count=Count('productVariantValue', distinct=True)).exclude(
-                Q(variant_count=0, parent__isnull=False)
-                | Q(parent=None, children__isnull=False)).count()
-            sum += prod_count
-        return sum
+        return obj.visible_product_count
 
         # cat_desc_prod_count = Category.objects.descendants(obj).annotate(
         #     prod_count=Count('products__children')
@@ -321,17 +300,7 @@ class CategoryListSerializer(serializers.ModelSerializer):
         # return None
 
     def get_type(self, obj):
-        if not obj.parent:
-            return "Main Category"
-        ancestors_count = Category.objects.ancestors(obj).exclude(
-            id=obj.id).count()
-
-        if ancestors_count == 1:
-            return "Sub Category"
-        elif ancestors_count == 2:
-            return "Product Type"
-        elif ancestors_count == 3:
-            return "Sub Product Type"
+        return get_category_tree(obj.id).category_type(obj.id)
 
     def get_image(self, obj):
         if obj.medias.exists():
@@ -494,15 +463,7 @@ class CategorySerializer(serializers.ModelSerializer):
         return None
 
     def get_prods_linked(self, obj):
-        descendants = Category.objects.descendants(obj)
-        sum = 0
-        for category in descendants:
-            prod_count = category.products.all().annotate(
-                variant_count=Count('productVariantValue', distinct=True)).exclude(
-                Q(variant_count=0, parent__isnull=False)
-                | Q(parent=None, children__isnull=False)).count()
-            sum += prod_count
-        return sum
+        return obj.visible_product_count
 
         # cat_desc_prod_count = Category.objects.descendants(obj).annotate(
         #     prod_count=Count('products__children')
@@ -513,17 +474,7 @@ class CategorySerializer(serializers.ModelSerializer):
         # return None
 
     def get_type(self, obj):
-        if not obj.parent:
-            return "Main Category"
-        ancestors_count = Category.objects.ancestors(obj).exclude(
-            id=obj.id).count()
-
-        if ancestors_count == 1:
-            return "Sub Category"
-        elif ancestors_count == 2:
-            return "Product Type"
-        elif ancestors_count == 3:
-            return "Sub Product Type"
+        return get_category_tree(obj.id).category_type(obj.id)
 
 
 class CategoryCommissionSerializer(serializers.ModelSerializer):
@@ -554,14 +505,7 @@ class CategoryNotificationSerializer(serializers.ModelSerializer):
         )
 
     def get_parent_name_chain(self, obj):
-        if obj.parent:
-            return '>'.join(
-                [obj.name, obj.parent.get_parent_name_chain(), ]
-            )
-        else:
-            return '>'.join(
-                [obj.name]
-            )
+        return get_category_tree(obj.id).name_chain(obj.id)
 
     def get_status(self, obj):
         return obj.get_status_display()
@@ -597,28 +541,10 @@ class CategoryNotificationSerializer(serializers.ModelSerializer):
         return None
 
     def get_prods_linked(self, obj):
-        descendants = Category.objects.descendants(obj)
-        sum = 0
-        for category in descendants:
-            prod_count = category.products.all().annotate(
-                variant_count=Count('productVariantValue', distinct=True)).exclude(
-                Q(variant_count=0, parent__isnull=False)
-                | Q(parent=None, children__isnull=False)).count()
-            sum += prod_count
-        return sum
+        return obj.visible_product_count
 
     def get_type(self, obj):
-        if not obj.parent:
-            return "Main Category"
-        ancestors_count = Category.objects.ancestors(obj).exclude(
-            id=obj.id).count()
-
-        if ancestors_count == 1:
-            return "Sub Category"
-        elif ancestors_count == 2:
-            return "Product Type"
-        elif ancestors_count == 3:
-            return "Sub Product Type"
+        return get_category_tree(obj.id).category_type(obj.id)
 
     def get_parent(self, obj):
         if obj.parent:
@@ -692,21 +618,8 @@ class ProductListSerializer(serializers.ModelSerializer):
         lang_code = self.context.get("lang_code")
 
         if lang_code == "ar":
-            var_vals_list = VariantValues.objects.filter(
-                pk__in=obj.variant_value_ids()
-            ).values_list('valueAR', flat=True)
-            var_string = ",".join(list(var_vals_list))
-            if obj.nameAR and obj.nameAR != "":
-                return "".join([obj.nameAR, "-", var_string])
-            return var_string
-
-        var_vals_list = VariantValues.objects.filter(
-            pk__in=obj.variant_value_ids()
-        ).values_list('value', flat=True)
-        var_string = ",".join(list(var_vals_list))
-        if obj.name and obj.name != "":
-            return "".join([obj.name, "-", var_string])
-        return var_string
+            return obj.get_name_AR()
+        return obj.get_name()
 
     def get_seller_name(self, obj):
         lang_code = self.context.get("lang_code")
@@ -1210,12 +1123,8 @@ class AddEditProductSerializer(serializers.ModelSerializer):
             store = product.store
         if store:
             if store.inventories.exists():
-                inventory = store.inventories.first()
-                InventoryProduct.objects.update_or_create(
-                    product=product,
-                    inventory=inventory,
-                    defaults={'quantity': quantity}
-                )
+                inventory = store.get_default_inventory()
+                set_available_quantity(product, inventory, quantity)
             else:
                 inv = Inventory.objects.create(
                     name=store.name,
@@ -1539,12 +1448,8 @@ class AddProductDraftSerializer(serializers.ModelSerializer):
     def update_quantity(self, product, quantity):
         if product.store:
             if product.store.inventories.exists():
-                inventory = product.store.inventories.first()
-                InventoryProduct.objects.update_or_create(
-                    product=product,
-                    inventory=inventory,
-                    defaults={'quantity': quantity}
-                )
+                inventory = product.store.get_default_inventory()
+                set_available_quantity(product, inventory, quantity)
             else:
                 inv = Inventory.objects.create(
                     name=product.store.name,
@@ -2055,12 +1960,8 @@ class EditProductDraftSerializer(serializers.ModelSerializer):
             store = product.store
         if store:
             if store.inventories.exists():
-                inventory = store.inventories.first()
-                InventoryProduct.objects.update_or_create(
-                    product=product,
-                    inventory=inventory,
-                    defaults={'quantity': quantity}
-                )
+                inventory = store.get_default_inventory()
+                set_available_quantity(product, inventory, quantity)
             else:
                 inv = Inventory.objects.create(
                     name=store.name,
@@ -2564,15 +2465,11 @@ class EditProductSerializer(serializers.ModelSerializer):
         if store:
             if store.inventories.exists():
                 print("inv-xist")
-                inventory = store.inventories.all().first()
+                inventory = store.get_default_inventory()
                 print("inventory")
                 print(inventory)
                 print(quantity)
-                InventoryProduct.objects.update_or_create(
-                    product=product,
-                    inventory=inventory,
-                    defaults={'quantity': quantity}
-                )
+                set_available_quantity(product, inventory, quantity)
             else:
                 inv = Inventory.objects.create(
                     name=store.name,
@@ -2738,13 +2635,7 @@ class ChildProdSerializer(serializers.ModelSerializer):
         return obj.descriptionAR
 
     def get_quantity(self, obj):
-        if obj.inventoryProducts.filter(
-                inventory__store=obj.store).exists():
-            inv_prod = obj.inventoryProducts.all().filter(
-                inventory__store=obj.store
-            ).first()
-            return inv_prod.quantity
-        return 0
+        return obj.get_avail_qty()
 
     def get_variant_values(self, obj):
         variant_value_ids = obj.productVariantValue.all().values_list(
@@ -2821,13 +2712,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             obj.specifications.all(), many=True).data
 
     def get_quantity(self, obj):
-        if obj.inventoryProducts.filter(
-                inventory__store=obj.store).exists():
-            inv_prod = obj.inventoryProducts.all().filter(
-                inventory__store=obj.store
-            ).first()
-            return inv_prod.quantity
-        return 0
+        return obj.get_avail_qty()
 
     def get_child_variants(self, obj):
         children = obj.children.all()
@@ -2889,13 +2774,7 @@ class ProductInReviewListSerializer(serializers.ModelSerializer):
         )
 
     def get_name(self, obj):
-        var_vals_list = VariantValues.objects.filter(
-            pk__in=obj.variant_value_ids()
-        ).values_list('value', flat=True)
-        var_string = ",".join(list(var_vals_list))
-        if obj.name and obj.name != "":
-            return "".join([obj.name, "-", var_string])
-        return var_string
+        return obj.get_name()
 
     def get_image(self, obj):
         if obj.medias.exists():
@@ -3399,20 +3278,14 @@ class ProductMinNewSerializer(serializers.ModelSerializer):
         lang_code = self.context.get("lang_code")
 
         if lang_code == "ar":
-            var_vals_list = VariantValues.objects.filter(
-                pk__in=obj.variant_value_ids()
-            ).values_list('valueAR', flat=True)
-            var_string = ",".join(list(var_vals_list))
+            var_string = obj.get_variant_values_string(lang_code)
             if obj.nameAR and obj.nameAR != "" and var_string != "":
                 return "".join([obj.nameAR, "-", var_string])
             elif var_string == "":
                 return obj.nameAR
             return var_string
 
-        var_vals_list = VariantValues.objects.filter(
-            pk__in=obj.variant_value_ids()
-        ).values_list('value', flat=True)
-        var_string = ",".join(list(var_vals_list))
+        var_string = obj.get_variant_values_string()
         if obj.name and obj.name != "" and var_string != "":
             return "".join([obj.name, "-", var_string])
         elif var_string == "":
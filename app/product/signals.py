@@ -1,8 +1,32 @@
-
+from django.db import transaction
 from django.db.models import Avg
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from app.product.models import EcommProductRatingandReview
+from app.product.categories import invalidate_category_tree
+from app.product.models import EcommProductRatingandReview, EcommProduct, ProductVariantValue, \
+    VariantValues, Variant, Category, CategoryMedia, Brand, SearchKeyWord, SearchKeyWordAR
+from app.product.counts import mark_product_counts_changed, move_category_count, \
+    remove_product_counts
+from app.product.facets import mark_facets_changed
+from app.product.names import mark_display_names_changed
+from app.product.search import mark_search_changed
+from app.store.models import Store
+
+# Fields whose words are indexed, and the products each object's words go to
+SEARCH_FIELDS = {
+    Brand: ('name', 'nameAR'),
+    Store: ('name', 'nameAR'),
+    Category: ('name', 'nameAR'),
+    SearchKeyWord: ('keyword',),
+    SearchKeyWordAR: ('keyword_ar',),
+}
+SEARCH_PRODUCTS = {
+    Brand: 'brand',
+    Store: 'store',
+    Category: 'category',
+    SearchKeyWord: 'additional_search_keywords',
+    SearchKeyWordAR: 'additional_search_keywords_ar',
+}
 
 
 @receiver(post_save, sender=EcommProductRatingandReview)
@@ -12,3 +36,181 @@ def update_overall_rating_product(sender, instance=None, created=False, **kwargs
             rating=Avg('star'))['rating']
         instance.product.overall_rating = overall_rating
         instance.product.save()
+
+
+@receiver(pre_save, sender=EcommProduct)
+def check_product_name_changed(sender, instance=None, update_fields=None, **kwargs):
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & {'name', 'nameAR'}:
+        instance._name_changed = False
+        return
+    stored = EcommProduct.objects.filter(
+        pk=instance.pk).values_list('name', 'nameAR').first()
+    instance._name_changed = stored != (instance.name, instance.nameAR)
+
+
+@receiver(post_save, sender=EcommProduct)
+def product_name_changed(sender, instance=None, created=False, **kwargs):
+    if created or getattr(instance, "_name_changed", False):
+        mark_display_names_changed([instance.id])
+
+
+@receiver(post_save, sender=ProductVariantValue)
+@receiver(post_delete, sender=ProductVariantValue)
+def product_variant_value_changed(sender, instance=None, **kwargs):
+    mark_display_names_changed([instance.product_id])
+
+
+@receiver(post_save, sender=VariantValues)
+def variant_value_renamed(sender, instance=None, created=False, **kwargs):
+    if not created:
+        mark_display_names_changed(ProductVariantValue.objects.filter(
+            variant_value=instance).values_list('product', flat=True))
+
+
+@receiver(post_save, sender=Variant)
+def variant_renamed(sender, instance=None, created=False, **kwargs):
+    if not created:
+        mark_display_names_changed(ProductVariantValue.objects.filter(
+            variant_value__variant=instance).values_list('product', flat=True))
+
+
+@receiver(post_save, sender=EcommProduct)
+def product_count_changed(sender, instance=None, **kwargs):
+    # A parent is only counted while it has no children
+    mark_product_counts_changed([instance.id, instance.parent_id])
+
+
+@receiver(pre_delete, sender=EcommProduct)
+def product_count_removing(sender, instance=None, **kwargs):
+    remove_product_counts([instance.id])
+
+
+@receiver(post_delete, sender=EcommProduct)
+def product_count_removed(sender, instance=None, **kwargs):
+    mark_product_counts_changed([instance.parent_id])
+
+
+@receiver(post_save, sender=ProductVariantValue)
+@receiver(post_delete, sender=ProductVariantValue)
+def product_variant_count_changed(sender, instance=None, **kwargs):
+    mark_product_counts_changed([instance.product_id])
+
+
+@receiver(pre_save, sender=Category)
+def check_category_parent_changed(sender, instance=None, update_fields=None, **kwargs):
+    instance._previous_parent_id = instance.parent_id
+    if instance.pk is None:
+        return
+    if update_fields is not None and 'parent' not in update_fields:
+        return
+    instance._previous_parent_id = Category.objects.filter(
+        pk=instance.pk).values_list('parent', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def category_parent_changed(sender, instance=None, created=False, **kwargs):
+    previous_parent_id = getattr(instance, "_previous_parent_id", instance.parent_id)
+    if not created and previous_parent_id != instance.parent_id:
+        move_category_count(instance.id, previous_parent_id, instance.parent_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategoryMedia)
+@receiver(post_delete, sender=CategoryMedia)
+def category_tree_changed(sender, instance=None, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver(post_save, sender=EcommProduct)
+@receiver(post_delete, sender=EcommProduct)
+def product_facets_changed(sender, instance=None, **kwargs):
+    mark_facets_changed([instance.id, instance.parent_id])
+
+
+@receiver(post_save, sender=ProductVariantValue)
+@receiver(post_delete, sender=ProductVariantValue)
+def product_variant_facets_changed(sender, instance=None, **kwargs):
+    mark_facets_changed([instance.product_id])
+
+
+def search_products_of(instance):
+    return list(EcommProduct.objects.filter(**{
+        SEARCH_PRODUCTS[type(instance)]: instance.pk}).values_list('id', flat=True))
+
+
+def mark_search_object_changed(instance, product_ids):
+    if isinstance(instance, (Brand, Store)):
+        mark_search_changed(type(instance).__name__.lower(), [instance.pk])
+    mark_search_changed("product", product_ids)
+
+
+@receiver(post_save, sender=EcommProduct)
+@receiver(post_delete, sender=EcommProduct)
+def product_search_changed(sender, instance=None, **kwargs):
+    mark_search_changed("product", [instance.id])
+
+
+@receiver(pre_save, sender=Brand)
+@receiver(pre_save, sender=Store)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=SearchKeyWord)
+@receiver(pre_save, sender=SearchKeyWordAR)
+def check_search_words_changed(sender, instance=None, update_fields=None, **kwargs):
+    fields = SEARCH_FIELDS[sender]
+    if instance.pk is None:
+        instance._search_words_changed = True
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        instance._search_words_changed = False
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._search_words_changed = stored != tuple(
+        [getattr(instance, field) for field in fields])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SearchKeyWord)
+@receiver(post_save, sender=SearchKeyWordAR)
+def search_words_changed(sender, instance=None, created=False, **kwargs):
+    if getattr(instance, "_search_words_changed", False):
+        # A new object has no products yet
+        mark_search_object_changed(instance, [] if created else search_products_of(instance))
+
+
+@receiver(pre_delete, sender=Brand)
+@receiver(pre_delete, sender=Store)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=SearchKeyWord)
+@receiver(pre_delete, sender=SearchKeyWordAR)
+def search_object_deleting(sender, instance=None, **kwargs):
+    instance._search_products = search_products_of(instance)
+
+
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SearchKeyWord)
+@receiver(post_delete, sender=SearchKeyWordAR)
+def search_object_deleted(sender, instance=None, **kwargs):
+    mark_search_object_changed(instance, getattr(instance, "_search_products", []))
+
+
+@receiver(m2m_changed, sender=EcommProduct.additional_search_keywords.through)
+@receiver(m2m_changed, sender=EcommProduct.additional_search_keywords_ar.through)
+def product_keywords_changed(sender, instance=None, action=None, reverse=False,
+                             pk_set=None, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            mark_search_changed("product", [instance.id])
+    elif action == "pre_clear":
+        # Clearing a keyword's products sends no pk_set
+        instance._cleared_products = search_products_of(instance)
+    elif action == "post_clear":
+        mark_search_changed("product", getattr(instance, "_cleared_products", []))
+    elif action.startswith("post_") and pk_set:
+        mark_search_changed("product", pk_set)
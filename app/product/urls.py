@@ -14,7 +14,10 @@ urlpatterns = [
     path("delete-brands/", rest.DeleteBrands.as_view()),
     path("change-brands-status/", rest.ChangeBrandStatus.as_view()),
 
+    path("category-tree/", rest.CategoryTreeList.as_view()),
+
     path("product-list/", rest.ProductList.as_view()),
+    path("product-facets/", rest.ProductFacets.as_view()),
     path("child-product-list/", rest.ChildProductList.as_view()),
     path("change-products-status/", rest.ChangeProductStatus.as_view()),
     path("product-detail/<int:pk>/", rest.ProductDetail.as_view()),
@@ -0,0 +1,226 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Q, F, Sum, Case, When, Value, IntegerField
+
+from app.store.models import InventoryProduct, OrderProductAllocation
+
+ALLOCATION_STRATEGIES = ("priority", "greedy")
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__("Not enough stock for order items %s" % ", ".join(
+            [str(key) for key in shortages]))
+
+
+def store_stock(qs):
+    """Limits inventory rows to the inventories of the product's seller."""
+    return qs.filter(
+        Q(inventory__store=F('product__store'))
+        | Q(product__parent__isnull=False, inventory__store=F('product__parent__store')))
+
+
+def available_quantities(product_ids):
+    """Stock of each product summed over all its seller's inventories."""
+    return dict(store_stock(InventoryProduct.objects.filter(
+        product__in=product_ids
+    )).values_list('product').annotate(total=Sum('quantity')).order_by())
+
+
+@transaction.atomic
+def set_available_quantity(product, inventory, total):
+    """
+    Makes the product's stock over its seller's inventories `total`. An
+    increase goes to `inventory`. A decrease is taken from `inventory`
+    first, then from the other inventories in priority order, so lowering
+    the total never leaves the old stock on sale.
+    """
+    total = max(int(total), 0)
+    rows = list(store_stock(InventoryProduct.objects.select_for_update(
+        of=('self',)).filter(product=product)).order_by(
+        'inventory__priority', 'inventory_id'))
+    own = next((row for row in rows if row.inventory_id == inventory.id), None)
+    if own is None:
+        own = InventoryProduct.objects.create(
+            product=product, inventory=inventory, quantity=0)
+    else:
+        rows.remove(own)
+
+    current = own.quantity + sum([row.quantity for row in rows])
+    if total >= current:
+        own.quantity += total - current
+        own.save(update_fields=['quantity'])
+        return
+
+    to_remove = current - total
+    for row in [own] + rows:
+        taken = min(max(row.quantity, 0), to_remove)
+        if taken:
+            row.quantity -= taken
+            row.save(update_fields=['quantity'])
+            to_remove -= taken
+        if not to_remove:
+            break
+
+
+def inventory_rank(lines, stock, strategy):
+    """
+    Sort key of the stock rows. "priority" drains inventories in priority
+    order, "greedy" prefers the inventories able to ship the most lines
+    whole, so an order is split over as few inventories as possible.
+    """
+    if strategy == "priority":
+        return lambda row: (row["priority"], row["id"])
+
+    needed = {}
+    for key, product_id, qty in lines:
+        needed[product_id] = needed.get(product_id, 0) + qty
+    covered = {}
+    for product_id, rows in stock.items():
+        for row in rows:
+            if row["quantity"] >= needed.get(product_id, 0) > 0:
+                covered[row["inventory_id"]] = covered.get(row["inventory_id"], 0) + 1
+    return lambda row: (-covered.get(row["inventory_id"], 0), row["priority"], row["id"])
+
+
+def plan_allocation(lines, stock, strategy="priority"):
+    """
+    Allocates (key, product_id, qty) lines to stock rows, given as
+    {product_id: [{"id", "inventory_id", "priority", "quantity"}]}.
+    Returns ({key: [(row, qty)]}, {key: missing qty}) without touching
+    the database.
+    """
+    rank = inventory_rank(lines, stock, strategy)
+    remaining = {}
+    for rows in stock.values():
+        for row in rows:
+            remaining[row["id"]] = max(row["quantity"], 0)
+
+    allocations = OrderedDict()
+    shortages = OrderedDict()
+    for key, product_id, qty in lines:
+        rows = sorted(stock.get(product_id, []), key=rank)
+        picked = []
+        whole = [row for row in rows if remaining[row["id"]] >= qty]
+        if strategy == "greedy" and whole:
+            picked.append((whole[0], qty))
+        else:
+            need = qty
+            for row in rows:
+                if need <= 0:
+                    break
+                take = min(remaining[row["id"]], need)
+                if take > 0:
+                    picked.append((row, take))
+                    need -= take
+            if need > 0:
+                shortages[key] = need
+        for row, take in picked:
+            remaining[row["id"]] -= take
+        allocations[key] = picked
+    return allocations, shortages
+
+
+def locked_stock(product_ids):
+    rows = store_stock(InventoryProduct.objects.select_for_update(
+        of=('self',)).filter(product__in=product_ids)).select_related(
+        'inventory').order_by('id')
+    stock = {}
+    for inv_prod in rows:
+        stock.setdefault(inv_prod.product_id, []).append({
+            "id": inv_prod.id,
+            "inventory_id": inv_prod.inventory_id,
+            "priority": inv_prod.inventory.priority,
+            "quantity": inv_prod.quantity,
+        })
+    return stock
+
+
+def apply_stock_deltas(deltas):
+    """Adds {inventory product id: delta} with one UPDATE."""
+    if not deltas:
+        return
+    InventoryProduct.objects.filter(pk__in=deltas.keys()).update(
+        quantity=F('quantity') + Case(
+            *[When(pk=inv_prod_id, then=Value(delta))
+              for inv_prod_id, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField()))
+
+
+@transaction.atomic
+def allocate_order(order, strategy="priority"):
+    """
+    Allocates all open lines of an order in one pass and takes the stock
+    from the chosen inventories. The stock rows are locked in id order
+    for the whole allocation, so concurrent orders never oversell an
+    inventory. Raises InsufficientStock, changing nothing, when a line
+    can not be filled.
+    """
+    order_products = list(order.orderProducts.filter(
+        product__isnull=False, allocations__isnull=True
+    ).exclude(status='CA'))
+    lines = [(op.id, op.product_id, op.quantity - op.cancelled_qty)
+             for op in order_products if op.quantity - op.cancelled_qty > 0]
+    if not lines:
+        return []
+
+    stock = locked_stock(set([product_id for key, product_id, qty in lines]))
+    allocations, shortages = plan_allocation(lines, stock, strategy)
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    deltas = {}
+    merged = OrderedDict()
+    for op_id, picked in allocations.items():
+        for row, take in picked:
+            deltas[row["id"]] = deltas.get(row["id"], 0) - take
+            merged[(op_id, row["inventory_id"])] = merged.get(
+                (op_id, row["inventory_id"]), 0) + take
+    apply_stock_deltas(deltas)
+    return OrderProductAllocation.objects.bulk_create([
+        OrderProductAllocation(
+            order_product_id=op_id, inventory_id=inventory_id, quantity=qty)
+        for (op_id, inventory_id), qty in merged.items()
+    ])
+
+
+def restock_row(product, inventory_id=None):
+    rows = store_stock(InventoryProduct.objects.filter(product=product))
+    if inventory_id is not None:
+        rows = rows.filter(inventory_id=inventory_id)
+    return rows.order_by(
+        'inventory__priority', 'inventory_id', '-id'
+    ).values_list('id', flat=True).first()
+
+
+@transaction.atomic
+def release_order_product(order_product, qty):
+    """
+    Puts `qty` of a line back into the inventories it was taken from,
+    latest allocation first. Lines placed before allocations existed go
+    back to the seller's first inventory.
+    """
+    if qty <= 0 or order_product.product_id is None:
+        return
+    deltas = {}
+    allocations = order_product.allocations.select_for_update().filter(
+        quantity__gt=F('released_qty')).order_by('-id')
+    for allocation in allocations:
+        if qty <= 0:
+            break
+        take = min(allocation.quantity - allocation.released_qty, qty)
+        inv_prod_id = restock_row(order_product.product, allocation.inventory_id)
+        if inv_prod_id is None:
+            continue
+        deltas[inv_prod_id] = deltas.get(inv_prod_id, 0) + take
+        allocation.released_qty += take
+        allocation.save(update_fields=['released_qty', 'updated_at'])
+        qty -= take
+
+    if qty > 0:
+        inv_prod_id = restock_row(order_product.product)
+        if inv_prod_id is not None:
+            deltas[inv_prod_id] = deltas.get(inv_prod_id, 0) + qty
+    apply_stock_deltas(deltas)
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class StoreConfig(AppConfig):
+    name = 'app.store'
+
+    def ready(self):
+        import app.store.signals
@@ -0,0 +1,93 @@
+import threading
+
+from django.conf import settings
+
+from app.store.models import City
+from app.store.versions import current_version, bump_version
+
+CITY_TREE_VERSION_KEY = "cities:version"
+CITY_FIELDS = ('id', 'name', 'nameAR', 'governerate', 'governerateAR',
+               'parent_id', 'delivery_cost', 'delicon_city_id')
+
+
+class CityTree:
+    """
+    All cities and areas held in memory, keyed by id, with the shipping
+    cost of each node resolved up the parent chain on first use.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.nodes = {row["id"]: row for row in rows}
+        self.children = {}
+        for row in rows:
+            self.children.setdefault(row["parent_id"], []).append(row["id"])
+        self.costs = {}
+        self.areas_payload = [
+            {"id": row["id"], "name": row["name"], "nameAR": row["nameAR"],
+             "governerate": row["governerate"], "governerateAR": row["governerateAR"]}
+            for row in rows]
+
+    def ancestors(self, city_id):
+        seen = set()
+        while city_id in self.nodes and city_id not in seen:
+            seen.add(city_id)
+            yield self.nodes[city_id]
+            city_id = self.nodes[city_id]["parent_id"]
+
+    def shipping_cost(self, city_id):
+        """Delivery cost of the nearest city up the chain that sets one."""
+        if city_id not in self.costs:
+            cost = None
+            for node in self.ancestors(city_id):
+                if node["delivery_cost"]:
+                    cost = node["delivery_cost"]
+                    break
+            self.costs[city_id] = cost
+        return self.costs[city_id]
+
+
+lock = threading.Lock()
+loaded = {"tree": None}
+
+
+def get_city_tree():
+    version = current_version(CITY_TREE_VERSION_KEY)
+    tree = loaded["tree"]
+    if tree is None or tree.version != version:
+        with lock:
+            tree = loaded["tree"]
+            if tree is None or tree.version != version:
+                tree = CityTree(version, list(
+                    City.objects.order_by('name').values(*CITY_FIELDS)))
+                loaded["tree"] = tree
+    return tree
+
+
+def invalidate_city_tree():
+    """New version for every process, the tree reloads on next use."""
+    bump_version(CITY_TREE_VERSION_KEY)
+    loaded["tree"] = None
+
+
+def address_shipping_cost(address, tree=None):
+    if address is None:
+        return settings.SHIPPING_CHARGE
+    if address.area_id:
+        cost = (tree or get_city_tree()).shipping_cost(address.area_id)
+        if cost is not None:
+            return cost
+    if address.shipping_charge:
+        return address.shipping_charge
+    return settings.SHIPPING_CHARGE
+
+
+def shipping_costs(addresses):
+    tree = get_city_tree()
+    return {address.id: address_shipping_cost(address, tree)
+            for address in addresses}
+
+
+def shipping_areas_payload():
+    tree = get_city_tree()
+    return tree.version, tree.areas_payload
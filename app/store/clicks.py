@@ -0,0 +1,113 @@
+from collections import Counter
+
+from django.db import transaction, connection
+from django.db.models import F, Case, When, Value, IntegerField
+from django.utils.timezone import now, localtime
+
+from app.store.models import Banner, BannerClickHistory, BannerClickBucket
+from app.utilities.helpers import report_to_developer
+
+BANNER_CLICK_FLUSH_BATCH_SIZE = 1000
+
+
+def upsert(table, columns, conflict, update, rows):
+    """INSERT ... ON CONFLICT DO UPDATE of `rows`, `update` being the SET clause."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {table} ({columns}) VALUES {rows} "
+            "ON CONFLICT ({conflict}) DO UPDATE SET {update}".format(
+                table=connection.ops.quote_name(table),
+                columns=", ".join(columns),
+                rows=", ".join(["(%s)" % ", ".join(["%s"] * len(columns))] * len(rows)),
+                conflict=", ".join(conflict),
+                update=update.format(table=connection.ops.quote_name(table))),
+            [value for row in rows for value in row])
+
+
+def record_banner_click(banner_id, at=None):
+    """
+    Adds a click to the banner's bucket of the current minute. Buckets
+    are in the database, so no click is lost when a Lambda container is
+    frozen or recycled, and a burst on one banner only touches that row.
+    """
+    minute = (at or now()).replace(second=0, microsecond=0)
+    upsert(BannerClickBucket._meta.db_table,
+           ["banner_id", "minute", "clicks"], ["banner_id", "minute"],
+           "clicks = {table}.clicks + EXCLUDED.clicks",
+           [(banner_id, minute, 1)])
+
+
+def write_banner_clicks(counts):
+    """
+    Adds the (banner, minute) counts to Banner.clicks with one UPDATE and
+    to the daily history with one upsert.
+    """
+    per_banner = Counter()
+    per_day = Counter()
+    for (banner_id, minute), clicks in counts.items():
+        per_banner[banner_id] += clicks
+        per_day[(banner_id, localtime(minute).date())] += clicks
+
+    banner_ids = set(Banner.objects.filter(
+        pk__in=per_banner.keys()).values_list('id', flat=True))
+    if not banner_ids:
+        return 0
+
+    Banner.objects.filter(pk__in=banner_ids).update(clicks=F('clicks') + Case(
+        *[When(pk=banner_id, then=Value(per_banner[banner_id]))
+          for banner_id in sorted(banner_ids)],
+        default=Value(0), output_field=IntegerField()))
+
+    upsert(BannerClickHistory._meta.db_table,
+           ["banner_id", "date", "clicks", "created_at", "updated_at"],
+           ["banner_id", "date"],
+           "clicks = {table}.clicks + EXCLUDED.clicks, "
+           "updated_at = EXCLUDED.updated_at",
+           [(banner_id, day, clicks, now(), now())
+            for (banner_id, day), clicks in sorted(per_day.items())
+            if banner_id in banner_ids])
+    return sum(per_banner[banner_id] for banner_id in banner_ids)
+
+
+@transaction.atomic
+def flush_banner_click_buckets(batch_size=BANNER_CLICK_FLUSH_BATCH_SIZE):
+    """
+    Moves a batch of closed buckets, those of past minutes, into the
+    banners and their history and deletes them. Buckets taken by another
+    flush are skipped. Returns the number of buckets flushed.
+    """
+    buckets = list(BannerClickBucket.objects.select_for_update(
+        skip_locked=True).filter(
+        minute__lt=now().replace(second=0, microsecond=0)
+    ).order_by('minute', 'banner_id').values_list(
+        'id', 'banner_id', 'minute', 'clicks')[:batch_size])
+    if not buckets:
+        return 0
+    write_banner_clicks(Counter({
+        (banner_id, minute): clicks for bucket_id, banner_id, minute, clicks in buckets}))
+    BannerClickBucket.objects.filter(
+        pk__in=[bucket[0] for bucket in buckets]).delete()
+    return len(buckets)
+
+
+def flush_banner_clicks(batch_size=BANNER_CLICK_FLUSH_BATCH_SIZE):
+    flushed = 0
+    while True:
+        count = flush_banner_click_buckets(batch_size)
+        if not count:
+            return flushed
+        flushed += count
+
+
+def scheduled_flush(event, context):
+    """
+    Entry point of the scheduled zappa event, e.g.
+    {"function": "app.store.clicks.scheduled_flush", "expression": "rate(1 minute)"}.
+    Failures are reported; the buckets stay for the next run.
+    """
+    try:
+        return flush_banner_clicks()
+    except Exception as e:
+        print("Banner click flush failed: %s" % e)
+        report_to_developer("Issue in banner click flush", str(e))
+        return 0
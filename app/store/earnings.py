@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+from django.db.models import Sum, F, FloatField
+
+from app.order.models import OrderProduct
+from app.order.rollups import line_unit_price, paid_orders
+from app.product.models import Category
+from app.store.models import Commission
+
+
+def category_parents():
+    return dict(Category.objects.values_list('id', 'parent_id'))
+
+
+def commission_category(category_id, percentages, parents):
+    # Walk up the tree until a category the seller has a commission on,
+    # so a commission on a main category covers its whole subtree.
+    seen = set()
+    while category_id and category_id not in seen:
+        if category_id in percentages:
+            return category_id
+        seen.add(category_id)
+        category_id = parents.get(category_id)
+    return None
+
+
+def seller_earnings(store_ids):
+    """
+    Returns {store_id: {"sales", "earnings", "categories"}} for the given
+    sellers. Sales are the seller's own line totals on paid orders and
+    earnings are those lines times the commission percentage of the
+    closest commissioned ancestor category.
+    """
+    store_ids = list(store_ids)
+    result = {
+        store_id: {"sales": 0.0, "earnings": 0.0, "categories": {}}
+        for store_id in store_ids}
+    if not store_ids:
+        return result
+
+    percentages = defaultdict(dict)
+    for seller_id, category_id, percentage in Commission.objects.filter(
+            seller__pk__in=store_ids).order_by('id').values_list(
+            'seller_id', 'category_id', 'percentage'):
+        percentages[seller_id][category_id] = percentage
+
+    lines = OrderProduct.objects.filter(
+        order__in=paid_orders(),
+        product__store__pk__in=store_ids
+    ).values('product__store', 'product__category').annotate(
+        revenue=Sum(line_unit_price() * F('quantity'),
+                    output_field=FloatField())
+    ).order_by()
+
+    parents = category_parents()
+    for line in lines:
+        store_id = line['product__store']
+        revenue = line['revenue'] or 0.0
+        seller = result[store_id]
+        seller["sales"] += revenue
+
+        category_id = commission_category(
+            line['product__category'], percentages[store_id], parents)
+        if category_id is None:
+            continue
+        percentage = percentages[store_id][category_id]
+        category = seller["categories"].setdefault(
+            category_id, {"sales": 0.0, "earnings": 0.0,
+                          "percentage": percentage})
+        category["sales"] += revenue
+        category["earnings"] += revenue * percentage / 100
+        seller["earnings"] += revenue * percentage / 100
+    return result
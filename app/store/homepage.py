@@ -0,0 +1,231 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from app.store.models import HomePageItems, HomePageItemValues, HomePageSnapshot
+from app.utilities.transactions import on_commit_once
+
+HOME_PAGE_DEVICES = ("MOB", "WEB")
+HOME_PAGE_LANG_CODES = ("en", "ar")
+HOME_PAGE_CACHE_KEY = "homepage:%s:%s"
+
+
+def file_url(image):
+    if image:
+        return image.url
+    return None
+
+
+def localized(obj, field, lang_code):
+    if lang_code == "ar":
+        return getattr(obj, field + "AR", None) or getattr(obj, field)
+    return getattr(obj, field)
+
+
+def device_order(obj, device):
+    if device == "WEB":
+        if obj.shuffling_order_for_web is not None:
+            return obj.shuffling_order_for_web
+        return obj.order_for_web
+    if obj.shuffling_order_for_mob is not None:
+        return obj.shuffling_order_for_mob
+    return obj.order_for_mob
+
+
+def sort_key(entry):
+    return (entry["order"] is None, entry["order"] or 0, entry["id"])
+
+
+def value_image(value, device, lang_code):
+    images = [value.image_ar, value.image] if lang_code == "ar" else [value.image]
+    if device == "WEB":
+        web_images = [value.image_web_ar, value.image_web] if lang_code == "ar" else [value.image_web]
+        images = web_images + images
+    for image in images:
+        if image:
+            return image.url
+    return None
+
+
+def compile_value(value, device, lang_code):
+    return {
+        "id": value.id,
+        "order": device_order(value, device),
+        "name": localized(value, "name", lang_code),
+        "image": value_image(value, device, lang_code),
+        "icon": file_url(value.icon),
+        "background_image": file_url(value.background_image),
+        "border_colour": value.border_colour,
+        "base_price": value.base_price,
+        "discounted_price": value.discounted_price,
+        "discount_percent": value.discount_percent,
+        "currency": value.currency,
+        "brand_name": value.brand_name,
+        "brand_image": file_url(value.brand_image),
+        "seller_name": value.seller_name,
+        "seller_image": file_url(value.seller_image),
+        "object_id": value.object_id,
+        "object_ids": value.object_ids,
+        "object_type": value.object_type,
+        "category": value.category_id,
+        "url_link": value.url_link,
+    }
+
+
+def compile_banner(banner, lang_code):
+    if not banner:
+        return None
+    if lang_code == "ar" and banner.banner_image_ar:
+        image = banner.banner_image_ar
+    else:
+        image = banner.banner_image
+    return {
+        "id": banner.id,
+        "name": localized(banner, "name", lang_code),
+        "image": file_url(image),
+        "link": banner.link,
+        "url": banner.url,
+        "product": banner.product_id,
+        "collection": banner.collection_id,
+        "category": banner.category_id,
+        "seller": banner.seller_id,
+    }
+
+
+def compile_collection(collection, lang_code):
+    if not collection:
+        return None
+    return {
+        "id": collection.id,
+        "name": localized(collection, "name", lang_code),
+        "status": collection.status,
+    }
+
+
+def compile_item(item, device, lang_code):
+    if lang_code == "ar" and item.title_image_ar:
+        title_image = item.title_image_ar
+    else:
+        title_image = item.title_image
+    item_values = sorted(
+        [compile_value(value, device, lang_code)
+         for value in item.homepageitemvalues.all()],
+        key=sort_key)
+    return {
+        "id": item.id,
+        "order": device_order(item, device),
+        "type": item.type,
+        "name": localized(item, "name", lang_code),
+        "title_alignment": item.title_alignment,
+        "title_image": file_url(title_image),
+        "no_of_rows": item.no_of_rows,
+        "can_see_all": item.can_see_all,
+        "banner": compile_banner(item.banner, lang_code),
+        "collection": compile_collection(item.collection, lang_code),
+        "item_values_count": len(item_values),
+        "item_values": item_values,
+    }
+
+
+def home_page_items(item_ids=None):
+    qs = HomePageItems.objects.filter(hidden=False).select_related(
+        'banner', 'collection'
+    ).prefetch_related(
+        Prefetch('homepageitemvalues',
+                 queryset=HomePageItemValues.objects.order_by('id'))
+    )
+    if item_ids is not None:
+        qs = qs.filter(pk__in=item_ids)
+    return list(qs)
+
+
+def item_on_device(item, device):
+    return item.device in [device, "WEBANDMOB"]
+
+
+def document_etag(results):
+    return hashlib.sha1(json.dumps(
+        results, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def save_snapshot(device, lang_code, results):
+    results = sorted(results, key=sort_key)
+    etag = document_etag(results)
+    snapshot, created = HomePageSnapshot.objects.select_for_update().get_or_create(
+        device=device, lang_code=lang_code)
+    if snapshot.etag != etag:
+        snapshot.version += 1
+        snapshot.etag = etag
+        snapshot.payload = {"version": snapshot.version, "results": results}
+        snapshot.save()
+    cache_snapshot(snapshot)
+    return snapshot
+
+
+def cache_snapshot(snapshot):
+    cache.set(HOME_PAGE_CACHE_KEY % (snapshot.device, snapshot.lang_code),
+              (snapshot.version, snapshot.etag, snapshot.payload), None)
+
+
+@transaction.atomic
+def rebuild_home_page():
+    items = home_page_items()
+    for device in HOME_PAGE_DEVICES:
+        for lang_code in HOME_PAGE_LANG_CODES:
+            save_snapshot(device, lang_code, [
+                compile_item(item, device, lang_code)
+                for item in items if item_on_device(item, device)])
+
+
+@transaction.atomic
+def refresh_home_page_items(item_ids):
+    """
+    Recompiles only the given items in every snapshot. Items that were
+    deleted or hidden drop out, the rest keep their compiled entries.
+    """
+    item_ids = set(item_ids)
+    items = home_page_items(item_ids)
+    for device in HOME_PAGE_DEVICES:
+        for lang_code in HOME_PAGE_LANG_CODES:
+            snapshot = HomePageSnapshot.objects.filter(
+                device=device, lang_code=lang_code).first()
+            if snapshot is None:
+                results = [
+                    compile_item(item, device, lang_code)
+                    for item in home_page_items() if item_on_device(item, device)]
+            else:
+                results = [
+                    entry for entry in snapshot.payload.get("results", [])
+                    if entry["id"] not in item_ids]
+                results += [
+                    compile_item(item, device, lang_code)
+                    for item in items if item_on_device(item, device)]
+            save_snapshot(device, lang_code, results)
+
+
+def mark_home_page_items_changed(item_ids):
+    """Refreshes the snapshots showing the items once the transaction commits."""
+    on_commit_once("home_page_items", item_ids, refresh_home_page_items)
+
+
+def get_home_page_snapshot(device, lang_code):
+    """
+    The cached snapshot while its version matches the database row, so a
+    process whose cache is not shared never serves an outdated page.
+    """
+    version = HomePageSnapshot.objects.filter(
+        device=device, lang_code=lang_code).values_list('version', flat=True).first()
+    cached = cache.get(HOME_PAGE_CACHE_KEY % (device, lang_code))
+    if cached is not None and version is not None and cached[0] == version:
+        return cached[1], cached[2]
+    snapshot = HomePageSnapshot.objects.filter(
+        device=device, lang_code=lang_code).first()
+    if snapshot is None:
+        rebuild_home_page()
+        snapshot = HomePageSnapshot.objects.get(
+            device=device, lang_code=lang_code)
+    cache_snapshot(snapshot)
+    return snapshot.etag, snapshot.payload
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.order.models import Order
+from app.store.allocation import allocate_order, InsufficientStock, ALLOCATION_STRATEGIES
+
+
+class Command(BaseCommand):
+    help = "Allocates the lines of the given orders to inventories and takes their stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument("order_ids", nargs="+", type=int)
+        parser.add_argument("--strategy", dest="strategy", default="priority",
+                            choices=ALLOCATION_STRATEGIES)
+
+    def handle(self, *args, **options):
+        for order in Order.objects.filter(pk__in=options["order_ids"]):
+            try:
+                allocations = allocate_order(order, strategy=options["strategy"])
+            except InsufficientStock as e:
+                raise CommandError("Order %s: %s" % (order.id, e))
+            self.stdout.write("Order %s: %s allocations" % (order.id, len(allocations)))
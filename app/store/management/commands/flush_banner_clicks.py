@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app.store.clicks import flush_banner_clicks, BANNER_CLICK_FLUSH_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Adds the banner clicks of past minutes to the banners and their history. Run it on a schedule"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int,
+                            default=BANNER_CLICK_FLUSH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        flushed = flush_banner_clicks(batch_size=options["batch_size"])
+        self.stdout.write("Flushed %s banner click buckets" % flushed)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.store.homepage import rebuild_home_page
+
+
+class Command(BaseCommand):
+    help = "Recompiles the home page snapshots of every device and language"
+
+    def handle(self, *args, **options):
+        rebuild_home_page()
+        self.stdout.write("Home page snapshots rebuilt")
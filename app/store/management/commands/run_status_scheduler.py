@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from app.store.scheduler import fire_due_status_changes, next_status_change_at, \
+    rebuild_status_schedule
+
+
+class Command(BaseCommand):
+    help = "Flips banner, collection, coupon and seller statuses as their windows open and close"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", dest="rebuild",
+                            help="Resync every status and rebuild the schedule first")
+        parser.add_argument("--loop", action="store_true", dest="loop",
+                            help="Keep running, waking up for the next transition")
+        parser.add_argument("--max-sleep", dest="max_sleep", type=float, default=60.0,
+                            help="Longest wait between two checks of the schedule")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            rebuild_status_schedule()
+            self.stdout.write("Status schedule rebuilt")
+        while True:
+            fired = fire_due_status_changes()
+            if fired:
+                self.stdout.write("%s status changes fired" % fired)
+                continue
+            if not options["loop"]:
+                break
+            next_at = next_status_change_at()
+            sleep = options["max_sleep"]
+            if next_at:
+                sleep = min(max((next_at - now()).total_seconds(), 0), sleep)
+            time.sleep(sleep)
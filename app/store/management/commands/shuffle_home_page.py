@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils.timezone import localdate
+
+from app.store.models import HomePageItemLastShuffledAt
+from app.store.shuffle import shuffle_home_page
+
+
+class Command(BaseCommand):
+    help = "Shuffles the home page sections once a day, keeping pinned ones in place"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", dest="seed", type=int, default=None,
+                            help="Replay the order of a stored seed")
+        parser.add_argument("--force", action="store_true", dest="force",
+                            help="Shuffle even if today was already shuffled")
+
+    def handle(self, *args, **options):
+        if not options["force"] and options["seed"] is None and \
+                HomePageItemLastShuffledAt.objects.filter(
+                    created_date=localdate()).exists():
+            self.stdout.write("Home page already shuffled today")
+            return
+        shuffle = shuffle_home_page(seed=options["seed"])
+        self.stdout.write("Home page shuffled with seed %s" % shuffle.seed)
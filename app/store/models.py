@@ -1,14 +1,13 @@
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.core.validators import FileExtensionValidator
 from django.db import models
-from django.db.models import CASCADE, Sum, F
+from django.db.models import CASCADE
 from phonenumber_field.modelfields import PhoneNumberField
 
 # Create your models here.
 from phonenumbers import national_significant_number
 
 from app.authentication.models import Member
-from app.order.models import Order
 
 
 class Store(models.Model):
@@ -84,49 +83,22 @@ class Store(models.Model):
     def sub_admins(self):
         return self.seller_sub_admins.all()
 
-    def get_sales(self):
-        orders_sales_price = Order.objects.filter(
-            payments__status='SU',
-            orderProducts__product__store=self
-        ).aggregate(price=Sum(F('totalPrice'))).get(
-            'price')
+    def get_default_inventory(self):
+        return self.inventories.order_by('priority', 'id').first()
 
+    def get_sales(self):
+        orders_sales_price = self.get_sales_float()
         if orders_sales_price:
             return "{0:.3f}".format(orders_sales_price)
         return 0
 
     def get_sales_float(self):
-        orders_sales_price = Order.objects.filter(
-            payments__status='SU',
-            orderProducts__product__store=self
-        ).aggregate(price=Sum(F('totalPrice'))).get(
-            'price')
-
-        if orders_sales_price:
-            return orders_sales_price
-        return 0
+        from app.store.earnings import seller_earnings
+        return seller_earnings([self.pk])[self.pk]["sales"]
 
     def get_earnings(self):
-        sales = self.get_sales_float()
-        if self.commission.exists():
-            commission = self.commission.all().values(
-                'percentage', 'category__id').order_by(
-                'category__id').distinct('category__id')
-            total_commission = 0
-            for c in commission:
-                category_id = c.get('category__id')
-                percentage = c.get('percentage')
-                cat_sales_price = Order.objects.filter(
-                    payments__status='SU',
-                    orderProducts__product__store=self,
-                    orderProducts__product__category_id=category_id
-                ).aggregate(price=Sum(F('totalPrice'))).get('price')
-                if cat_sales_price:
-                    commission_per_cat = cat_sales_price - (
-                            cat_sales_price * percentage) / 100
-                    total_commission += commission_per_cat
-            return sales - total_commission
-        return 0
+        from app.store.earnings import seller_earnings
+        return seller_earnings([self.pk])[self.pk]["earnings"]
 
     class Meta:
         ordering = ('name',)
@@ -168,6 +140,8 @@ class Inventory(models.Model):
     admins = models.ManyToManyField(
         "authentication.Member", related_name="inventories",
         blank=True, default=None)
+    # Lower numbers are allocated from first
+    priority = models.SmallIntegerField(default=0)
 
     def __str__(self):
         return "-".join([self.name, str(self.store.__str__())])
@@ -266,6 +240,8 @@ class HomePageItems(models.Model):
         blank=True, null=True)
     shuffling_order_for_mob = models.IntegerField(
         blank=True, null=True)
+    # pinned items keep their position when the home page is shuffled
+    pinned = models.BooleanField(default=False)
 
     no_of_rows = models.PositiveIntegerField(default=1)
     hidden = models.BooleanField(default=False)
@@ -358,6 +334,7 @@ class HomePageItemValues(models.Model):
         blank=True, null=True)
     shuffling_order_for_mob = models.IntegerField(
         blank=True, null=True)
+    pinned = models.BooleanField(default=False)
 
     member = models.ForeignKey(
         "authentication.Member", on_delete=CASCADE,
@@ -385,12 +362,39 @@ class HomePageItemLastShuffledAt(models.Model):
     updated_at = models.DateTimeField(null=True, blank=True)
     preserved_order = models.CharField(
         max_length=255, blank=True, null=True)
+    seed = models.BigIntegerField(blank=True, null=True)
 
     class Meta:
         ordering = ('id',)
         verbose_name_plural = 'homepageitemlastshuffledat'
 
 
+class HomePageSnapshot(models.Model):
+    DEVICE_CHOICES = (
+        ('MOB', 'Mobile'),
+        ('WEB', 'Web'),
+    )
+    device = models.CharField(
+        max_length=3, choices=DEVICE_CHOICES)
+    lang_code = models.CharField(max_length=5)
+    version = models.PositiveIntegerField(default=0)
+    etag = models.CharField(max_length=64, blank=True)
+    payload = JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return ' - '.join(
+            [self.device, self.lang_code, str(self.version)]
+        )
+
+    class Meta:
+        ordering = ('id',)
+        unique_together = ('device', 'lang_code')
+        verbose_name_plural = 'homepagesnapshots'
+
+
 class SellerPageItems(models.Model):
     DEVICE_CHOICES = (
         ('MOB', 'Mobile'),
@@ -1041,3 +1045,101 @@ class TopDealsBanner(models.Model):
         return " ".join([
             self.seller.__str__(), self.type, self.link
         ])
+
+
+class ScheduledStatusChange(models.Model):
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveIntegerField()
+    fire_at = models.DateTimeField(db_index=True)
+    from_statuses = ArrayField(
+        models.CharField(max_length=3), default=list)
+    to_status = models.CharField(max_length=3)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('fire_at', 'id')
+        index_together = (
+            ('model', 'object_id'),
+        )
+
+    def __str__(self):
+        return ' - '.join(
+            [self.model, str(self.object_id), self.to_status, str(self.fire_at)]
+        )
+
+
+class BannerClickHistory(models.Model):
+    banner = models.ForeignKey(
+        'store.Banner', related_name='click_history',
+        on_delete=CASCADE)
+    date = models.DateField()
+    clicks = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-date', 'banner')
+        unique_together = ('banner', 'date')
+
+    def __str__(self):
+        return ' - '.join(
+            [str(self.banner_id), str(self.date), str(self.clicks)]
+        )
+
+
+class BannerClickBucket(models.Model):
+    """
+    Clicks of a banner in one minute, waiting to be added to the banner
+    and its daily history. The banner id is not a foreign key so clicks
+    on a banner deleted meanwhile are dropped at flush time.
+    """
+    banner_id = models.IntegerField()
+    minute = models.DateTimeField()
+    clicks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('minute', 'banner_id')
+        unique_together = ('banner_id', 'minute')
+
+    def __str__(self):
+        return ' - '.join(
+            [str(self.banner_id), str(self.minute), str(self.clicks)]
+        )
+
+
+class OrderProductAllocation(models.Model):
+    order_product = models.ForeignKey(
+        'order.OrderProduct', related_name='allocations',
+        on_delete=CASCADE)
+    inventory = models.ForeignKey(
+        'store.Inventory', related_name='allocations',
+        on_delete=CASCADE)
+    quantity = models.IntegerField(default=0)
+    released_qty = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('id',)
+
+    def __str__(self):
+        return ' - '.join(
+            [str(self.order_product_id), self.inventory.__str__(), str(self.quantity)]
+        )
+
+
+class CacheVersion(models.Model):
+    """
+    Version of data each process keeps in memory, bumped on writes so
+    every process sees the change without a shared cache.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return ' - '.join([self.key, str(self.version)])
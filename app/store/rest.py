@@ -1,5 +1,7 @@
+import csv
 import os
 import sys
+from django.db import transaction
 from django.db.models import Q, Count, F, Sum, Case, When
 from rest_framework import viewsets, status
 from rest_framework.generics import CreateAPIView, ListAPIView, UpdateAPIView, get_object_or_404, RetrieveAPIView
@@ -9,24 +11,31 @@ from rest_framework.views import APIView
 from app.authentication.models import Member
 from app.authentication.models.extensions import Rank
 from app.authentication.permissions import IsSuperAdmin, IsSuperAdminOrSeller, IsSuperAdminOrObjectSeller
+from app.authentication.scope import SellerScopeMixin
 from app.authentication.serializers import GetSellerSerializer, MemberSerializer, SellerSerializer, \
     SellerDetailSerializer, SellerListSerializer, InventoryListSerializer, MemberEcommEditSerializer, \
     EditSellerSerializer, EditSellerBeconSerializer, SellerListCollectionSerializer
 from app.ecommnotification.zappa_tasks import send_product_to_category_push, send_new_brand_push
 from app.order.models import Order
 from app.product.models import ProductCollection, Brand
+from app.product.search import ranked_search
 from app.product.utils import json_list
+from app.store.clicks import record_banner_click
+from app.store.earnings import seller_earnings
+from app.store.homepage import get_home_page_snapshot, HOME_PAGE_DEVICES, HOME_PAGE_LANG_CODES
 from app.store.models import Store, Inventory, InventoryProduct, Banner, TopDealsBanner, HomePageItems
 from app.store.serializers import AddBannerSerializer, BannerDetailSerializer, BannerListSerializer, \
     EditBannerSerializer, EditHomePageBannerSerializer, AddHomePageBannerSerializer, AddTopDealsBannerSerializer, \
     EditTopDealsBannerSerializer, TopDealsBannerDetailSerializer, TopDealsBannerListSerializer, \
     AddNewArrivalBannerSerializer, EditNewArrivalBannerSerializer
+from app.store.stock import editable_inventories, editable_inventory_products, parse_stock_csv, apply_stock_rows, \
+    with_inventory_list_data, LOW_STOCK_THRESHOLD
 from app.store.zappa_tasks import assign_seller_page_banner_card_small, assign_seller_page_categories, \
     assign_seller_page_all_prods, assign_home_page_banner_card_small, assign_home_page_carousal_new_arrivals, \
     assign_top_deals_page_banner_card_small, assign_collections_to_home_page, assign_seller_page_banner_card_large, \
     assign_home_page_banner_card_rearranged, resize_seller_logo
 from app.utilities.cache_invalidation import create_invalidation
-from app.utilities.helpers import str2bool, report_to_developer
+from app.utilities.helpers import str2bool, report_to_developer, bulk_update
 from app.utilities.utils import is_email_valid
 
 
@@ -129,12 +138,7 @@ class SellerList(ListAPIView):
         return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "store", search_string)
 
     def get_serializer_context(self):
         return {"user": self.request.user,
@@ -192,26 +196,35 @@ class SellerList(ListAPIView):
                     F('products')
                 )).order_by('-prod_count')
 
-            if sort_by == "sales_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_sales_float(),
-                            reverse=False)
-            if sort_by == "sales_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_sales_float(),
-                            reverse=True)
-
-            if sort_by == "earnings_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_earnings(),
-                            reverse=False)
-            if sort_by == "earnings_high_to_low":
+            if sort_by in ["sales_low_to_high", "sales_high_to_low",
+                           "earnings_low_to_high", "earnings_high_to_low"]:
+                self.seller_earnings = seller_earnings(
+                    qs.values_list('id', flat=True))
+                sort_key = sort_by.split("_")[0]
                 qs = sorted(qs,
-                            key=lambda t: t.get_earnings(),
-                            reverse=True)
+                            key=lambda t: self.seller_earnings[t.id][sort_key],
+                            reverse=sort_by.endswith("high_to_low"))
 
         return qs
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        sellers = page if page is not None else queryset
+
+        context = self.get_serializer_context()
+        if hasattr(self, "seller_earnings"):
+            context["seller_earnings"] = self.seller_earnings
+        else:
+            context["seller_earnings"] = seller_earnings(
+                [seller.id for seller in sellers])
+
+        serializer = self.get_serializer_class()(
+            sellers, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
     def post(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -226,12 +239,7 @@ class SellerListForCollection(ListAPIView):
         return [m.upper() for m in self.http_method_names if hasattr(self, m)]
 
     def search(self, qs, search_string):
-        for qstring in search_string.split(" "):
-            qs = qs.filter(
-                Q(name__icontains=qstring)
-                | Q(nameAR__icontains=qstring)
-            ).order_by('id').distinct()
-        return qs
+        return ranked_search(qs, "store", search_string)
 
     def get_serializer_context(self):
         return {"user": self.request.user,
@@ -289,23 +297,11 @@ class SellerListForCollection(ListAPIView):
                     F('products')
                 )).order_by('-prod_count')
 
-            if sort_by == "sales_low_to_high":
+            if sort_by in ["sales_low_to_high", "sales_high_to_low"]:
+                sales = seller_earnings(qs.values_list('id', flat=True))
                 qs = sorted(qs,
-                            key=lambda t: t.get_sales_float(),
-                            reverse=False)
-            if sort_by == "sales_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_sales_float(),
-                            reverse=True)
-
-            if sort_by == "earnings_low_to_high":
-                qs = sorted(qs,
-                            key=lambda t: t.get_earnings(),
-                            reverse=False)
-            if sort_by == "earnings_high_to_low":
-                qs = sorted(qs,
-                            key=lambda t: t.get_earnings(),
-                            reverse=True)
+                            key=lambda t: sales[t.id]["sales"],
+                            reverse=sort_by == "sales_high_to_low")
 
         return qs
 
@@ -360,7 +356,7 @@ class ChangeSellersStatus(APIView):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class InventoryList(ListAPIView):
+class InventoryList(SellerScopeMixin, ListAPIView):
     permission_classes = [IsSuperAdminOrSeller]
     serializer_class = InventoryListSerializer
     queryset = InventoryProduct.objects.all()
@@ -379,6 +375,7 @@ class InventoryList(ListAPIView):
 
     def get_serializer_context(self):
         return {"user": self.request.user,
+                "seller_scope": self.request.seller_scope,
                 "lang_code": self.request.query_params.get("lang_code", "")}
 
     def get_queryset(self):
@@ -390,20 +387,11 @@ class InventoryList(ListAPIView):
         brand_ids = self.request.data.get("brand_ids", "")
 
         if self.request.user.is_seller:
-            sub_admins = self.request.user.seller_sub_admins.all()
-            if sub_admins.exists():
-                sub_admin = sub_admins.latest('id')
-                qs = InventoryProduct.objects.filter(
-                    inventory__store=sub_admin.store
-                ).annotate(variant_count=Count('product__productVariantValue', distinct=True)).exclude(
-                    Q(variant_count=0, product__parent__isnull=False) |
-                    Q(product__parent=None, product__children__isnull=False))
-            else:
-                qs = InventoryProduct.objects.filter(
-                    inventory__store__member=self.request.user,
-                ).annotate(variant_count=Count('product__productVariantValue', distinct=True)).exclude(
-                    Q(variant_count=0, product__parent__isnull=False) |
-                    Q(product__parent=None, product__children__isnull=False))
+            qs = self.request.seller_scope.filter(
+                InventoryProduct.objects.all(), "inventory__store"
+            ).annotate(variant_count=Count('product__productVariantValue', distinct=True)).exclude(
+                Q(variant_count=0, product__parent__isnull=False) |
+                Q(product__parent=None, product__children__isnull=False))
         else:
             qs = InventoryProduct.objects.all().annotate(
                 variant_count=Count(
@@ -429,6 +417,8 @@ class InventoryList(ListAPIView):
             qs = qs.filter(quantity__gt=0)
         if stock_status == "OUS":
             qs = qs.filter(quantity=0)
+        if stock_status == "LOW":
+            qs = qs.filter(quantity__gt=0, quantity__lte=LOW_STOCK_THRESHOLD)
 
         if sort_by != "":
             if sort_by == "PRODNAMEATOZ":
@@ -451,7 +441,7 @@ class InventoryList(ListAPIView):
             if sort_by == "avail_low_to_high":
                 qs = qs.order_by('quantity')
 
-        return qs
+        return with_inventory_list_data(qs)
 
     def post(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -488,6 +478,54 @@ class InventoryQtyUpdate(APIView):
                         status=status.HTTP_200_OK)
 
 
+class BulkStockUpdate(APIView):
+    permission_classes = [IsSuperAdminOrSeller]
+
+    def post(self, request):
+        rows = request.data.get("rows", "")
+        inventory_id = request.data.get("inventory_id", "")
+        stock_file = request.FILES.get("file")
+
+        if stock_file:
+            try:
+                rows = parse_stock_csv(stock_file)
+            except (UnicodeDecodeError, csv.Error) as e:
+                return Response({"error": "Invalid csv file: %s" % e},
+                                status=status.HTTP_400_BAD_REQUEST)
+        elif rows != "" and json_list(rows)[0]:
+            rows = json_list(rows)[1]
+        else:
+            rows = []
+
+        if not rows:
+            return Response({"error": "Please add atleast one row"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not all([isinstance(row, dict) for row in rows]):
+            return Response({"error": "Every row should be an object"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        qs = editable_inventory_products(request.user)
+        if inventory_id != "":
+            try:
+                inventory_id = int(inventory_id)
+            except (TypeError, ValueError):
+                return Response({"error": "Invalid inventory id"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not editable_inventories(request.user).filter(pk=inventory_id).exists():
+                return Response({"error": "Inventory not found"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            qs = qs.filter(inventory_id=inventory_id)
+
+        results = apply_stock_rows(rows, qs)
+        updated = len([result for result in results if result["status"] == "updated"])
+        if updated:
+            create_invalidation()
+        return Response({"updated": updated,
+                         "failed": len(results) - updated,
+                         "results": results},
+                        status=status.HTTP_200_OK)
+
+
 class ParentBannerList(ListAPIView):
     permission_classes = [IsSuperAdminOrSeller]
     serializer_class = BannerListSerializer
@@ -671,6 +709,13 @@ class DeleteBanners(APIView):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
+def banner_peer_key(banner):
+    """Banners sharing this key need distinct ordering ids."""
+    status_class = "IN" if banner.status == "IN" else "AC"
+    owner = "HOME" if banner.is_for_homepage else banner.seller_id
+    return banner.type, owner, banner.parent_id, status_class
+
+
 class UpdateBannersOrder(APIView):
     permission_classes = [IsSuperAdminOrSeller]
 
@@ -679,55 +724,55 @@ class UpdateBannersOrder(APIView):
             banner_ids_and_order = self.request.data.get("banner_ids_and_order", "")
 
             if banner_ids_and_order != "" and json_list(banner_ids_and_order)[0]:
-                for banner_ids_and_order in json_list(banner_ids_and_order)[1]:
-                    banner_id = banner_ids_and_order.get("banner_id")
-                    banner_order = banner_ids_and_order.get("banner_order")
-                    banner = get_object_or_404(Banner, pk=banner_id)
-                    status_choices = ["AC", "SCH"]
-
-                    if banner.status in status_choices:
-                        if banner.is_for_homepage:
-                            banners = Banner.objects.filter(
-                                type=banner.type, is_for_homepage=True,
-                                ordering_id=banner_order,
-                                parent=banner.parent,
-                                status__in=status_choices
-                            ).exclude(pk=banner.pk)
-                        else:
-                            banners = Banner.objects.filter(
-                                type=banner.type, seller=banner.seller,
-                                ordering_id=banner_order,
-                                parent=banner.parent,
-                                status__in=status_choices
-                            ).exclude(pk=banner.pk)
+                new_orders = {}
+                for banner_id_and_order in json_list(banner_ids_and_order)[1]:
+                    try:
+                        banner_id = int(banner_id_and_order.get("banner_id"))
+                        banner_order = int(banner_id_and_order.get("banner_order"))
+                    except (TypeError, ValueError):
+                        return Response({"error": "Invalid banner id or order"},
+                                        status=status.HTTP_400_BAD_REQUEST)
+                    new_orders[banner_id] = banner_order
+
+                banners = {
+                    banner.id: banner for banner in Banner.objects.filter(
+                        pk__in=new_orders.keys())}
+                if len(banners) != len(new_orders):
+                    return Response({"error": "No Banner matches the given query."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+                peer_filter = Q()
+                for banner in banners.values():
+                    if banner.is_for_homepage:
+                        peer_filter |= Q(type=banner.type, is_for_homepage=True,
+                                         parent=banner.parent_id)
                     else:
-                        if banner.is_for_homepage:
-                            banners = Banner.objects.filter(
-                                type=banner.type, is_for_homepage=True,
-                                ordering_id=banner_order,
-                                parent=banner.parent,
-                                status="IN"
-                            ).exclude(pk=banner.pk)
-                        else:
-                            banners = Banner.objects.filter(
-                                type=banner.type, seller=banner.seller,
-                                ordering_id=banner_order,
-                                parent=banner.parent,
-                                status="IN"
-                            ).exclude(pk=banner.pk)
-
-                    if banners.exists():
-                        if banners.filter(is_for_homepage=True).exists():
-                            return Response(
-                                {"error": "Ordering id should be unique for status, type"},
-                                status=status.HTTP_400_BAD_REQUEST)
-                        else:
+                        peer_filter |= Q(type=banner.type, is_for_homepage=False,
+                                         seller=banner.seller_id, parent=banner.parent_id)
+
+                groups = {}
+                for banner in Banner.objects.filter(peer_filter):
+                    banner = banners.get(banner.id, banner)
+                    ordering_id = new_orders.get(banner.id, banner.ordering_id)
+                    groups.setdefault(banner_peer_key(banner), {}).setdefault(
+                        ordering_id, []).append(banner)
+
+                for (banner_type, owner, parent_id, status_class), orders in groups.items():
+                    for ordering_id, peers in orders.items():
+                        if len(peers) > 1 and any([peer.id in new_orders for peer in peers]):
+                            if owner == "HOME":
+                                return Response(
+                                    {"error": "Ordering id should be unique for status, type"},
+                                    status=status.HTTP_400_BAD_REQUEST)
                             return Response(
                                 {"error": "Ordering id should be unique for status, type, seller"},
                                 status=status.HTTP_400_BAD_REQUEST)
-                    else:
-                        banner.ordering_id = banner_order
-                        banner.save()
+
+                for banner_id, banner in banners.items():
+                    banner.ordering_id = new_orders[banner_id]
+                with transaction.atomic():
+                    bulk_update(Banner, banners.values(), ["ordering_id"],
+                                batch_size=len(banners))
                 return Response({"detail": "Banners order updated"})
             return Response({"detail": "Please select atleast one banner"},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -1036,3 +1081,42 @@ def test_function():
     print("testing zappa call later")
     report_to_developer("tested zappa later", "success")
 
+
+
+class HomePage(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        device = request.query_params.get("device", "MOB")
+        lang_code = request.query_params.get("lang_code", "en")
+        if device not in HOME_PAGE_DEVICES or lang_code not in HOME_PAGE_LANG_CODES:
+            return Response({"error": "Invalid device or lang_code"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        etag, payload = get_home_page_snapshot(device, lang_code)
+        quoted_etag = '"%s"' % etag
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if quoted_etag in [tag.strip().lstrip("W/") for tag in if_none_match.split(",")]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(payload)
+        response["ETag"] = quoted_etag
+        response["Cache-Control"] = "no-cache"
+        return response
+
+
+class BannerClick(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        banner_id = self.request.data.get("banner_id", "")
+        try:
+            banner_id = int(banner_id)
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid banner id"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        record_banner_click(banner_id)
+        return Response({"detail": "Click recorded"},
+                        status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,190 @@
+from collections import namedtuple, OrderedDict
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, Min
+from django.utils.timezone import now
+
+from app.store.homepage import mark_home_page_items_changed
+from app.store.models import ScheduledStatusChange, HomePageItems
+
+SCHEDULER_BATCH_SIZE = 500
+
+StatusWindow = namedtuple(
+    "StatusWindow",
+    ["start_field", "end_field", "active", "scheduled", "inactive"])
+
+# Models whose status follows an active window. Models without a
+# scheduled status only get switched off when the window ends.
+STATUS_WINDOWS = OrderedDict([
+    ("store.Store", StatusWindow(
+        "status_start_date", "status_end_date", "AC", None, "IN")),
+    ("store.Banner", StatusWindow(
+        "status_start_date", "status_end_date", "AC", "SCH", "IN")),
+    ("store.TopDealsBanner", StatusWindow(
+        "status_start_date", "status_end_date", "AC", "SCH", "IN")),
+    ("product.ProductCollection", StatusWindow(
+        "status_start_date", "status_end_date", "AC", "SC", "IN")),
+    ("product.Coupon", StatusWindow(
+        "active_start_date", "active_end_date", "AC", "SC", "IN")),
+])
+
+# Transitions that can change what the home page snapshots show
+HOME_PAGE_LINKS = {
+    "store.Banner": "banner_id__in",
+    "product.ProductCollection": "collection_id__in",
+}
+
+
+def live_statuses(window):
+    return [status for status in [window.active, window.scheduled] if status]
+
+
+def window_status(window, status, start, end, at):
+    """Returns the status an object should have at `at`."""
+    if status not in live_statuses(window):
+        return status
+    if end and end <= at:
+        return window.inactive
+    if window.scheduled:
+        if start and start > at:
+            return window.scheduled
+        return window.active
+    return status
+
+
+def window_transitions(window, start, end, at):
+    transitions = []
+    if window.scheduled and start and start > at:
+        transitions.append((start, [window.scheduled], window.active))
+    if end and end > at:
+        transitions.append((end, live_statuses(window), window.inactive))
+    return transitions
+
+
+def sync_status(instance, at=None):
+    """
+    Moves the status of an object about to be saved into its window.
+    Reactivating an object whose window has ended is rejected rather
+    than silently switched back off.
+    """
+    window = STATUS_WINDOWS.get(instance._meta.label)
+    if window is None:
+        return
+    at = at or now()
+    end = getattr(instance, window.end_field)
+    if instance.pk and instance.status in live_statuses(window) and end and end <= at:
+        stored_status = type(instance).objects.filter(
+            pk=instance.pk).values_list('status', flat=True).first()
+        if stored_status == window.inactive:
+            raise ValidationError(
+                "The end date has passed, please change it to activate again")
+    instance.status = window_status(
+        window, instance.status,
+        getattr(instance, window.start_field), end, at)
+
+
+def schedule_status_changes(instance, at=None):
+    """Replaces the upcoming transitions of a saved object."""
+    label = instance._meta.label
+    window = STATUS_WINDOWS.get(label)
+    if window is None:
+        return
+    unschedule_status_changes(instance)
+    ScheduledStatusChange.objects.bulk_create([
+        ScheduledStatusChange(
+            model=label, object_id=instance.pk, fire_at=fire_at,
+            from_statuses=from_statuses, to_status=to_status)
+        for fire_at, from_statuses, to_status in window_transitions(
+            window,
+            getattr(instance, window.start_field),
+            getattr(instance, window.end_field),
+            at or now())
+    ])
+
+
+def unschedule_status_changes(instance):
+    ScheduledStatusChange.objects.filter(
+        model=instance._meta.label, object_id=instance.pk).delete()
+
+
+def refresh_home_page_links(label, object_ids):
+    if label in HOME_PAGE_LINKS and object_ids:
+        mark_home_page_items_changed(HomePageItems.objects.filter(**{
+            HOME_PAGE_LINKS[label]: object_ids
+        }).values_list('id', flat=True))
+
+
+def fire_due_status_changes(at=None, batch_size=SCHEDULER_BATCH_SIZE):
+    """
+    Pops the due transitions off the fire_at index, earliest first, and
+    applies them with one UPDATE per model and target status. Rows whose
+    status was changed by hand since are left alone. Returns the number
+    of transitions fired.
+    """
+    at = at or now()
+    with transaction.atomic():
+        changes = list(ScheduledStatusChange.objects.select_for_update(
+            skip_locked=True).filter(fire_at__lte=at)[:batch_size])
+
+        groups = OrderedDict()
+        for change in changes:
+            groups.setdefault(
+                (change.model, tuple(change.from_statuses), change.to_status),
+                []).append(change.object_id)
+
+        for (label, from_statuses, to_status), object_ids in groups.items():
+            apps.get_model(label).objects.filter(
+                pk__in=object_ids, status__in=from_statuses
+            ).update(status=to_status)
+            refresh_home_page_links(label, object_ids)
+
+        ScheduledStatusChange.objects.filter(
+            pk__in=[change.id for change in changes]).delete()
+    return len(changes)
+
+
+def next_status_change_at():
+    return ScheduledStatusChange.objects.aggregate(
+        next_at=Min('fire_at')).get('next_at')
+
+
+@transaction.atomic
+def rebuild_status_schedule(at=None):
+    """
+    Brings every status in line with its window using bulk updates and
+    rebuilds the table of upcoming transitions from the date columns.
+    """
+    at = at or now()
+    ScheduledStatusChange.objects.all().delete()
+    for label, window in STATUS_WINDOWS.items():
+        model = apps.get_model(label)
+        start, end = window.start_field, window.end_field
+        live = model.objects.filter(status__in=live_statuses(window))
+
+        ended = list(live.filter(**{end + "__lte": at}).values_list('id', flat=True))
+        live.filter(pk__in=ended).update(status=window.inactive)
+        changed = ended
+        if window.scheduled:
+            waiting = live.filter(status=window.active, **{start + "__gt": at})
+            changed += list(waiting.values_list('id', flat=True))
+            waiting.update(status=window.scheduled)
+            started = live.filter(status=window.scheduled).filter(
+                Q(**{start + "__isnull": True}) | Q(**{start + "__lte": at}))
+            changed += list(started.values_list('id', flat=True))
+            started.update(status=window.active)
+        refresh_home_page_links(label, changed)
+
+        changes = []
+        for object_id, start_at, end_at in live.values_list(
+                'id', start, end).iterator():
+            changes += [
+                ScheduledStatusChange(
+                    model=label, object_id=object_id, fire_at=fire_at,
+                    from_statuses=from_statuses, to_status=to_status)
+                for fire_at, from_statuses, to_status in window_transitions(
+                    window, start_at, end_at, at)
+            ]
+        ScheduledStatusChange.objects.bulk_create(
+            changes, batch_size=SCHEDULER_BATCH_SIZE)
@@ -4,7 +4,6 @@ import sys
 from django.conf import settings
 from django.contrib.humanize.templatetags import humanize
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.images import get_image_dimensions
 from django.core.validators import FileExtensionValidator
 from django.db.models import F, Sum, Count, Q
 from django.shortcuts import get_object_or_404
@@ -17,6 +16,7 @@ from app.ecommnotification.serializers import CollectionSerializer
 from app.order.serializers import SellerListByCategorySerializer
 from app.product.serializers import ProductMinNewSerializer, CategorySuggestionSerializer
 from app.store.models import Banner, TopDealsBanner
+from app.utilities.images import get_image_dimensions
 from app.utilities.helpers import convert_date_time_to_kuwait_string, datetime_from_utc_to_local_new, \
     datetime_from_utc_to_local
 
@@ -0,0 +1,82 @@
+import random
+
+from django.db import transaction
+from django.utils.timezone import now, localdate
+
+from app.store.homepage import rebuild_home_page
+from app.store.models import HomePageItems, HomePageItemValues, HomePageItemLastShuffledAt
+from app.utilities.helpers import bulk_update
+
+SHUFFLE_ORDER_FIELDS = (
+    ("MOB", "order_for_mob", "shuffling_order_for_mob"),
+    ("WEB", "order_for_web", "shuffling_order_for_web"),
+)
+
+
+def daily_seed(day):
+    return int(day.strftime("%Y%m%d"))
+
+
+def seeded_permutation(objs, order_field, seed, scope):
+    """
+    Returns objs shuffled with a generator seeded by (seed, scope).
+    Pinned objs stay at their index in the `order_field` ordering, the
+    others are shuffled into the remaining slots.
+    """
+    objs = sorted(objs, key=lambda obj: (
+        getattr(obj, order_field) is None, getattr(obj, order_field) or 0, obj.id))
+    free = [obj for obj in objs if not obj.pinned]
+    random.Random("%s:%s" % (seed, scope)).shuffle(free)
+    free = iter(free)
+    return [obj if obj.pinned else next(free) for obj in objs]
+
+
+def apply_permutation(objs, order_field, shuffle_field, seed, scope):
+    for position, obj in enumerate(
+            seeded_permutation(objs, order_field, seed, scope), start=1):
+        setattr(obj, shuffle_field, position)
+
+
+def shuffle_home_page(seed=None, day=None):
+    """
+    Shuffles the home page sections and the values inside each section
+    for mobile and web. The same seed over the same rows always gives
+    the same order, so only the seed needs to be kept.
+    """
+    day = day or localdate()
+    if seed is None:
+        seed = daily_seed(day)
+    shuffled_at = now()
+
+    items = list(HomePageItems.objects.all())
+    values_by_item = {}
+    for value in HomePageItemValues.objects.filter(homepageitem__isnull=False):
+        values_by_item.setdefault(value.homepageitem_id, []).append(value)
+
+    for device, order_field, shuffle_field in SHUFFLE_ORDER_FIELDS:
+        device_items = [
+            item for item in items if item.device in [device, "WEBANDMOB"]]
+        apply_permutation(
+            device_items, order_field, shuffle_field, seed, "items:%s" % device)
+        for item in device_items:
+            apply_permutation(
+                values_by_item.get(item.id, []), order_field, shuffle_field,
+                seed, "values:%s:%s" % (device, item.id))
+
+    values = [value for item_values in values_by_item.values()
+              for value in item_values]
+    for obj in items + values:
+        obj.last_shuffled_at = shuffled_at
+
+    fields = ["shuffling_order_for_mob", "shuffling_order_for_web", "last_shuffled_at"]
+    with transaction.atomic():
+        bulk_update(HomePageItems, items, fields, batch_size=len(items) or 1)
+        bulk_update(HomePageItemValues, values, fields, batch_size=len(values) or 1)
+        shuffle = HomePageItemLastShuffledAt.objects.create(
+            created_date=day,
+            created_at=shuffled_at,
+            updated_at=shuffled_at,
+            seed=seed)
+        # update() skips the signals keeping the snapshots fresh
+        transaction.on_commit(rebuild_home_page)
+    return shuffle
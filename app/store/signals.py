@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from app.product.models import ProductCollection, Coupon
+from app.store.cities import invalidate_city_tree
+from app.store.homepage import mark_home_page_items_changed
+from app.store.models import HomePageItems, HomePageItemValues, Banner, TopDealsBanner, Store, City
+from app.store.scheduler import sync_status, schedule_status_changes, unschedule_status_changes
+from app.store.stock import create_low_stock_index
+
+
+@receiver(post_save, sender=HomePageItems)
+@receiver(post_delete, sender=HomePageItems)
+def home_page_item_changed(sender, instance=None, **kwargs):
+    mark_home_page_items_changed([instance.id])
+
+
+@receiver(post_save, sender=HomePageItemValues)
+@receiver(post_delete, sender=HomePageItemValues)
+def home_page_item_value_changed(sender, instance=None, **kwargs):
+    mark_home_page_items_changed([instance.homepageitem_id])
+
+
+@receiver(post_save, sender=Banner)
+def home_page_banner_changed(sender, instance=None, **kwargs):
+    mark_home_page_items_changed(
+        instance.homepageitems.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=ProductCollection)
+def home_page_collection_changed(sender, instance=None, **kwargs):
+    mark_home_page_items_changed(
+        instance.homepageitems.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Store)
+@receiver(pre_save, sender=Banner)
+@receiver(pre_save, sender=TopDealsBanner)
+@receiver(pre_save, sender=ProductCollection)
+@receiver(pre_save, sender=Coupon)
+def status_window_saving(sender, instance=None, **kwargs):
+    sync_status(instance)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=TopDealsBanner)
+@receiver(post_save, sender=ProductCollection)
+@receiver(post_save, sender=Coupon)
+def status_window_saved(sender, instance=None, **kwargs):
+    schedule_status_changes(instance)
+
+
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Banner)
+@receiver(post_delete, sender=TopDealsBanner)
+@receiver(post_delete, sender=ProductCollection)
+@receiver(post_delete, sender=Coupon)
+def status_window_deleted(sender, instance=None, **kwargs):
+    unschedule_status_changes(instance)
+
+
+@receiver(post_migrate)
+def store_migrated(sender, **kwargs):
+    if sender.name == "app.store":
+        create_low_stock_index()
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def city_changed(sender, instance=None, **kwargs):
+    transaction.on_commit(invalidate_city_tree)
@@ -0,0 +1,186 @@
+import codecs
+import csv
+
+from django.db import transaction, connection
+from django.db.models import Case, When, Value, F, IntegerField, OuterRef, Subquery, Prefetch
+
+from app.authentication.scope import get_seller_scope
+from app.product.models import ProductVariantValue
+from app.store.models import InventoryProduct, Inventory
+
+STOCK_UPDATE_CHUNK_SIZE = 500
+STOCK_UPDATE_MODES = ("set", "add")
+LOW_STOCK_THRESHOLD = 5
+LOW_STOCK_INDEX = "store_inventoryproduct_low_stock"
+
+
+def editable_inventories(user):
+    if user.is_super_admin:
+        return Inventory.objects.all()
+    return get_seller_scope(user).filter(Inventory.objects.all())
+
+
+def editable_inventory_products(user):
+    if user.is_super_admin:
+        return InventoryProduct.objects.all()
+    return get_seller_scope(user).filter(
+        InventoryProduct.objects.all(), "inventory__store")
+
+
+def parse_stock_csv(file):
+    """Reads rows of inventory_product_id or sku or barCode, qty and mode."""
+    reader = csv.DictReader(codecs.iterdecode(file, "utf-8-sig"))
+    return [{key.strip(): (value or "").strip()
+             for key, value in row.items() if key}
+            for row in reader]
+
+
+def clean_stock_row(row):
+    mode = (row.get("mode") or "set").lower()
+    if mode not in STOCK_UPDATE_MODES:
+        return None, "Mode should be set or add"
+    try:
+        qty = int(row.get("qty"))
+    except (TypeError, ValueError):
+        return None, "Quantity should be a number"
+    if mode == "set" and qty < 0:
+        return None, "Quantity can not be negative"
+    return (mode, qty), None
+
+
+def resolve_stock_rows(rows, qs):
+    """
+    Maps every row to an inventory product id with one query per kind of
+    key. A sku or barcode stocked in more than one inventory is an error
+    unless the rows are limited to an inventory.
+    """
+    keys = {"id": set(), "sku": set(), "barCode": set()}
+    for row in rows:
+        if row.get("inventory_product_id"):
+            keys["id"].add(str(row["inventory_product_id"]))
+        elif row.get("sku"):
+            keys["sku"].add(str(row["sku"]))
+        elif row.get("barCode"):
+            keys["barCode"].add(str(row["barCode"]))
+
+    lookups = {"id": {}, "sku": {}, "barCode": {}}
+    valid_ids = [value for value in keys["id"] if value.isdigit()]
+    for inv_prod_id in qs.filter(pk__in=valid_ids).values_list('id', flat=True):
+        lookups["id"][str(inv_prod_id)] = [inv_prod_id]
+    for field in ["sku", "barCode"]:
+        if keys[field]:
+            for inv_prod_id, value in qs.filter(**{
+                "product__%s__in" % field: keys[field]
+            }).values_list('id', "product__" + field):
+                lookups[field].setdefault(value, []).append(inv_prod_id)
+
+    resolved = []
+    for row in rows:
+        for key, field in [("inventory_product_id", "id"),
+                           ("sku", "sku"), ("barCode", "barCode")]:
+            if row.get(key):
+                matches = lookups[field].get(str(row[key]), [])
+                break
+        else:
+            resolved.append((None, "Inventory product id, sku or barCode is required"))
+            continue
+        if not matches:
+            resolved.append((None, "Inventory product not found"))
+        elif len(matches) > 1:
+            resolved.append((None, "Found in more than one inventory, please select an inventory"))
+        else:
+            resolved.append((matches[0], None))
+    return resolved
+
+
+def stock_update_expression(changes):
+    """
+    One CASE over the chunk: a set row writes its value (plus later adds),
+    add only rows are applied on top of the current quantity.
+    """
+    whens = []
+    for inv_prod_id, (base, delta) in changes.items():
+        if base is None:
+            whens.append(When(pk=inv_prod_id, then=F('quantity') + Value(delta)))
+        else:
+            whens.append(When(pk=inv_prod_id, then=Value(base + delta)))
+    return Case(*whens, default=F('quantity'), output_field=IntegerField())
+
+
+@transaction.atomic
+def apply_stock_rows(rows, qs, chunk_size=STOCK_UPDATE_CHUNK_SIZE):
+    """
+    Applies (id or sku or barCode, qty, mode) rows to the inventory
+    products in `qs`, one UPDATE per chunk, and returns a result per row.
+    Rows hitting the same product are applied in order.
+    """
+    results = []
+    changes = {}
+    for index, (row, (inv_prod_id, error)) in enumerate(
+            zip(rows, resolve_stock_rows(rows, qs)), start=1):
+        cleaned = None
+        if error is None:
+            cleaned, error = clean_stock_row(row)
+        results.append({"row": index, "inventory_product_id": inv_prod_id,
+                        "status": "error" if error else "updated",
+                        "error": error})
+        if error:
+            continue
+        mode, qty = cleaned
+        base, delta = changes.get(inv_prod_id, (None, 0))
+        if mode == "set":
+            changes[inv_prod_id] = (qty, 0)
+        else:
+            changes[inv_prod_id] = (base, delta + qty)
+
+    inv_prod_ids = list(changes)
+    for start in range(0, len(inv_prod_ids), chunk_size):
+        chunk = {inv_prod_id: changes[inv_prod_id]
+                 for inv_prod_id in inv_prod_ids[start:start + chunk_size]}
+        InventoryProduct.objects.filter(pk__in=chunk.keys()).update(
+            quantity=stock_update_expression(chunk))
+
+    quantities = dict(InventoryProduct.objects.filter(
+        pk__in=inv_prod_ids).values_list('id', 'quantity'))
+    for result in results:
+        if result["status"] == "updated":
+            result["quantity"] = quantities.get(result["inventory_product_id"])
+    return results
+
+
+def with_inventory_list_data(qs):
+    """
+    Joins and prefetches everything InventoryListSerializer reads, and
+    annotates the quantity of the latest row of the same product in the
+    same inventory, so a page is served with a fixed number of queries.
+    """
+    latest = InventoryProduct.objects.filter(
+        product=OuterRef('product'), inventory=OuterRef('inventory')
+    ).order_by('-id')
+    return qs.annotate(
+        latest_quantity=Subquery(
+            latest.values('quantity')[:1], output_field=IntegerField())
+    ).select_related(
+        'product__brand', 'product__store'
+    ).prefetch_related(
+        'product__medias',
+        Prefetch('product__productVariantValue',
+                 queryset=ProductVariantValue.objects.select_related(
+                     'variant_value__variant')),
+    )
+
+
+def create_low_stock_index():
+    """
+    Partial index over the rows at or under the low stock threshold, used
+    by the out of stock and low stock filters. Django 2.1 can not declare
+    partial indexes on the model, so it is created after migrate.
+    """
+    table = InventoryProduct._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS {index} ON {table} (quantity, inventory_id) "
+            "WHERE quantity <= {threshold}".format(
+                index=connection.ops.quote_name(LOW_STOCK_INDEX),
+                table=connection.ops.quote_name(table),
+                threshold=int(LOW_STOCK_THRESHOLD)))
@@ -16,6 +16,10 @@ urlpatterns = [
 
     path("inventory-list/", rest.InventoryList.as_view()),
     path("inventories-set-add-quantity/", rest.InventoryQtyUpdate.as_view()),
+    path("inventories-bulk-stock/", rest.BulkStockUpdate.as_view()),
+
+    path("home-page/", rest.HomePage.as_view()),
+    path("banner-click/", rest.BannerClick.as_view()),
 
     path("", include(router.urls)),
 ]
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+
+from app.store.models import CacheVersion
+
+# Seconds a process trusts the version it last read
+VERSION_CHECK_INTERVAL = 2
+
+lock = threading.Lock()
+checked = {}
+
+
+def current_version(key):
+    """
+    The database version of `key`, 0 before its first bump, read at most
+    once per VERSION_CHECK_INTERVAL by each process.
+    """
+    interval = getattr(settings, "VERSION_CHECK_INTERVAL", VERSION_CHECK_INTERVAL)
+    with lock:
+        entry = checked.get(key)
+    if entry is not None and time.monotonic() - entry[0] < interval:
+        return entry[1]
+    version = CacheVersion.objects.filter(key=key).values_list('version', flat=True).first() or 0
+    with lock:
+        checked[key] = (time.monotonic(), version)
+    return version
+
+
+def bump_version(key):
+    """Moves `key` to a new version, seen at once by this process."""
+    if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+        CacheVersion.objects.get_or_create(key=key)
+        CacheVersion.objects.filter(key=key).update(version=F('version') + 1)
+    with lock:
+        checked.pop(key, None)
@@ -1,5 +1,7 @@
+from django.core.exceptions import ValidationError
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.views import exception_handler as rest_exception_handler
 
 
 def block_response():
@@ -23,3 +25,13 @@ def update_response(serializer):
 
 def validation_error(error):
     return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def exception_handler(exc, context):
+    """
+    DRF's handler, also answering the ValidationErrors raised by models
+    and their signals with a 400.
+    """
+    if isinstance(exc, ValidationError):
+        return validation_error(" ".join(exc.messages))
+    return rest_exception_handler(exc, context)
@@ -0,0 +1,110 @@
+import heapq
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pure python fallback, for offline and test runs
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def is_located(point):
+    return point is not None and None not in point and tuple(point) != (0.0, 0.0)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in km between two points given in degrees."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def as_radians(points):
+    """(lat, lon) degrees to an (n, 2) radians array, nan where unknown."""
+    located = np.array([
+        point if is_located(point) else (np.nan, np.nan) for point in points
+    ], dtype=float).reshape(-1, 2)
+    return np.radians(located)
+
+
+def distance_matrix(origins, destinations):
+    """
+    Distances in km from every origin to every destination, as an N x M
+    array, or a list of lists when numpy is not installed. Pairs with an
+    unknown point, (0, 0) or None, are nan.
+    """
+    if np is None:
+        return [[haversine(origin[0], origin[1], destination[0], destination[1])
+                 if is_located(origin) and is_located(destination) else float("nan")
+                 for destination in destinations]
+                for origin in origins]
+
+    origins = as_radians(origins)
+    destinations = as_radians(destinations)
+    lat1 = origins[:, 0][:, np.newaxis]
+    lon1 = origins[:, 1][:, np.newaxis]
+    lat2 = destinations[:, 0][np.newaxis, :]
+    lon2 = destinations[:, 1][np.newaxis, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def k_nearest(origins, destinations, k=1, max_km=None):
+    """
+    For every origin, the indexes and distances of its k nearest
+    destinations, nearest first: [[(index, km), ...], ...].
+    """
+    if not origins:
+        return []
+    if not destinations:
+        return [[] for origin in origins]
+
+    matrix = distance_matrix(origins, destinations)
+    nearest = []
+    if np is None:
+        for row in matrix:
+            candidates = [(km, index) for index, km in enumerate(row)
+                          if not math.isnan(km) and (max_km is None or km <= max_km)]
+            nearest.append([(index, km) for km, index in heapq.nsmallest(k, candidates)])
+        return nearest
+
+    matrix = np.where(np.isnan(matrix), np.inf, matrix)
+    if max_km is not None:
+        matrix = np.where(matrix > max_km, np.inf, matrix)
+    k = max(1, min(k, matrix.shape[1]))
+    candidates = np.argpartition(matrix, k - 1, axis=1)[:, :k]
+    for row, indexes in zip(matrix, candidates):
+        indexes = indexes[np.argsort(row[indexes], kind="stable")]
+        nearest.append([(int(index), float(row[index]))
+                        for index in indexes if np.isfinite(row[index])])
+    return nearest
+
+
+def nearest_pickup_stores(addresses, k=1, max_km=None):
+    """
+    The k nearest pickup sellers (NCONP) of each address, computed in one
+    call: {address id: [(store, km), ...]}.
+    """
+    from app.store.models import Address
+
+    pickup_addresses = list(Address.objects.filter(
+        seller__type='NCONP', seller__status='AC',
+        lat__isnull=False, lon__isnull=False
+    ).select_related('seller').order_by('seller_id', '-id'))
+    # A seller is located by its latest address
+    store_points = {}
+    for address in pickup_addresses:
+        store_points.setdefault(address.seller, (address.lat, address.lon))
+    stores = list(store_points)
+
+    addresses = list(addresses)
+    nearest = k_nearest(
+        [(address.lat, address.lon) for address in addresses],
+        [store_points[store] for store in stores], k=k, max_km=max_km)
+    return {address.id: [(stores[index], km) for index, km in matches]
+            for address, matches in zip(addresses, nearest)}
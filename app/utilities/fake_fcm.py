@@ -0,0 +1,75 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class FakeFCMHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        self.server.requests.append(payload)
+
+        results = []
+        for registration_id in payload.get("registration_ids", []):
+            if registration_id in self.server.invalid_tokens:
+                results.append({"error": "NotRegistered"})
+            elif registration_id in self.server.unavailable_tokens:
+                results.append({"error": "Unavailable"})
+            else:
+                results.append({"message_id": "0:%s" % registration_id})
+
+        body = json.dumps({
+            "success": len([r for r in results if "error" not in r]),
+            "failure": len([r for r in results if "error" in r]),
+            "results": results,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeFCMServer:
+    """
+    Local stand in for the FCM legacy send endpoint. Point FCM_SEND_URL
+    at `url` and every multicast request is recorded in `requests`.
+
+        with FakeFCMServer(invalid_tokens=["dead-token"]) as fcm:
+            fan_out_push(devices, "title", "body")
+            fcm.requests
+    """
+
+    def __init__(self, invalid_tokens=None, unavailable_tokens=None, port=0):
+        self.server = HTTPServer(("127.0.0.1", port), FakeFCMHandler)
+        self.server.requests = []
+        self.server.invalid_tokens = set(invalid_tokens or [])
+        self.server.unavailable_tokens = set(unavailable_tokens or [])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s/fcm/send" % self.server.server_port
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,122 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from django.conf import settings
+from fcm_django.models import FCMDevice
+
+FCM_SEND_URL = "https://fcm.googleapis.com/fcm/send"
+FCM_MULTICAST_LIMIT = 1000
+FCM_BATCH_SIZE = 500
+FCM_WORKERS = 8
+FCM_TIMEOUT = 10
+
+# Errors meaning the token will never work again
+FCM_INVALID_TOKEN_ERRORS = (
+    "NotRegistered", "InvalidRegistration", "MismatchSenderId",
+)
+
+thread_local = threading.local()
+
+
+def get_session():
+    if not hasattr(thread_local, "session"):
+        thread_local.session = requests.Session()
+    return thread_local.session
+
+
+def get_fcm_send_url():
+    return getattr(settings, "FCM_SEND_URL", FCM_SEND_URL)
+
+
+def get_fcm_server_key():
+    return getattr(settings, "FCM_DJANGO_SETTINGS", {}).get("FCM_SERVER_KEY", "")
+
+
+def iter_device_batches(devices, batch_size=FCM_BATCH_SIZE):
+    """
+    Pages through the active devices by id, so every page is an index
+    range scan however far into the table it is.
+    """
+    batch_size = min(batch_size, FCM_MULTICAST_LIMIT)
+    last_id = 0
+    while True:
+        batch = list(devices.filter(
+            active=True, id__gt=last_id
+        ).order_by('id').values_list('id', 'registration_id')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        yield [registration_id for device_id, registration_id in batch]
+
+
+def send_multicast(registration_ids, title, body, data=None, session=None):
+    payload = {
+        "registration_ids": registration_ids,
+        "notification": {"title": title, "body": body, "sound": "default"},
+        "data": data or {},
+    }
+    response = (session or get_session()).post(
+        get_fcm_send_url(), data=json.dumps(payload),
+        headers={
+            "Authorization": "key=%s" % get_fcm_server_key(),
+            "Content-Type": "application/json",
+        },
+        timeout=FCM_TIMEOUT)
+    response.raise_for_status()
+
+    results = response.json().get("results", [])
+    success = 0
+    invalid_tokens = []
+    for registration_id, result in zip(registration_ids, results):
+        if "error" not in result:
+            success += 1
+        elif result["error"] in FCM_INVALID_TOKEN_ERRORS:
+            invalid_tokens.append(registration_id)
+    return success, invalid_tokens
+
+
+def deactivate_tokens(registration_ids):
+    if not registration_ids:
+        return 0
+    return FCMDevice.objects.filter(
+        registration_id__in=registration_ids, active=True
+    ).update(active=False)
+
+
+def fan_out_push(devices, title, body, data=None,
+                 batch_size=FCM_BATCH_SIZE, workers=FCM_WORKERS):
+    """
+    Sends one push to every active device in the queryset using
+    multicast requests, at most `workers` of them in flight at a time.
+    Tokens FCM reports as dead are deactivated in bulk.
+    """
+    stats = {"batches": 0, "sent": 0, "failed": 0,
+             "deactivated": 0, "errors": 0}
+
+    def collect(futures):
+        for future in futures:
+            tokens = pending.pop(future)
+            try:
+                success, invalid_tokens = future.result()
+            except Exception:
+                stats["errors"] += 1
+                stats["failed"] += len(tokens)
+                continue
+            stats["sent"] += success
+            stats["failed"] += len(tokens) - success
+            stats["deactivated"] += deactivate_tokens(invalid_tokens)
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for tokens in iter_device_batches(devices, batch_size):
+            if len(pending) >= workers:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(
+                send_multicast, tokens, title, body, data)
+            pending[future] = tokens
+            stats["batches"] += 1
+        collect(list(pending))
+    return stats
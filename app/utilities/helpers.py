@@ -462,23 +462,8 @@ def getDateRangeFromWeek(p_year,p_week):
 from math import sin, cos, sqrt, atan2, radians
 
 def radial_distance(lat1,lon1,lat2,lon2):
-    # approximate radius of earth in km
-    R = 6373.0
-
-    radius = 6371  # km
-
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) * math.sin(dlat / 2) +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(dlon / 2) * math.sin(dlon / 2))
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    d = radius * c
-    print(a)
-    print("Result:", d)
-    print("Should be:", 278.546, "km")
-
-    return d
+    from app.utilities.distance import haversine
+    return haversine(lat1, lon1, lat2, lon2)
 
 
 def duration_between_datetime(date1, date2):
@@ -569,6 +554,30 @@ def list_to_queryset(model, data):
     return model.objects.filter(pk__in=pk_list)
 
 
+def bulk_update(model, objs, fields, batch_size=500):
+    """
+    Writes `fields` of the given instances with one UPDATE ... CASE
+    statement per batch, like QuerySet.bulk_update of newer Django.
+    """
+    from django.db.models import Case, When, Value
+
+    objs = list(objs)
+    updated = 0
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        updates = {}
+        for field_name in fields:
+            field = model._meta.get_field(field_name)
+            updates[field.attname] = Case(
+                *[When(pk=obj.pk, then=Value(
+                    getattr(obj, field.attname), output_field=field))
+                  for obj in batch],
+                output_field=field)
+        updated += model.objects.filter(
+            pk__in=[obj.pk for obj in batch]).update(**updates)
+    return updated
+
+
 def calculateAge(birthDate):
     days_in_year = 365.2425
     age = int((date.today() - birthDate).days / days_in_year)
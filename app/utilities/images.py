@@ -0,0 +1,119 @@
+import struct
+
+from django.core.files.images import get_image_dimensions as decode_image_dimensions
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start of frame markers, the ones carrying the image size
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+HEADER_SIZE = 32
+
+
+def read_exact(file, size):
+    data = file.read(size)
+    if not data or len(data) < size:
+        raise ValueError("Truncated image header")
+    return data
+
+
+def probe_png(header):
+    if header[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", header[16:24])
+    return "PNG", width, height
+
+
+def probe_gif(header):
+    width, height = struct.unpack("<HH", header[6:10])
+    return "GIF", width, height
+
+
+def probe_webp(header):
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        if header[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", header[26:30])
+        return "WEBP", width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        if header[20:21] != b"\x2f":
+            return None
+        bits = struct.unpack("<I", header[21:25])[0]
+        return "WEBP", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return "WEBP", width, height
+    return None
+
+
+def probe_jpeg(file):
+    """Walks the JPEG segments, skipping their bodies, up to the frame header."""
+    file.seek(2)
+    while True:
+        byte = read_exact(file, 1)
+        if byte != b"\xff":
+            continue
+        marker = read_exact(file, 1)[0]
+        while marker == 0xFF:
+            marker = read_exact(file, 1)[0]
+        if marker in JPEG_STANDALONE_MARKERS or marker == 0x00:
+            continue
+        if marker == 0xD9:
+            return None
+        length = struct.unpack(">H", read_exact(file, 2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">xHH", read_exact(file, 5))
+            return "JPEG", width, height
+        file.seek(length - 2, 1)
+
+
+def read_image_header(file):
+    header = file.read(HEADER_SIZE)
+    if header.startswith(PNG_SIGNATURE):
+        return probe_png(header)
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return probe_gif(header)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return probe_webp(header)
+    if header[:2] == b"\xff\xd8":
+        return probe_jpeg(file)
+    return None
+
+
+def probe_image(file):
+    """
+    Returns (format, width, height) of an uploaded image reading only its
+    header bytes, or None when the format is not recognised. The result
+    is kept on the file object, so validating the same upload again is free.
+    """
+    if hasattr(file, "_image_probe"):
+        return file._image_probe
+
+    position = file.tell()
+    try:
+        file.seek(0)
+        result = read_image_header(file)
+    except (ValueError, struct.error):
+        result = None
+    finally:
+        file.seek(position)
+
+    try:
+        file._image_probe = result
+    except AttributeError:
+        pass
+    return result
+
+
+def get_image_dimensions(file):
+    """
+    Drop-in for django's get_image_dimensions. PNG, JPEG, GIF and WebP are
+    sized from their headers, anything else is decoded as before.
+    """
+    if not hasattr(file, "read"):
+        return decode_image_dimensions(file)
+    result = probe_image(file)
+    if result is None:
+        return decode_image_dimensions(file)
+    return result[1], result[2]
@@ -0,0 +1,30 @@
+from django.db import transaction, connection
+
+
+def on_commit_once(key, ids, callback):
+    """
+    Runs callback(ids) once the current transaction commits, with the ids
+    of every call made for `key` at the same savepoint, so a request
+    saving many rows does the work once. Calls made in a savepoint get
+    their own callback, dropped with the savepoint if it rolls back.
+    Outside of a transaction the callback runs right away.
+    """
+    ids = set([object_id for object_id in ids if object_id])
+    if not ids:
+        return
+    if not connection.in_atomic_block:
+        callback(ids)
+        return
+
+    savepoint_ids = set(connection.savepoint_ids)
+    for callback_savepoint_ids, func in connection.run_on_commit:
+        if getattr(func, "on_commit_key", None) == key \
+                and callback_savepoint_ids == savepoint_ids:
+            func.pending_ids.update(ids)
+            return
+
+    def flush():
+        callback(flush.pending_ids)
+    flush.on_commit_key = key
+    flush.pending_ids = ids
+    transaction.on_commit(flush)
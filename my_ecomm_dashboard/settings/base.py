@@ -140,4 +140,19 @@ STATIC_URL = '/static/'
 AUTH_USER_MODEL = 'authentication.Member'
 AUTHENTICATION_BACKENDS = [
     'app.authentication.backends.EmailOrUsernameModelBackend',
-]
\ No newline at end of file
+]
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'app.authentication.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ),
+    'EXCEPTION_HANDLER': 'app.utilities.api.exception_handler',
+}
+
+# Cache alias shared by all processes for authenticated tokens, None keeps
+# them in each process only
+TOKEN_AUTH_CACHE = None
+TOKEN_AUTH_LOCAL_TTL = 15
+TOKEN_AUTH_SHARED_TTL = 120